@@ -0,0 +1,216 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+# usage: python -m benchmarks.bench_controller_load --sessions 40 --profile mixed --duration 10
+# 无界面运行MainController：本脚本扮演前端，通过管道登录stand-in ssh服务并播放输出脚本，
+# 统计每个session的端到端延迟（输出中的时间戳 -> 前端收到画面帧）、总吞吐和controller进程CPU；
+# 另有几个空闲session在负载期间持续输入，统计按键回显延迟（发出输入 -> 前端收到含回显的画面帧）
+
+import argparse
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from typing import Optional, List
+
+from src.common.common_definition import RESPONSE_LOGIN_SUCCESS
+from src.common.msg_codec import send_msg, recv_msg
+from src.common.msg_code import LOGIN_CODE, LOGIN_RSP_CODE, SESSION_VIEW_CONTENT_CODE, USER_COMMAND_CODE
+from src.controller.main_controller import MainController
+from tests.model.sync_ssh.ssh_stand_in_server import start_server_process, PROFILES, PROFILE_DONE
+
+PAGE_LINE_COUNT = 40
+TIME_STAMP_PATTERN = re.compile(r'ts=(\d+\.\d+)')
+PROFILE_DONE_PATTERN = re.compile(PROFILE_DONE + r' (\d+)')
+ECHO_INTERVAL_SECS = 0.05
+ECHO_TIMEOUT_SECS = 5
+
+
+class FrontCollector(threading.Thread):
+    def __init__(self, conn: Connection):
+        super().__init__(daemon=True)
+        self.conn = conn
+        self.condition = threading.Condition()
+        self.login_session_ids = set()
+        self.latencies = defaultdict(list)  # session_id: [secs]
+        self.done_bytes = {}  # session_id: bytes sent by the server
+        self.frame_count = 0
+        self.pending_echoes = {}  # session_id: (token, send time)
+        self.echo_latencies = defaultdict(list)  # session_id: [secs]
+
+    def run(self):
+        while True:
+            try:
+                msg = recv_msg(self.conn)
+            except (EOFError, OSError):
+                return
+            now = time.time()
+
+            with self.condition:
+                if msg.get('msg_code') == LOGIN_RSP_CODE:
+                    if msg['payload'].get('content', {}).get('result') == RESPONSE_LOGIN_SUCCESS:
+                        self.login_session_ids.add(msg['payload'].get('session_id'))
+                elif msg.get('msg_code') == SESSION_VIEW_CONTENT_CODE:
+                    for frame in msg.get('payload'):
+                        self.handle_frame(frame, now)
+                self.condition.notify_all()
+
+    def handle_frame(self, frame: dict, now: float):
+        self.frame_count += 1
+        session_id = frame.get('session_id')
+        text = '\n'.join(
+            ''.join(segment[-1] for segment in line) for line in frame['view_area']['view_area_content']
+        )
+        # 画面中最新的时间戳即这一帧的数据延迟
+        if stamps := TIME_STAMP_PATTERN.findall(text):
+            self.latencies[session_id].append(now - max(float(x) for x in stamps))
+        if match := PROFILE_DONE_PATTERN.search(text):
+            self.done_bytes[session_id] = int(match.group(1))
+        if (pending_echo := self.pending_echoes.get(session_id)) and pending_echo[0] in text:
+            self.echo_latencies[session_id].append(now - pending_echo[1])
+            del self.pending_echoes[session_id]
+
+    def wait_for(self, predicate, timeout: float) -> bool:
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+
+def type_while_loaded(fr_side: Connection, collector: FrontCollector, session_ids: List[str], stop_event: threading.Event):
+    seq = 0
+    while not stop_event.is_set():
+        for session_id in session_ids:
+            seq += 1
+            token = f'k{seq:05d}'
+            with collector.condition:
+                collector.pending_echoes[session_id] = (token, time.time())
+            send_msg(fr_side, {'msg_code': USER_COMMAND_CODE,
+                               'payload': {'session_id': session_id, 'content': {'command': token + '\r'}}})
+            if not collector.wait_for(lambda: session_id not in collector.pending_echoes, ECHO_TIMEOUT_SECS):
+                with collector.condition:
+                    collector.pending_echoes.pop(session_id, None)
+                    collector.echo_latencies[session_id].append(float(ECHO_TIMEOUT_SECS))
+        stop_event.wait(ECHO_INTERVAL_SECS)
+
+
+def process_cpu_secs(pid: int) -> Optional[float]:
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime、stime为stat的第14、15个字段
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def percentile(sorted_values: List[float], ratio: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def format_latencies(latencies: List[float]) -> str:
+    values = sorted(x * 1000 for x in latencies)
+    return f'p50 {percentile(values, 0.5):.1f}ms, p90 {percentile(values, 0.9):.1f}ms, ' \
+           f'p99 {percentile(values, 0.99):.1f}ms, max {values[-1] if values else 0:.1f}ms ({len(values)} frames)'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sessions', type=int, default=20)
+    arg_parser.add_argument('--sessions-per-host', type=int, default=4)
+    arg_parser.add_argument('--profile', choices=PROFILES + ('mixed',), default='mixed')
+    arg_parser.add_argument('--duration', type=float, default=10)
+    arg_parser.add_argument('--typing-sessions', type=int, default=2, help='idle sessions that type during the load')
+    args = arg_parser.parse_args()
+
+    server_process, connect_params = start_server_process()
+    fr_side, bk_side = Pipe()
+    controller = MainController(bk_side)
+    controller.start()
+    collector = FrontCollector(fr_side)
+    collector.start()
+
+    session_profiles = {}
+    host_count = (args.sessions - 1) // args.sessions_per_host + 1
+    begin = time.perf_counter()
+    for idx in range(args.sessions):
+        session_id = f'load-{idx}'
+        session_profiles[session_id] = PROFILES[idx % len(PROFILES)] if args.profile == 'mixed' else args.profile
+        # 用户名不同即为不同的agent，模拟多台主机
+        login_content = dict(connect_params, username=f'bench-h{idx // args.sessions_per_host}',
+                             page_line_count=PAGE_LINE_COUNT)
+        send_msg(fr_side, {'msg_code': LOGIN_CODE, 'payload': {'session_id': session_id, 'content': login_content}})
+    typing_session_ids = [f'typing-{idx}' for idx in range(args.typing_sessions)]
+    for idx, session_id in enumerate(typing_session_ids):
+        # 与有输出的session共用主机
+        login_content = dict(connect_params, username=f'bench-h{idx % host_count}',
+                             page_line_count=PAGE_LINE_COUNT)
+        send_msg(fr_side, {'msg_code': LOGIN_CODE, 'payload': {'session_id': session_id, 'content': login_content}})
+    login_count = args.sessions + len(typing_session_ids)
+    if not collector.wait_for(lambda: len(collector.login_session_ids) == login_count, timeout=120):
+        raise RuntimeError(f'only {len(collector.login_session_ids)} of {login_count} sessions logged in')
+    print(f'{args.sessions} sessions on {host_count} hosts ready in {time.perf_counter() - begin:.2f}s')
+
+    cpu_begin = process_cpu_secs(controller.pid)
+    begin = time.perf_counter()
+    for session_id, profile in session_profiles.items():
+        command = f'profile {profile} {args.duration}\r'
+        send_msg(fr_side, {'msg_code': USER_COMMAND_CODE,
+                           'payload': {'session_id': session_id, 'content': {'command': command}}})
+    stop_typing = threading.Event()
+    typing_thread = threading.Thread(target=type_while_loaded, daemon=True,
+                                     args=(fr_side, collector, typing_session_ids, stop_typing))
+    typing_thread.start()
+    is_done = collector.wait_for(lambda: len(collector.done_bytes) == args.sessions, timeout=args.duration + 60)
+    elapsed = time.perf_counter() - begin
+    cpu_end = process_cpu_secs(controller.pid)
+    stop_typing.set()
+    typing_thread.join()
+
+    with collector.condition:
+        total_mb = sum(collector.done_bytes.values()) / 1024 / 1024
+        print(f'throughput: {total_mb:.1f}MB in {elapsed:.2f}s = {total_mb / elapsed:.2f}MB/s, '
+              f'{collector.frame_count} frames' + ('' if is_done else
+                                                    f' (only {len(collector.done_bytes)} sessions finished)'))
+        if cpu_begin is not None and cpu_end is not None:
+            print(f'controller cpu: {cpu_end - cpu_begin:.2f}s = {(cpu_end - cpu_begin) / elapsed * 100:.0f}% of one core')
+
+        for profile in sorted(set(session_profiles.values())):
+            session_ids = [x for x, p in session_profiles.items() if p == profile]
+            latencies = [x for session_id in session_ids for x in collector.latencies[session_id]]
+            print(f'{profile:>6} x{len(session_ids)}: {format_latencies(latencies)}')
+            for session_id in session_ids:
+                print(f'    {session_id:>10}: {format_latencies(collector.latencies[session_id])}')
+        if typing_session_ids:
+            echo_latencies = [x for session_id in typing_session_ids for x in collector.echo_latencies[session_id]]
+            print(f'  echo x{len(typing_session_ids)}: {format_latencies(echo_latencies)}')
+            for session_id in typing_session_ids:
+                print(f'    {session_id:>10}: {format_latencies(collector.echo_latencies[session_id])}')
+
+    controller.stop()
+    # controller进程继承了前端管道的另一端，读线程收不到EOF，超时后直接结束
+    controller.join(5)
+    if controller.is_alive():
+        controller.terminate()
+    fr_side.close()
+    server_process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# usage: python -m benchmarks.bench_io_engine --hosts 50 --sessions 2
+
+import argparse
+import queue
+import statistics
+import threading
+import time
+
+from src.common.msg_code import LOGIN_CODE, LOGIN_RSP_CODE, SESSION_STRING_CODE, USER_COMMAND_CODE, \
+    REMOVE_AGENT_CODE, InnerMsgCode
+from src.model.sync_ssh.io_engine.io_engine import IoEngine
+from src.model.sync_ssh.remote_agent.remote_agent import RemoteAgent
+from tests.model.sync_ssh.ssh_stand_in_server import start_server_process, FLOOD_DONE, FLOOD_LINE
+
+
+class SinkCollector(threading.Thread):
+    def __init__(self, sink_queue: queue.Queue):
+        super().__init__(daemon=True)
+        self.sink_queue = sink_queue
+        self.condition = threading.Condition()
+        self.login_count = 0
+        self.done_session_ids = set()
+        self.last_output_time = {}
+
+    def run(self):
+        while True:
+            msg = self.sink_queue.get()
+            now = time.perf_counter()
+            with self.condition:
+                if msg.get('msg_code') == LOGIN_RSP_CODE:
+                    self.login_count += 1
+                elif msg.get('msg_code') == SESSION_STRING_CODE:
+                    for session_msg in msg.get('payload'):
+                        session_id = session_msg.get('session_id')
+                        self.last_output_time[session_id] = now
+                        for inner_msg in session_msg.get('inner_msgs'):
+                            if inner_msg.get('inner_msg_code') == InnerMsgCode.INSERT_PLAIN_STRING_CODE and \
+                                    FLOOD_DONE in inner_msg.get('inner_payload'):
+                                self.done_session_ids.add(session_id)
+                self.condition.notify_all()
+
+    def wait_for(self, predicate, timeout: float = 120) -> bool:
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+
+def send_command(agent: RemoteAgent, session_id: str, command: str):
+    agent.get_recv_queue().put(
+        {'msg_code': USER_COMMAND_CODE, 'payload': {'session_id': session_id, 'content': {'command': command}}}
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--hosts', type=int, default=20)
+    arg_parser.add_argument('--sessions', type=int, default=2, help='sessions per host')
+    arg_parser.add_argument('--flood-lines', type=int, default=5000)
+    arg_parser.add_argument('--echo-rounds', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    server_process, connect_params = start_server_process()
+
+    sink_queue = queue.Queue()
+    collector = SinkCollector(sink_queue)
+    collector.start()
+    io_engine = IoEngine()
+    io_engine.start()
+
+    begin = time.perf_counter()
+    sessions = []  # (agent, session_id)
+    agents = []
+    for host_idx in range(args.hosts):
+        client, result = RemoteAgent.get_client(connect_params)
+        if client is None:
+            raise RuntimeError(result)
+        agent = RemoteAgent(client, sink_queue, io_engine)
+        agent.start()
+        agents.append(agent)
+        for session_idx in range(args.sessions):
+            session_id = f'h{host_idx}-s{session_idx}'
+            sessions.append((agent, session_id))
+            agent.get_recv_queue().put(
+                {'msg_code': LOGIN_CODE, 'payload': {'session_id': session_id, 'content': {'page_line_count': 40}}}
+            )
+    collector.wait_for(lambda: collector.login_count == len(sessions))
+    # 每个paramiko Transport自带一个线程，其余为IoEngine、executor和本脚本的线程
+    print(f'{args.hosts} hosts x {args.sessions} sessions ready in {time.perf_counter() - begin:.2f}s, '
+          f'threads: {threading.active_count()} ({args.hosts} paramiko transports)')
+
+    # 所有session同时输出
+    cpu_begin = time.process_time()
+    begin = time.perf_counter()
+    for agent, session_id in sessions:
+        send_command(agent, session_id, f'flood {args.flood_lines}\r')
+    collector.wait_for(lambda: len(collector.done_session_ids) == len(sessions))
+    elapsed = time.perf_counter() - begin
+    total_mb = len(sessions) * args.flood_lines * len(FLOOD_LINE) / 1024 / 1024
+    print(f'flood: {total_mb:.1f}MB in {elapsed:.2f}s = {total_mb / elapsed:.1f}MB/s, '
+          f'process cpu {time.process_time() - cpu_begin:.2f}s, engine selects {io_engine.select_count}')
+
+    # 一半session持续输出时，另一半session的按键回显延迟
+    busy_sessions = sessions[::2]
+    typing_sessions = sessions[1::2]
+    busy_session_ids = {session_id for _, session_id in busy_sessions}
+    with collector.condition:
+        collector.done_session_ids.clear()
+    for agent, session_id in busy_sessions:
+        send_command(agent, session_id, f'flood {args.flood_lines * 4}\r')
+    time.sleep(0.2)
+
+    latencies = []
+    after_load_count = 0
+    for _ in range(args.echo_rounds):
+        for agent, session_id in typing_sessions:
+            begin = time.perf_counter()
+            send_command(agent, session_id, 'x')
+            collector.wait_for(lambda: collector.last_output_time.get(session_id, 0) > begin, timeout=5)
+            with collector.condition:
+                # 输出已经结束后测得的回显不算负载下的延迟
+                if busy_session_ids <= collector.done_session_ids:
+                    after_load_count += 1
+                    continue
+            latencies.append((collector.last_output_time[session_id] - begin) * 1000)
+    latencies.sort()
+    if latencies:
+        print(f'echo latency under load: median {statistics.median(latencies):.2f}ms, '
+              f'p99 {latencies[max(0, int(len(latencies) * 0.99) - 1)]:.2f}ms, max {latencies[-1]:.2f}ms '
+              f'({len(latencies)} samples, {after_load_count} more after the flood ended)')
+    else:
+        print('echo latency under load: no samples, the flood ended first')
+
+    read_stats = [stats for agent in agents for stats in agent.get_read_stats().values()]
+    wakeup_count = sum(stats['wakeup_count'] for stats in read_stats)
+    print(f'reads: {wakeup_count} wakeups, '
+          f'{sum(stats["recv_call_count"] for stats in read_stats) / wakeup_count:.2f} recv calls/wakeup, '
+          f'{sum(stats["recv_bytes"] for stats in read_stats) / wakeup_count:.0f} bytes/wakeup')
+
+    for agent in agents:
+        agent.get_recv_queue().put({'msg_code': REMOVE_AGENT_CODE, 'payload': {}})
+    for agent in agents:
+        agent.join(10)
+    io_engine.stop()
+    server_process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# usage: python -m benchmarks.bench_llm_turns --url http://localhost:11434 --model qwen3:8b --turns 6
+# 需要本地运行的ollama：在同一个对话中连续提问，每轮屏幕滚动若干行，
+# 统计每一轮的首token时间。在改动前后的版本上分别运行即可比较服务端缓存复用的效果
+
+import argparse
+import queue
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from src.common.common_definition import SIDE_CHAT_ID
+from src.common.msg_code import LLM_ASK_CODE, LLM_ANSWER_CODE, LLM_THREAD_STOP
+from src.controller.llm_client import LlmClient
+
+SCREEN_LINE_COUNT = 40
+
+
+def build_screen(first_line_idx: int) -> str:
+    return '\n'.join(
+        f'[{idx:5d}] INFO  worker-{idx % 8} processed batch {idx} in {idx % 97}ms'
+        for idx in range(first_line_idx, first_line_idx + SCREEN_LINE_COUNT)
+    )
+
+
+def ask_and_wait(query_queue: queue.Queue, response_queue: queue.Queue, model: str, question: str,
+                 screen: str) -> float:
+    begin = time.perf_counter()
+    first_token_secs = None
+    query_queue.put(
+        {
+            'msg_code': LLM_ASK_CODE,
+            'payload': {
+                'session_id': 'bench',
+                'content': {
+                    'chat_session_id': SIDE_CHAT_ID, 'llm_ask': question, 'llm_model_name': model,
+                    'shell_content_text': screen
+                }
+            }
+        }
+    )
+    while True:
+        msg = response_queue.get(timeout=600)
+        if msg.get('msg_code') != LLM_ANSWER_CODE:
+            continue
+        payload = msg['payload']
+        if first_token_secs is None and payload['content']:
+            first_token_secs = time.perf_counter() - begin
+        if payload['is_done']:
+            return first_token_secs or 0.0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--url', default='http://localhost:11434')
+    arg_parser.add_argument('--model', required=True)
+    arg_parser.add_argument('--turns', type=int, default=6)
+    arg_parser.add_argument('--scroll-lines', type=int, default=5, help='new screen lines per turn')
+    args = arg_parser.parse_args()
+
+    query_queue = queue.Queue()
+    response_queue = queue.Queue()
+    with tempfile.TemporaryDirectory() as record_dir, \
+            mock.patch('src.controller.llm_client.BASE_DIR', Path(record_dir)):
+        client = LlmClient(args.url, query_queue, response_queue)
+        client.start()
+
+        first_token_secs_list = []
+        for turn_idx in range(args.turns):
+            screen = build_screen(turn_idx * args.scroll_lines)
+            first_token_secs = ask_and_wait(
+                query_queue, response_queue, args.model, f'第{turn_idx + 1}轮：用一句话概括最后几行日志。', screen
+            )
+            first_token_secs_list.append(first_token_secs)
+            print(f'turn {turn_idx + 1}: first token {first_token_secs * 1000:.0f}ms')
+
+        query_queue.put({'msg_code': LLM_THREAD_STOP, 'payload': {}})
+        client.join(10)
+
+    if len(first_token_secs_list) > 1:
+        print(f'turn 1 first token {first_token_secs_list[0] * 1000:.0f}ms, '
+              f'turn 2+ median {statistics.median(first_token_secs_list[1:]) * 1000:.0f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+# usage: python -m benchmarks.bench_local_pty --mb 50
+# cat 一个大文件：本地pty -> XShell解析 -> SessionDocument -> 定时生成画面帧并编码，不需要网络和ssh服务
+
+import argparse
+import os
+import queue
+import resource
+import tempfile
+import time
+
+from src.common.common_definition import LOCAL_SHELL_HOSTNAME
+from src.common.msg_code import LOGIN_CODE, LOGIN_RSP_CODE, SESSION_STRING_CODE, USER_COMMAND_CODE, \
+    REMOVE_AGENT_CODE, SESSION_VIEW_CONTENT_CODE
+from src.common.msg_codec import encode_msg
+from src.controller.session_document import SessionDocument
+from src.model.sync_ssh.io_engine.io_engine import IoEngine
+from src.model.sync_ssh.remote_agent.remote_agent import RemoteAgent
+
+PAGE_LINE_COUNT = 50
+FRAME_INTERVAL_SECS = 0.016
+DONE_MARKER = 'cat-done'
+
+
+def write_sample_file(path: str, total_mb: int) -> int:
+    line = b'\x1b[01;34mdrwxr-xr-x\x1b[0m  2 user user  4096 Oct 19 12:00 ' + b'x' * 60 + b'\n'
+    chunk = line * 1000
+    with open(path, 'wb') as f:
+        for _ in range(total_mb * 1024 * 1024 // len(chunk) + 1):
+            f.write(chunk)
+    return os.path.getsize(path)
+
+
+def build_frame(session_id: str, document: SessionDocument) -> dict:
+    return {
+        'msg_code': SESSION_VIEW_CONTENT_CODE,
+        'payload': [{
+            'session_id': session_id,
+            'view_area': {'view_area_content': document.view_area_content, 'cursor_pos': document.cursor_pos},
+            'scroll_info': {'total_lines': document.total_lines}
+        }]
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--mb', type=int, default=5, help='size of the file to cat')
+    args = arg_parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    file_size = write_sample_file(path, args.mb)
+
+    sink_queue = queue.Queue()
+    io_engine = IoEngine()
+    io_engine.start()
+    client, result = RemoteAgent.get_client({'hostname': LOCAL_SHELL_HOSTNAME, 'local': True, 'command': ['/bin/sh']})
+    if client is None:
+        raise RuntimeError(result)
+    agent = RemoteAgent(client, sink_queue, io_engine)
+    agent.start()
+
+    session_id = 'local-bench'
+    agent.get_recv_queue().put(
+        {'msg_code': LOGIN_CODE, 'payload': {'session_id': session_id, 'content': {'page_line_count': PAGE_LINE_COUNT}}}
+    )
+    while sink_queue.get(timeout=10).get('msg_code') != LOGIN_RSP_CODE:
+        continue
+
+    document = SessionDocument(PAGE_LINE_COUNT)
+    # 回显中也包含结束标记，拆开写避免误判
+    command = f'stty -echo; cat {path}; echo cat-""done\r'
+    agent.get_recv_queue().put(
+        {'msg_code': USER_COMMAND_CODE, 'payload': {'session_id': session_id, 'content': {'command': command}}}
+    )
+
+    cpu_begin = resource.getrusage(resource.RUSAGE_SELF)
+    begin = time.perf_counter()
+    next_frame_time = begin + FRAME_INTERVAL_SECS
+    frame_count = 0
+    frame_bytes = 0
+    document_secs = 0.0
+    recv_bytes = 0
+    is_done = False
+    while not is_done:
+        try:
+            msg = sink_queue.get(timeout=max(0.0, next_frame_time - time.perf_counter()))
+        except queue.Empty:
+            msg = None
+
+        if msg and msg.get('msg_code') == SESSION_STRING_CODE:
+            for session_msg in msg.get('payload'):
+                inner_msgs = session_msg.get('inner_msgs', [])
+                recv_bytes += sum(len(x['inner_payload']) for x in inner_msgs if isinstance(x['inner_payload'], str))
+                is_done = is_done or any(
+                    isinstance(x['inner_payload'], str) and DONE_MARKER in x['inner_payload'] for x in inner_msgs
+                )
+                document_begin = time.perf_counter()
+                document.handle_msgs(inner_msgs)
+                document_secs += time.perf_counter() - document_begin
+
+        if time.perf_counter() >= next_frame_time or is_done:
+            document_begin = time.perf_counter()
+            frame_bytes += len(encode_msg(build_frame(session_id, document)))
+            document_secs += time.perf_counter() - document_begin
+            frame_count += 1
+            next_frame_time = time.perf_counter() + FRAME_INTERVAL_SECS
+
+    elapsed = time.perf_counter() - begin
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_secs = cpu_end.ru_utime + cpu_end.ru_stime - cpu_begin.ru_utime - cpu_begin.ru_stime
+    total_mb = file_size / 1024 / 1024
+    print(f'cat {total_mb:.1f}MB: {elapsed:.2f}s = {total_mb / elapsed:.1f}MB/s, {recv_bytes / 1024 / 1024:.1f}MB text, '
+          f'process cpu {cpu_secs:.2f}s (document and frames {document_secs:.2f}s), {frame_count} frames ({frame_bytes / frame_count / 1024:.1f}KB/frame), '
+          f'{document.total_lines} lines in document')
+    stats = agent.get_read_stats()[session_id]
+    print(f'reads: {stats["wakeup_count"]} wakeups, {stats["recv_calls_per_wakeup"]:.2f} recv calls/wakeup, '
+          f'{stats["bytes_per_wakeup"]:.0f} bytes/wakeup')
+
+    agent.get_recv_queue().put({'msg_code': REMOVE_AGENT_CODE, 'payload': {}})
+    agent.join(10)
+    io_engine.stop()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# usage: python -m benchmarks.bench_msg_codec
+
+import pickle
+import time
+import uuid
+
+from src.common.msg_code import SESSION_VIEW_CONTENT_CODE, LLM_ANSWER_CODE, SCROLL_WINDOW_CODE, USER_COMMAND_CODE
+from src.common.msg_codec import encode_msg, decode_msg
+from src.controller.session_document import SessionDocument
+from src.model.parser.buffer.session_bytes_buffer import SessionBytesBuffer
+
+PAGE_LINE_COUNT = 50
+
+
+def build_view_frame(session_id: str) -> dict:
+    document = SessionDocument(PAGE_LINE_COUNT)
+    output = b''.join(
+        b'\x1b[01;34mdir_%d\x1b[0m  file_%d.log  \x1b[01;32mbuild_%d.sh\x1b[0m  %s\r\n' % (i, i, i, b'-' * 120)
+        for i in range(PAGE_LINE_COUNT * 4)
+    )
+    document.handle_msgs(list(SessionBytesBuffer().parse(output, b'')))
+    return {
+        'session_id': session_id,
+        'view_area': {
+            'view_area_content': document.view_area_content,
+            'cursor_pos': document.cursor_pos
+        },
+        'scroll_info': {
+            'total_lines': document.total_lines,
+            'visible_lines': PAGE_LINE_COUNT,
+            'first_visible_line': document.total_lines - PAGE_LINE_COUNT + 1,
+            'hide_scrollbar': False
+        }
+    }
+
+
+def as_dict_segments(msg: dict) -> dict:
+    # 旧的片段格式: {'style': ..., 'text': ...}
+    return {
+        'msg_code': msg['msg_code'],
+        'payload': [
+            {
+                **frame,
+                'view_area': {
+                    **frame['view_area'],
+                    'view_area_content': [
+                        [{'style': style, 'text': text} for style, text in line]
+                        for line in frame['view_area']['view_area_content']
+                    ]
+                }
+            }
+            for frame in msg['payload']
+        ]
+    }
+
+
+def bench(name: str, msg: dict, encode, decode, rounds: int):
+    data = encode(msg)
+
+    begin = time.perf_counter()
+    for _ in range(rounds):
+        encode(msg)
+    encode_us = (time.perf_counter() - begin) / rounds * 1e6
+
+    begin = time.perf_counter()
+    for _ in range(rounds):
+        decode(data)
+    decode_us = (time.perf_counter() - begin) / rounds * 1e6
+
+    print(f'{name:<36}{len(data):>10}{encode_us:>12.1f}{decode_us:>12.1f}')
+
+
+def main():
+    session_id = str(uuid.uuid4())
+    view_msg = {
+        'msg_code': SESSION_VIEW_CONTENT_CODE,
+        'payload': [build_view_frame(str(uuid.uuid4())) for _ in range(4)]
+    }
+    small_msgs = {
+        'llm answer token': {
+            'msg_code': LLM_ANSWER_CODE,
+            'payload': {
+                'session_id': session_id, 'chat_session_id': 'side_chat_id', 'is_think': False,
+                'content': 'token', 'is_done': False
+            }
+        },
+        'scroll window': {
+            'msg_code': SCROLL_WINDOW_CODE, 'payload': {'session_id': session_id, 'content': {'move': -3}}
+        },
+        'user command': {
+            'msg_code': USER_COMMAND_CODE, 'payload': {'session_id': session_id, 'content': {'command': 'l'}}
+        },
+    }
+
+    def pickle_dumps(msg):
+        return pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+
+    print(f'{"message":<36}{"bytes":>10}{"encode us":>12}{"decode us":>12}')
+    bench('view x4 pickle (dict segments)', as_dict_segments(view_msg), pickle_dumps, pickle.loads, 500)
+    bench('view x4 pickle (tuple segments)', view_msg, pickle_dumps, pickle.loads, 500)
+    bench('view x4 codec', view_msg, encode_msg, decode_msg, 500)
+    for name, msg in small_msgs.items():
+        bench(f'{name} pickle', msg, pickle_dumps, pickle.loads, 20000)
+        bench(f'{name} codec', msg, encode_msg, decode_msg, 20000)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,17 @@ from pathlib import Path
 INLINE_CHAT_ID = 'inline_chat_id'
 SIDE_CHAT_ID = 'side_chat_id'
 RESPONSE_LOGIN_SUCCESS = 'success'
+RESPONSE_LOGIN_IN_PROGRESS = 'in_progress'
+LOCAL_SHELL_HOSTNAME = 'local'
+
+# 批量命令每台主机的状态，由后端的BatchCommandRunner和界面共用
+BATCH_STATUS_PENDING = 'pending'
+BATCH_STATUS_RUNNING = 'running'
+BATCH_STATUS_DONE = 'done'
+BATCH_STATUS_FAILED = 'failed'
+BATCH_STATUS_TIMEOUT = 'timeout'
+BATCH_STATUS_CANCELLED = 'cancelled'
+BATCH_DEFAULT_MAX_CONCURRENCY = 16
 
 
 def get_os_type():
@@ -32,6 +43,7 @@ VIEW_WIDTH = 210
 SESSION_WIDGET_HEIGHT = 0
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+RECORD_DIR = BASE_DIR / 'recordings'
 
 
 def set_session_widget_height(height: int):
@@ -59,5 +71,29 @@ def get_llm_url():
         return f'http://{llm_server}:{llm_port}'
 
 
+def get_record_sessions_enabled() -> bool:
+    with open(BASE_DIR / 'settings.json', 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+        return bool(settings.get('record_sessions', False))
+
+
+def get_llm_max_concurrency() -> int:
+    with open(BASE_DIR / 'settings.json', 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+        return max(1, int(settings.get('llm_max_concurrency', 4)))
+
+
+def get_llm_context_token_budget() -> int:
+    with open(BASE_DIR / 'settings.json', 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+        return max(1024, int(settings.get('llm_context_token_budget', 8192)))
+
+
+def get_llm_shell_token_budget() -> int:
+    with open(BASE_DIR / 'settings.json', 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+        return max(256, int(settings.get('llm_shell_token_budget', 3072)))
+
+
 FONT_SIZE_RANGE = [8, 9, 10, 11, 12, 13]
 FONT_LIST = ['Courier New', 'Monaco', 'Andale Mono', 'PT Mono', 'Menlo'] if OS_TYPE == 'darwin' else ['Courier New']
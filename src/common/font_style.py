@@ -145,19 +145,33 @@ class FontStyle:
 
         self.__update_style()
 
-    def __update_style(self):
+    def to_dict(self) -> dict:
+        return dict(self.__style_dict)
+
+    @staticmethod
+    def from_dict(style_dict: dict) -> 'FontStyle':
+        font_style = FontStyle()
+        font_style.__style_dict.update(style_dict)
+        font_style.__update_style()
+        return font_style
+
+    @staticmethod
+    def shared_style(style_dict: dict) -> StyleTuple:
         style_tuple = (
-            self.__style_dict.get('bold', False),
-            self.__style_dict.get('italic', False),
-            self.__style_dict.get('opacity', 1.0),
-            self.__style_dict.get('visible', True),
-            self.__style_dict.get('underline', False),
-            self.__style_dict.get('background_color', FontStyle.DEFAULT_BACKGROUND_COLOR),
-            self.__style_dict.get('foreground_color', FontStyle.DEFAULT_FOREGROUND_COLOR)
+            style_dict.get('bold', False),
+            style_dict.get('italic', False),
+            style_dict.get('opacity', 1.0),
+            style_dict.get('visible', True),
+            style_dict.get('underline', False),
+            style_dict.get('background_color', FontStyle.DEFAULT_BACKGROUND_COLOR),
+            style_dict.get('foreground_color', FontStyle.DEFAULT_FOREGROUND_COLOR)
         )
 
         new_style = FontStyle.STYLE_SET.get(style_tuple)
         if not new_style:
-            new_style = StyleTuple(**self.__style_dict)
+            new_style = StyleTuple(*style_tuple)
             FontStyle.STYLE_SET[style_tuple] = new_style
-        self.__style = new_style
+        return new_style
+
+    def __update_style(self):
+        self.__style = FontStyle.shared_style(self.__style_dict)
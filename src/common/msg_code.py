@@ -35,6 +35,12 @@ LLM_LOAD_CHAT_BY_HISTORY_IDX = VIEW_2_MODEL_BEGIN_CODE + 12
 LLM_SERVER_URL_UPDATE_CODE = VIEW_2_MODEL_BEGIN_CODE + 13
 RECONNECT_SHELL_CODE = VIEW_2_MODEL_BEGIN_CODE + 15
 LLM_NEW_CHAT_CODE = VIEW_2_MODEL_BEGIN_CODE + 16
+SESSION_VISIBILITY_CODE = VIEW_2_MODEL_BEGIN_CODE + 17
+WINDOW_VISIBILITY_CODE = VIEW_2_MODEL_BEGIN_CODE + 18
+BROADCAST_GROUP_CODE = VIEW_2_MODEL_BEGIN_CODE + 19
+BATCH_COMMAND_CODE = VIEW_2_MODEL_BEGIN_CODE + 20
+BATCH_CANCEL_CODE = VIEW_2_MODEL_BEGIN_CODE + 21
+LLM_CANCEL_CODE = VIEW_2_MODEL_BEGIN_CODE + 22
 # model 2 view  ========================================================================================================
 MODEL_2_VIEW_BEGIN_CODE = 0x70
 
@@ -48,6 +54,9 @@ LLM_INLINE_MODEL_LIST_CODE = MODEL_2_VIEW_BEGIN_CODE + 6
 LLM_RSP_CHAT_BY_CHAT_ID = MODEL_2_VIEW_BEGIN_CODE + 7
 SESSION_INACTIVE_CODE = MODEL_2_VIEW_BEGIN_CODE + 8
 RECONNECT_SHELL_FAIL_CODE = MODEL_2_VIEW_BEGIN_CODE + 9
+RECONNECT_STATUS_CODE = MODEL_2_VIEW_BEGIN_CODE + 10
+BROADCAST_STATS_CODE = MODEL_2_VIEW_BEGIN_CODE + 11
+BATCH_RESULT_CODE = MODEL_2_VIEW_BEGIN_CODE + 12
 
 # inner msg type =======================================================================================================
 INNER_MSG_BEGIN_CODE = 0x0000
@@ -0,0 +1,365 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pickle
+import struct
+from array import array
+from itertools import accumulate, chain
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, List
+
+from src.common.font_style import StyleTuple
+from src.common.msg_code import SESSION_VIEW_CONTENT_CODE, LLM_ANSWER_CODE, SCROLL_WINDOW_CODE, USER_COMMAND_CODE
+
+# 帧格式: 1字节tag + body
+# tag为高频消息的msg_code时, body为紧凑的struct二进制; 其余低频控制消息使用pickle兜底
+PICKLE_FALLBACK_TAG = 0xFF
+
+_U8 = struct.Struct('<B')
+_U32 = struct.Struct('<I')
+_I32 = struct.Struct('<i')
+_CURSOR = struct.Struct('<II')
+_SCROLL_INFO = struct.Struct('<IIIB')
+_STYLE = struct.Struct('<Bf3s3s')
+
+_MAX_STYLE_COUNT = 0xFFFF
+
+_STYLE_BOLD = 0x01
+_STYLE_ITALIC = 0x02
+_STYLE_VISIBLE = 0x04
+_STYLE_UNDERLINE = 0x08
+_STYLE_NONE = 0x80
+
+_LLM_IS_THINK = 0x01
+_LLM_IS_DONE = 0x02
+_LLM_HAS_CHAT_SESSION_ID = 0x04
+
+_SEGMENT_SEPARATOR = '\x00'
+_TEXT_SEPARATED = 0x00
+_TEXT_LENGTH_PREFIXED = 0x01
+
+_SCROLL_MOVE = 0x01
+_SCROLL_START_LINE_NUM = 0x02
+
+_VIEW_FRAME_KEYS = frozenset(['session_id', 'view_area', 'scroll_info'])
+_VIEW_AREA_KEYS = frozenset(['view_area_content', 'cursor_pos'])
+_SCROLL_INFO_KEYS = frozenset(['total_lines', 'visible_lines', 'first_visible_line', 'hide_scrollbar'])
+_LLM_ANSWER_KEYS = frozenset(['session_id', 'chat_session_id', 'is_think', 'content', 'is_done'])
+_SESSION_CONTENT_KEYS = frozenset(['session_id', 'content'])
+_SCROLL_CONTENT_KEYS = frozenset(['move', 'start_line_num'])
+
+# 解码侧缓存StyleTuple，相同样式在多帧之间复用同一个对象
+_STYLE_CACHE: Dict[bytes, StyleTuple] = {}
+_PACKED_STYLE_CACHE: Dict[StyleTuple, bytes] = {}
+
+
+class MsgCodecError(Exception):
+    pass
+
+
+class _Reader:
+    def __init__(self, data: bytes | memoryview, offset: int = 0):
+        self.data = memoryview(data)
+        self.offset = offset
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def read_bytes(self, size: int) -> memoryview:
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def read_str(self) -> str:
+        size, = self.unpack(_U32)
+        return str(self.read_bytes(size), 'utf-8')
+
+    def read_array(self, typecode: str, count: int) -> array:
+        result = array(typecode)
+        result.frombytes(self.read_bytes(count * result.itemsize))
+        return result
+
+
+def _check_keys(data: dict, allowed_keys: frozenset):
+    # 紧凑格式只覆盖已知字段, 出现未知字段时由调用方退回pickle, 避免静默丢字段
+    if not allowed_keys.issuperset(data):
+        raise MsgCodecError(f'unexpected keys: {set(data) - allowed_keys}')
+
+
+def _pack_str(text: str) -> bytes:
+    encoded = text.encode('utf-8')
+    return _U32.pack(len(encoded)) + encoded
+
+
+def _pack_color(color: str) -> bytes:
+    # '#RRGGBB' -> 3字节
+    if len(color) != 7 or color[0] != '#':
+        raise MsgCodecError(f'unsupported color: {color}')
+    return bytes.fromhex(color[1:])
+
+
+def _pack_style(style: StyleTuple | None) -> bytes:
+    if packed := _PACKED_STYLE_CACHE.get(style):
+        return packed
+
+    if style is None:
+        return _STYLE.pack(_STYLE_NONE, 0.0, b'\x00' * 3, b'\x00' * 3)
+
+    flags = (_STYLE_BOLD if style.bold else 0) \
+        | (_STYLE_ITALIC if style.italic else 0) \
+        | (_STYLE_VISIBLE if style.visible else 0) \
+        | (_STYLE_UNDERLINE if style.underline else 0)
+    packed = _STYLE.pack(
+        flags, style.opacity, _pack_color(style.background_color), _pack_color(style.foreground_color)
+    )
+    # StyleTuple由FontStyle.STYLE_SET全局复用，数量有限，可按对象缓存编码结果
+    _PACKED_STYLE_CACHE[style] = packed
+    return packed
+
+
+def _unpack_style(packed: bytes) -> StyleTuple | None:
+    if style := _STYLE_CACHE.get(packed):
+        return style
+
+    flags, opacity, background_color, foreground_color = _STYLE.unpack(packed)
+    if flags & _STYLE_NONE:
+        return None
+
+    style = StyleTuple(
+        bold=bool(flags & _STYLE_BOLD),
+        italic=bool(flags & _STYLE_ITALIC),
+        opacity=round(opacity, 4),
+        visible=bool(flags & _STYLE_VISIBLE),
+        underline=bool(flags & _STYLE_UNDERLINE),
+        background_color='#' + background_color.hex().upper(),
+        foreground_color='#' + foreground_color.hex().upper()
+    )
+    _STYLE_CACHE[packed] = style
+    return style
+
+
+def _encode_view_content(payload: list) -> bytes:
+    # 整条消息共用一张样式表; 每一帧的文本拼接成一个字符串, 片段长度/样式索引用数组整体打包,
+    # 尽量让逐片段的工作落在C实现的map/zip/array中
+    style_index_map: Dict[StyleTuple | None, int] = {}
+    style_table: List[bytes] = []
+    parts = [_U32.pack(len(payload))]
+
+    for frame in payload:
+        _check_keys(frame, _VIEW_FRAME_KEYS)
+        view_area = frame.get('view_area', {})
+        scroll_info = frame.get('scroll_info', {})
+        _check_keys(view_area, _VIEW_AREA_KEYS)
+        _check_keys(scroll_info, _SCROLL_INFO_KEYS)
+        cursor_pos = view_area.get('cursor_pos')
+        lines = view_area.get('view_area_content', [])
+
+        segments = list(chain.from_iterable(lines))
+        segment_styles, texts = zip(*segments) if segments else ((), ())
+        for style in dict.fromkeys(segment_styles):
+            if style not in style_index_map:
+                style_index_map[style] = len(style_table)
+                style_table.append(_pack_style(style))
+
+        parts.append(_pack_str(frame.get('session_id', '')))
+        parts.append(_U8.pack(1 if cursor_pos else 0))
+        if cursor_pos:
+            parts.append(_CURSOR.pack(*cursor_pos))
+        parts.append(
+            _SCROLL_INFO.pack(
+                scroll_info.get('total_lines', 0),
+                scroll_info.get('visible_lines', 0),
+                scroll_info.get('first_visible_line', 0),
+                1 if scroll_info.get('hide_scrollbar') else 0
+            )
+        )
+        parts.append(_U32.pack(len(lines)))
+        parts.append(array('I', map(len, lines)).tobytes())
+        parts.append(_U32.pack(len(segments)))
+        parts.append(array('H', map(style_index_map.__getitem__, segment_styles)).tobytes())
+
+        # 正常终端文本中不含NUL, 用NUL分隔片段以便解码时一次split完成切分; 否则退回长度数组
+        joined_text = _SEGMENT_SEPARATOR.join(texts)
+        if joined_text.count(_SEGMENT_SEPARATOR) == max(len(texts) - 1, 0):
+            parts.append(_U8.pack(_TEXT_SEPARATED))
+        else:
+            parts.append(_U8.pack(_TEXT_LENGTH_PREFIXED))
+            parts.append(array('I', map(len, texts)).tobytes())
+            joined_text = ''.join(texts)
+        parts.append(_pack_str(joined_text))
+
+    if len(style_table) > _MAX_STYLE_COUNT:
+        raise MsgCodecError('too many styles in one message')
+
+    return _U32.pack(len(style_table)) + b''.join(style_table) + b''.join(parts)
+
+
+def _decode_view_content(reader: _Reader) -> list:
+    style_count, = reader.unpack(_U32)
+    styles = [_unpack_style(bytes(reader.read_bytes(_STYLE.size))) for _ in range(style_count)]
+
+    frame_count, = reader.unpack(_U32)
+    payload = []
+    for _ in range(frame_count):
+        session_id = reader.read_str()
+        has_cursor, = reader.unpack(_U8)
+        cursor_pos = reader.unpack(_CURSOR) if has_cursor else None
+        total_lines, visible_lines, first_visible_line, hide_scrollbar = reader.unpack(_SCROLL_INFO)
+
+        line_count, = reader.unpack(_U32)
+        segment_counts = reader.read_array('I', line_count)
+        segment_count, = reader.unpack(_U32)
+        segment_styles = reader.read_array('H', segment_count)
+        text_layout, = reader.unpack(_U8)
+        if text_layout == _TEXT_SEPARATED:
+            joined_text = reader.read_str()
+            texts = joined_text.split(_SEGMENT_SEPARATOR) if segment_count else []
+        else:
+            text_offsets = list(accumulate(reader.read_array('I', segment_count), initial=0))
+            joined_text = reader.read_str()
+            texts = [joined_text[begin:end] for begin, end in zip(text_offsets, text_offsets[1:])]
+        segments = list(zip(map(styles.__getitem__, segment_styles), texts))
+        line_offsets = list(accumulate(segment_counts, initial=0))
+        lines = [segments[begin:end] for begin, end in zip(line_offsets, line_offsets[1:])]
+
+        payload.append(
+            {
+                'session_id': session_id,
+                'view_area': {
+                    'view_area_content': lines,
+                    'cursor_pos': cursor_pos
+                },
+                'scroll_info': {
+                    'total_lines': total_lines,
+                    'visible_lines': visible_lines,
+                    'first_visible_line': first_visible_line,
+                    'hide_scrollbar': bool(hide_scrollbar)
+                }
+            }
+        )
+
+    return payload
+
+
+def _encode_llm_answer(payload: dict) -> bytes:
+    _check_keys(payload, _LLM_ANSWER_KEYS)
+    chat_session_id = payload.get('chat_session_id')
+    flags = (_LLM_IS_THINK if payload.get('is_think') else 0) \
+        | (_LLM_IS_DONE if payload.get('is_done') else 0) \
+        | (_LLM_HAS_CHAT_SESSION_ID if chat_session_id is not None else 0)
+    return _U8.pack(flags) \
+        + _pack_str(payload.get('session_id', '')) \
+        + (_pack_str(chat_session_id) if chat_session_id is not None else b'') \
+        + _pack_str(payload.get('content', ''))
+
+
+def _decode_llm_answer(reader: _Reader) -> dict:
+    flags, = reader.unpack(_U8)
+    session_id = reader.read_str()
+    chat_session_id = reader.read_str() if flags & _LLM_HAS_CHAT_SESSION_ID else None
+    return {
+        'session_id': session_id,
+        'chat_session_id': chat_session_id,
+        'is_think': bool(flags & _LLM_IS_THINK),
+        'content': reader.read_str(),
+        'is_done': bool(flags & _LLM_IS_DONE)
+    }
+
+
+def _encode_scroll_window(payload: dict) -> bytes:
+    _check_keys(payload, _SESSION_CONTENT_KEYS)
+    content = payload.get('content', {})
+    _check_keys(content, _SCROLL_CONTENT_KEYS)
+    flags = (_SCROLL_MOVE if 'move' in content else 0) \
+        | (_SCROLL_START_LINE_NUM if 'start_line_num' in content else 0)
+    return _U8.pack(flags) \
+        + _pack_str(payload.get('session_id', '')) \
+        + (_I32.pack(content['move']) if flags & _SCROLL_MOVE else b'') \
+        + (_I32.pack(content['start_line_num']) if flags & _SCROLL_START_LINE_NUM else b'')
+
+
+def _decode_scroll_window(reader: _Reader) -> dict:
+    flags, = reader.unpack(_U8)
+    session_id = reader.read_str()
+    content = {}
+    if flags & _SCROLL_MOVE:
+        content['move'], = reader.unpack(_I32)
+    if flags & _SCROLL_START_LINE_NUM:
+        content['start_line_num'], = reader.unpack(_I32)
+    return {'session_id': session_id, 'content': content}
+
+
+def _encode_user_command(payload: dict) -> bytes:
+    _check_keys(payload, _SESSION_CONTENT_KEYS)
+    content = payload.get('content', {})
+    if set(content) != {'command'}:
+        raise MsgCodecError('user command content is not a plain command')
+    return _pack_str(payload.get('session_id', '')) + _pack_str(content['command'])
+
+
+def _decode_user_command(reader: _Reader) -> dict:
+    session_id = reader.read_str()
+    return {'session_id': session_id, 'content': {'command': reader.read_str()}}
+
+
+_ENCODERS: Dict[int, Callable] = {
+    SESSION_VIEW_CONTENT_CODE: _encode_view_content,
+    LLM_ANSWER_CODE: _encode_llm_answer,
+    SCROLL_WINDOW_CODE: _encode_scroll_window,
+    USER_COMMAND_CODE: _encode_user_command,
+}
+
+_DECODERS: Dict[int, Callable] = {
+    SESSION_VIEW_CONTENT_CODE: _decode_view_content,
+    LLM_ANSWER_CODE: _decode_llm_answer,
+    SCROLL_WINDOW_CODE: _decode_scroll_window,
+    USER_COMMAND_CODE: _decode_user_command,
+}
+
+
+def encode_msg(msg: dict) -> bytes:
+    msg_code = msg.get('msg_code')
+    if (encoder := _ENCODERS.get(msg_code)) and set(msg) == {'msg_code', 'payload'}:
+        try:
+            return _U8.pack(msg_code) + encoder(msg['payload'])
+        except (MsgCodecError, AttributeError, KeyError, TypeError, ValueError, struct.error):
+            # 消息结构不符合紧凑格式时退回pickle，保证消息不丢失
+            pass
+
+    return _U8.pack(PICKLE_FALLBACK_TAG) + pickle.dumps(msg, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_msg(data: bytes) -> dict:
+    if not data:
+        raise MsgCodecError('empty message')
+
+    tag = data[0]
+    if tag == PICKLE_FALLBACK_TAG:
+        return pickle.loads(memoryview(data)[1:])
+
+    if not (decoder := _DECODERS.get(tag)):
+        raise MsgCodecError(f'unknown message tag: {tag:#x}')
+
+    return {'msg_code': tag, 'payload': decoder(_Reader(data, 1))}
+
+
+def send_msg(conn: Connection, msg: dict):
+    conn.send_bytes(encode_msg(msg))
+
+
+def recv_msg(conn: Connection) -> dict:
+    return decode_msg(conn.recv_bytes())
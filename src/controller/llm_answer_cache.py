@@ -0,0 +1,152 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Final
+
+BLANK_LINES_PATTERN: Final = re.compile(r'\n{3,}')
+
+
+def normalize_text(text: str) -> str:
+    text = '\n'.join(line.rstrip() for line in text.strip().splitlines())
+    return BLANK_LINES_PATTERN.sub('\n\n', text)
+
+
+class LlmAnswerCache:
+    """
+    Answers of finished generations, keyed by model name and normalized message list.
+
+    The memory tier is an LRU of at most max_memory_entries answers. Every answer is also written to
+    one json file in cache_dir; the files are evicted by last use once they add up to more than
+    max_disk_bytes. Entries older than ttl_secs are misses. An answer is stored as a list of
+    [is_think, content] chunks so that it can be replayed with the original think markers.
+    """
+    MAX_MEMORY_ENTRIES: Final[int] = 256
+    MAX_DISK_BYTES: Final[int] = 32 * 1024 * 1024
+    TTL_SECS: Final[float] = 7 * 24 * 3600
+
+    def __init__(self, cache_dir: Path, max_memory_entries: int = MAX_MEMORY_ENTRIES,
+                 max_disk_bytes: int = MAX_DISK_BYTES, ttl_secs: float = TTL_SECS):
+        self.__cache_dir = cache_dir
+        self.__max_memory_entries = max_memory_entries
+        self.__max_disk_bytes = max_disk_bytes
+        self.__ttl_secs = ttl_secs
+        self.__lock = Lock()
+        self.__memory_entries: OrderedDict = OrderedDict()  # key: {'created', 'chunks'}
+        self.__disk_sizes: OrderedDict = OrderedDict()  # key: 文件大小，按最近使用排序
+        self.__disk_bytes = 0
+        self.hit_count = 0
+        self.miss_count = 0
+        self.__load_disk_index()
+
+    @staticmethod
+    def make_key(model: str, messages: List[dict]) -> str:
+        normalized = [[message['role'], normalize_text(message['content'])] for message in messages]
+        data = json.dumps([model, normalized], ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def __load_disk_index(self):
+        try:
+            paths = sorted(self.__cache_dir.glob('*.json'), key=lambda x: x.stat().st_mtime)
+        except OSError:
+            return
+        for path in paths:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            self.__disk_sizes[path.stem] = size
+            self.__disk_bytes += size
+
+    def get(self, key: str) -> Optional[List[list]]:
+        with self.__lock:
+            entry = self.__memory_entries.get(key)
+            if entry is None and key in self.__disk_sizes:
+                entry = self.__read_disk_entry(key)
+
+            if entry is None or time.time() - entry['created'] > self.__ttl_secs:
+                if entry is not None:
+                    self.__remove(key)
+                self.miss_count += 1
+                return None
+
+            self.__remember(key, entry)
+            if key in self.__disk_sizes:
+                self.__disk_sizes.move_to_end(key)
+                try:
+                    os.utime(self.__path(key))
+                except OSError:
+                    pass
+            self.hit_count += 1
+            return entry['chunks']
+
+    def put(self, key: str, model: str, chunks: List[list]):
+        entry = {'created': time.time(), 'model': model, 'chunks': chunks}
+        data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+        with self.__lock:
+            self.__remember(key, entry)
+            try:
+                self.__cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.__path(key).with_suffix('.tmp')
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, self.__path(key))
+            except OSError as e:
+                print(f'llm answer cache write error: {e}')
+                return
+
+            self.__disk_bytes += len(data) - self.__disk_sizes.pop(key, 0)
+            self.__disk_sizes[key] = len(data)
+            while self.__disk_bytes > self.__max_disk_bytes and len(self.__disk_sizes) > 1:
+                self.__remove(next(iter(self.__disk_sizes)))
+
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {
+                'hit_count': self.hit_count, 'miss_count': self.miss_count,
+                'memory_entry_count': len(self.__memory_entries), 'disk_entry_count': len(self.__disk_sizes),
+                'disk_bytes': self.__disk_bytes,
+            }
+
+    def __path(self, key: str) -> Path:
+        return self.__cache_dir / f'{key}.json'
+
+    def __remember(self, key: str, entry: dict):
+        self.__memory_entries[key] = entry
+        self.__memory_entries.move_to_end(key)
+        while len(self.__memory_entries) > self.__max_memory_entries:
+            self.__memory_entries.popitem(last=False)
+
+    def __read_disk_entry(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.__path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            self.__remove(key)
+            return None
+
+    def __remove(self, key: str):
+        self.__memory_entries.pop(key, None)
+        self.__disk_bytes -= self.__disk_sizes.pop(key, 0)
+        try:
+            self.__path(key).unlink()
+        except OSError:
+            pass
@@ -0,0 +1,102 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+from queue import Queue
+from threading import Thread, Condition
+from typing import Dict, Final
+
+
+class LlmAnswerCoalescer(Thread):
+    """
+    Merges the streamed LLM_ANSWER_CODE chunks of each chat before they go to the UI.
+
+    The first chunk of a batch starts a flush_interval_secs timer; chunks arriving before it fires
+    are appended to the batch. A change between think and answer text or the last chunk of an
+    answer flushes right away, so markers and is_done keep their order. Each chat therefore costs
+    the UI at most about 1 / flush_interval_secs updates per second. With flush_interval_secs of 0
+    every chunk is passed through as is.
+    """
+    FLUSH_INTERVAL_SECS: Final[float] = 0.05
+
+    def __init__(self, response_queue: Queue, flush_interval_secs: float = FLUSH_INTERVAL_SECS):
+        super().__init__(name='llm-answer-coalescer', daemon=True)
+        self.__response_queue = response_queue
+        self.__flush_interval_secs = flush_interval_secs
+        self.__condition = Condition()
+        self.__pending: Dict[tuple, dict] = {}  # (session_id, chat_session_id): {'msg', 'deadline'}
+        self.__is_stopped = False
+        self.chunk_count = 0
+        self.flush_count = 0
+
+    def put(self, msg: dict):
+        payload = msg['payload']
+        key = (payload.get('session_id'), payload.get('chat_session_id'))
+        with self.__condition:
+            self.chunk_count += 1
+            if self.__flush_interval_secs <= 0 or self.__is_stopped:
+                self.__flush_msg(msg)
+                return
+
+            pending = self.__pending.get(key)
+            if pending and pending['msg']['payload']['is_think'] != payload.get('is_think'):
+                self.__flush_msg(self.__pending.pop(key)['msg'])
+                pending = None
+
+            if pending:
+                pending_payload = pending['msg']['payload']
+                pending_payload['content'] += payload.get('content', '')
+                pending_payload['is_done'] = payload.get('is_done', False)
+            else:
+                # 复制payload，合并时不修改调用方的消息
+                pending = {
+                    'msg': dict(msg, payload=dict(payload)),
+                    'deadline': time.monotonic() + self.__flush_interval_secs
+                }
+                self.__pending[key] = pending
+                self.__condition.notify()
+
+            if pending['msg']['payload']['is_done']:
+                self.__flush_msg(self.__pending.pop(key)['msg'])
+
+    def stats(self) -> dict:
+        with self.__condition:
+            return {'chunk_count': self.chunk_count, 'flush_count': self.flush_count}
+
+    def stop(self):
+        with self.__condition:
+            self.__is_stopped = True
+            self.__flush_due(float('inf'))
+            self.__condition.notify()
+
+    def run(self):
+        with self.__condition:
+            while not self.__is_stopped:
+                if not self.__pending:
+                    self.__condition.wait()
+                    continue
+                now = time.monotonic()
+                self.__flush_due(now)
+                if self.__pending:
+                    self.__condition.wait(min(x['deadline'] for x in self.__pending.values()) - now)
+
+    def __flush_due(self, now: float):
+        for key in [key for key, pending in self.__pending.items() if pending['deadline'] <= now]:
+            self.__flush_msg(self.__pending.pop(key)['msg'])
+
+    def __flush_msg(self, msg: dict):
+        # 在锁内放入队列，同一对话的消息保持顺序
+        self.flush_count += 1
+        self.__response_queue.put(msg)
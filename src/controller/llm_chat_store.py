@@ -0,0 +1,132 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from typing import List, Optional, Final
+
+
+class LlmChatStore:
+    """
+    SQLite store of the side chat records.
+
+    Every finished turn is appended right away, so a crash loses at most the answer in progress.
+    History listing reads only the chats table, newest first and one page at a time, and the messages
+    of a chat are read when it is opened. The connection is shared by all LlmClient threads and only
+    used under the store lock.
+    """
+    SCHEMA: Final[str] = '''
+        CREATE TABLE IF NOT EXISTS chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_time TEXT NOT NULL,
+            first_message TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL REFERENCES chats(id),
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            org_user_msg TEXT,
+            shell_context TEXT
+        );
+        CREATE INDEX IF NOT EXISTS messages_chat_id ON messages(chat_id, id);
+    '''
+
+    def __init__(self, db_path: Path):
+        self.__lock = Lock()
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute('PRAGMA synchronous=NORMAL')
+        self.__conn.executescript(LlmChatStore.SCHEMA)
+
+    def migrate_json(self, json_path: Path) -> int:
+        """Import the records of the old chat_records.json once, then rename it to *.migrated."""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                chat_records = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        count = 0
+        for chat_record in chat_records:
+            message_list = chat_record.get('message_list', [])
+            if message_list:
+                chat_id = self.create_chat(chat_record.get('start_time', ''), message_list)
+                self.append_messages(chat_id, message_list)
+                count += 1
+        json_path.rename(json_path.with_suffix('.json.migrated'))
+        print(f'migrated {count} chat records from {json_path}')
+        return count
+
+    def create_chat(self, start_time: str, message_list: List[dict]) -> int:
+        first_message = next(
+            (message.get('org_user_msg') or '' for message in message_list if message.get('role') == 'user'), ''
+        )
+        with self.__lock, self.__conn:
+            cursor = self.__conn.execute(
+                'INSERT INTO chats (start_time, first_message) VALUES (?, ?)', (start_time, first_message)
+            )
+            return cursor.lastrowid
+
+    def append_messages(self, chat_id: int, messages: List[dict]):
+        rows = [
+            (
+                chat_id, message.get('role', ''), message.get('content', ''), message.get('org_user_msg'),
+                json.dumps(message['shell_context'], ensure_ascii=False) if message.get('shell_context') else None
+            )
+            for message in messages
+        ]
+        with self.__lock, self.__conn:
+            self.__conn.executemany(
+                'INSERT INTO messages (chat_id, role, content, org_user_msg, shell_context) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def list_chats(self, offset: int, limit: int, exclude_ids=()) -> tuple:
+        """Return ([(id, start_time, first_message)], has_more), newest first."""
+        exclude_ids = list(exclude_ids)
+        placeholders = ','.join('?' * len(exclude_ids))
+        with self.__lock:
+            rows = self.__conn.execute(
+                f'SELECT id, start_time, first_message FROM chats WHERE id NOT IN ({placeholders}) '
+                f'ORDER BY id DESC LIMIT ? OFFSET ?',
+                exclude_ids + [limit + 1, offset]
+            ).fetchall()
+        return rows[:limit], len(rows) > limit
+
+    def load_chat(self, chat_id: int) -> Optional[dict]:
+        with self.__lock:
+            chat = self.__conn.execute('SELECT start_time FROM chats WHERE id = ?', (chat_id,)).fetchone()
+            if chat is None:
+                return None
+            rows = self.__conn.execute(
+                'SELECT role, content, org_user_msg, shell_context FROM messages WHERE chat_id = ? ORDER BY id',
+                (chat_id,)
+            ).fetchall()
+
+        message_list = []
+        for role, content, org_user_msg, shell_context in rows:
+            message = {'role': role, 'content': content}
+            if role == 'user':
+                message['org_user_msg'] = org_user_msg
+                message['shell_context'] = json.loads(shell_context) if shell_context else None
+            message_list.append(message)
+        return {'start_time': chat[0], 'message_list': message_list}
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
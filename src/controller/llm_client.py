@@ -14,10 +14,14 @@
 
 
 import json
+import socket
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from queue import Queue, Empty
-from threading import Thread
-from typing import Dict
+from threading import Thread, RLock, Event, Lock
+from typing import Dict, Optional
 
 import requests
 
@@ -25,11 +29,97 @@ from src.common.common_definition import INLINE_CHAT_ID, SIDE_CHAT_ID, BASE_DIR
 from src.common.msg_code import LLM_ANSWER_CODE, LLM_ASK_CODE, LLM_MODEL_CHECK, LLM_MODEL_LIST_CODE, \
     LLM_CHAT_HISTORY_RSP_CODE, LLM_CHAT_HISTORY_REQ_CODE, LLM_THREAD_STOP, LLM_INLINE_MODEL_CHECK, \
     LLM_INLINE_MODEL_LIST_CODE, LLM_INLINE_ASK_CODE, LLM_LOAD_CHAT_BY_HISTORY_IDX, LLM_RSP_CHAT_BY_CHAT_ID, \
-    LLM_SERVER_URL_UPDATE_CODE, LLM_NEW_CHAT_CODE
+    LLM_SERVER_URL_UPDATE_CODE, LLM_NEW_CHAT_CODE, LLM_CANCEL_CODE, REMOVE_SESSION_CODE
+from src.controller.llm_answer_cache import LlmAnswerCache
+from src.controller.llm_answer_coalescer import LlmAnswerCoalescer
+from src.controller.llm_chat_store import LlmChatStore
+from src.controller.llm_compactor import compact_shell_text, DEFAULT_TOKEN_BUDGET as DEFAULT_SHELL_TOKEN_BUDGET
+from src.controller.llm_context import ShellContextManager, estimate_tokens
+from src.controller.llm_http import new_llm_http_session, take_connect_secs, LlmHttpStats, CONTROL_TIMEOUT, \
+    STREAM_TIMEOUT
+from src.model.sync_ssh.io_engine.io_engine import SerialLane
+
+
+class LlmGeneration:
+    """Handle of one streaming answer. cancel() may be called from any thread, also before the request starts."""
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__response: Optional[requests.Response] = None
+        self.is_cancelled = False
+        # 被同一对话的新问题取消时，通知界面结束当前回答
+        self.is_done_notify_needed = False
+
+    def attach(self, response: requests.Response) -> bool:
+        with self.__lock:
+            self.__response = response
+            return not self.is_cancelled
+
+    def cancel(self, is_done_notify_needed: bool = False):
+        with self.__lock:
+            if self.is_cancelled:
+                return
+            self.is_cancelled = True
+            self.is_done_notify_needed = is_done_notify_needed
+            response = self.__response
+
+        if response is not None:
+            LlmGeneration.abort_response(response)
+
+    @staticmethod
+    def abort_response(response: requests.Response):
+        # 关闭连接：阻塞中的读取立即返回，服务端检测到断开后停止生成
+        try:
+            if (connection := response.raw.connection) is not None and connection.sock is not None:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+        response.close()
 
 
 class LlmClient(Thread):
+    """
+    Dispatches LLM requests from the query queue.
+
+    Streaming answers run in a thread pool of max_concurrency workers. Requests of one session go
+    through that session's SerialLane, so they keep their order while different sessions stream at
+    the same time. Model checks run on a separate small pool and history requests are answered
+    right away, so neither waits for a long answer. All requests share one keep-alive connection pool
+    with explicit timeouts. Chat records are shared by all workers and are
+    only touched under the chat record lock. Each finished turn of a side chat is appended to an
+    LlmChatStore; history is listed from it page by page and a chat is read back when it is opened.
+
+    Requests keep a stable prefix: the system prompt and earlier turns are sent byte for byte as
+    before, and the screen content of a turn follows its question, so the model server can reuse its
+    KV cache and only process the new turn. Screen and focus text are compacted to shell_token_budget first, then screen content goes
+    through a ShellContextManager: later turns of a chat only carry the screen
+    lines that changed, and old screen copies are omitted when the chat grows over the token budget.
+
+    Finished answers go into an LlmAnswerCache. An ask whose model and messages match a cached answer
+    is answered from the cache at once, unless the UI sets use_answer_cache to False.
+
+    Answer chunks reach the response queue through an LlmAnswerCoalescer, which batches the tokens of
+    each chat on a short timer.
+
+    Model checks are answered from a cached model list at once. A list older than MODEL_LIST_TTL_SECS
+    is refreshed in the background, and every session that asked gets the new list only when the model
+    names changed. Changing the server url drops the cached list.
+
+    Every ask gets an LlmGeneration when it is dispatched. A new ask of the same chat, a new chat,
+    a new inline chat or LLM_CANCEL_CODE cancels the generation, queued or streaming.
+
+    REMOVE_SESSION_CODE cancels the generations of the session and drops everything kept for it: its
+    lane, chat records, screen context and model list subscriptions. The unsaved turns of its side
+    chat are stored first.
+    """
     LLM_QUEUE_GET_TIMEOUT = 0.1
+    DEFAULT_MAX_CONCURRENCY = 4
+    CONTROL_WORKERS = 2
+    SHELL_FOCUS_TITLE = '[shell_focus_text 用户关注的特定区域文本]'
+    # 模型和KV缓存在两次提问之间保持加载
+    KEEP_ALIVE = '30m'
+    MODEL_LIST_TTL_SECS = 30
+    HISTORY_PAGE_SIZE = 20
     INLINE_CHAT_SYSTEM_ROLE = {
         'role': 'system',
         'content': '''
@@ -37,6 +127,8 @@ class LlmClient(Thread):
 要求:
 - 当用户提出问题时，结合shell的当前状态和内容进行回答。
 - 你会收到用户的问题(inline_ask), 当前屏幕的完整内容文本(shell_content_text), 用户关注的特定区域文本(shell_focus_text)
+- 后续的问题可能只附带屏幕新增的行(shell_content_new_lines)或相对上次屏幕内容的变化(shell_content_diff)，需要结合之前收到的屏幕内容理解当前屏幕。
+- 屏幕内容可能经过压缩：重复或只有数字不同的行被合并为“×N”说明，过长的行和较早的行被省略。
 - 如果shell_focus_text内容不是空，优先使用shell_focus_text中的信息来回答用户的问题。
 - 如果需要并且shell_content_text内容不是空，则尝试从shell_content_text中寻找答案。
 - 如果原始信息不足以回答用户的问题，礼貌地提示用户提供更多细节。
@@ -49,18 +141,40 @@ class LlmClient(Thread):
 要求:
 - 当用户提出问题时，结合shell的当前状态和内容进行回答。
 - 你会收到用户的问题(llm_ask), 当前屏幕的完整内容文本(shell_content_text)
+- 后续的问题可能只附带屏幕新增的行(shell_content_new_lines)或相对上次屏幕内容的变化(shell_content_diff)，需要结合之前收到的屏幕内容理解当前屏幕。
+- 屏幕内容可能经过压缩：重复或只有数字不同的行被合并为“×N”说明，过长的行和较早的行被省略。
 - 如果需要并且shell_content_text内容不是空，则尝试从shell_content_text中寻找答案。
 - 如果原始信息不足以回答用户的问题，礼貌地提示用户提供更多细节。
 - 使用中文回答用户的问题。'''
     }
 
-    def __init__(self, llm_service_url: str, query_queue: Queue, response_queue: Queue):
+    def __init__(self, llm_service_url: str, query_queue: Queue, response_queue: Queue,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 context_token_budget: int = ShellContextManager.DEFAULT_TOKEN_BUDGET,
+                 shell_token_budget: int = DEFAULT_SHELL_TOKEN_BUDGET,
+                 answer_flush_interval_secs: float = LlmAnswerCoalescer.FLUSH_INTERVAL_SECS):
         super().__init__()
         self.__query_queue = query_queue
         self.__response_queue = response_queue
         self.__llm_service_url = llm_service_url
         self.__session_chat_record_map: Dict[str, dict] = {}
-        self.__history_chat_records: list[dict] = []
+        self.__chat_record_lock = RLock()
+        self.__shell_context = ShellContextManager(context_token_budget)  # 仅在持有对话记录锁时访问
+        self.__shell_token_budget = shell_token_budget
+        self.__stop_event = Event()
+
+        self.__stream_executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm-stream')
+        self.__control_executor = ThreadPoolExecutor(
+            max_workers=LlmClient.CONTROL_WORKERS, thread_name_prefix='llm-control'
+        )
+        self.__session_lanes: Dict[str, SerialLane] = {}  # 仅在本线程中访问
+        self.__generations: Dict[tuple, LlmGeneration] = {}  # (session_id, chat_id): 未结束的回答
+        self.__generations_lock = Lock()
+
+        self.__http_session = new_llm_http_session(pool_size=max_concurrency + LlmClient.CONTROL_WORKERS)
+        self.__http_stats = LlmHttpStats()
+        self.__answer_cache = LlmAnswerCache(BASE_DIR / 'llm_answer_cache')
+        self.__answer_coalescer = LlmAnswerCoalescer(response_queue, answer_flush_interval_secs)
         self.__llm_api_map = {
             'chat': {
                 'ollama': '/api/chat',
@@ -72,143 +186,303 @@ class LlmClient(Thread):
                 'ollama': '/api/ps'
             }
         }
+        self.__model_list_lock = Lock()
+        self.__model_list: Optional[dict] = None
+        self.__model_list_time = 0.0
+        self.__model_list_url_version = 0
+        self.__is_model_list_refreshing = False
+        self.__model_list_subscribers = set()  # (session_id, response msg_code)
+
+        self.__chat_store: Optional[LlmChatStore] = None
         self.load_chat_record()
 
     def clear_chat_record(self, session_id, chat_id):
-        session_chat_record_map = self.__session_chat_record_map.setdefault(session_id, {})
-        session_chat_record_map[chat_id] = {
-            'message_list': [],
-            'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'chat_id': chat_id
-        }
+        with self.__chat_record_lock:
+            self.__shell_context.reset(session_id, chat_id)
+            session_chat_record_map = self.__session_chat_record_map.setdefault(session_id, {})
+            session_chat_record_map[chat_id] = {
+                'message_list': [],
+                'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'chat_id': chat_id
+            }
 
     def get_chat_record(self, session_id, chat_id):
-        record = self.__session_chat_record_map.setdefault(session_id, {}).setdefault(chat_id, {})
-        if not record:
-            record['message_list'] = []
-            record['start_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            record['chat_id'] = chat_id
-
-        return record
+        with self.__chat_record_lock:
+            record = self.__session_chat_record_map.setdefault(session_id, {}).setdefault(chat_id, {})
+            if not record:
+                record['message_list'] = []
+                record['start_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                record['chat_id'] = chat_id
 
-    def pop_history_chat_record_by_idx(self, history_idx):
-        if history_idx < 0 or history_idx >= len(self.__history_chat_records):
-            return None
-        return self.__history_chat_records.pop(history_idx)
+            return record
 
     def move_current_chat_record_to_history(self, session_id):
-        session_records = self.__session_chat_record_map.get(session_id, {})
-        old_chat_record = session_records.get(SIDE_CHAT_ID)
-        if not old_chat_record:
-            return
-
-        self.__history_chat_records.append(old_chat_record)
-        self.clear_chat_record(session_id, SIDE_CHAT_ID)
-
-    def generate_new_message_list(self, session_id, chat_id, message, org_user_msg, system_role: dict):
-        record = self.get_chat_record(session_id, chat_id)
-        message_list = record.setdefault('message_list', [system_role])
-        message_list.append({'role': 'user', 'content': message, 'org_user_msg': org_user_msg})
-        return message_list
+        with self.__chat_record_lock:
+            session_records = self.__session_chat_record_map.get(session_id, {})
+            old_chat_record = session_records.get(SIDE_CHAT_ID)
+            if not old_chat_record:
+                return
+
+            # 每一轮结束时已经写入，这里只补写被中断的最后一轮
+            self.store_chat_turns(old_chat_record)
+            self.clear_chat_record(session_id, SIDE_CHAT_ID)
+
+    def store_chat_turns(self, chat_record: dict):
+        with self.__chat_record_lock:
+            message_list = chat_record.get('message_list', [])
+            stored_count = chat_record.get('stored_message_count', 0)
+            if stored_count >= len(message_list) or self.__chat_store is None:
+                return
+            try:
+                if 'record_id' not in chat_record:
+                    chat_record['record_id'] = self.__chat_store.create_chat(chat_record['start_time'], message_list)
+                self.__chat_store.append_messages(chat_record['record_id'], message_list[stored_count:])
+            except sqlite3.Error as e:
+                print(f'store chat record error: {e}')
+                return
+            chat_record['stored_message_count'] = len(message_list)
+
+    def generate_new_message_list(self, session_id, chat_id, message, org_user_msg, shell_content_text: str = '',
+                                  use_screen_context: bool = False, tail_message: str = ''):
+        with self.__chat_record_lock:
+            record = self.get_chat_record(session_id, chat_id)
+            message_list = record.setdefault('message_list', [])
+            shell_context = self.__shell_context.next_shell_context(
+                session_id, chat_id, shell_content_text, message_list, use_screen_context,
+                reserved_tokens=estimate_tokens(message + tail_message)
+            )
+            message += ShellContextManager.format_shell_context(shell_context) + tail_message
+            message_list.append(
+                {'role': 'user', 'content': message, 'org_user_msg': org_user_msg, 'shell_context': shell_context}
+            )
+            return message_list
+
+    def get_answer_cache_stats(self) -> Dict[str, int]:
+        return self.__answer_cache.stats()
+
+    def get_http_stats(self) -> Dict[str, dict]:
+        """Per model: connect time of new connections, time to first token and tokens/sec."""
+        return self.__http_stats.snapshot()
+
+    def new_generation(self, session_id, chat_id) -> LlmGeneration:
+        generation = LlmGeneration()
+        with self.__generations_lock:
+            old_generation = self.__generations.get((session_id, chat_id))
+            self.__generations[(session_id, chat_id)] = generation
+        if old_generation:
+            old_generation.cancel(is_done_notify_needed=True)
+        return generation
+
+    def cancel_generations(self, session_id, chat_id=None):
+        with self.__generations_lock:
+            keys = [key for key in self.__generations if key[0] == session_id and chat_id in (None, key[1])]
+            generations = [self.__generations.pop(key) for key in keys]
+        for generation in generations:
+            generation.cancel()
+
+    def finish_generation(self, session_id, chat_id, generation: LlmGeneration):
+        with self.__generations_lock:
+            if self.__generations.get((session_id, chat_id)) is generation:
+                self.__generations.pop((session_id, chat_id))
+
+    def get_session_lane(self, session_id) -> SerialLane:
+        if (lane := self.__session_lanes.get(session_id)) is None:
+            lane = self.__session_lanes[session_id] = SerialLane(self.__stream_executor)
+        return lane
 
     def run(self):
+        self.__answer_coalescer.start()
         while True:
             try:
                 user_query_msg = self.__query_queue.get()
             except Empty:
                 continue
 
-            msg_code = user_query_msg.get('msg_code')
-            # print(f'LLM Client received message code: {msg_code}, query: {user_query_msg}')
-            payload = user_query_msg.get('payload', {})
-            session_id = payload.get('session_id')
-
-            if msg_code == LLM_THREAD_STOP:
+            if user_query_msg.get('msg_code') == LLM_THREAD_STOP:
+                # 正在输出的回答在下一行数据到达时结束
+                self.__stop_event.set()
+                with self.__generations_lock:
+                    generations = list(self.__generations.values())
+                for generation in generations:
+                    generation.cancel()
+                self.__stream_executor.shutdown(wait=False, cancel_futures=True)
+                self.__control_executor.shutdown(wait=False, cancel_futures=True)
+                self.__http_session.close()
+                self.__answer_coalescer.stop()
                 self.store_chat_record()
                 print('LLM Client stopped...')
                 break
 
-            if msg_code == LLM_ASK_CODE:
-                content = user_query_msg.get('payload', {}).get('content', {})
-                chat_session_id = content.get('chat_session_id')
-                llm_ask = content.get('llm_ask')
-                llm_model_name = content.get('llm_model_name')
-                shell_content_text = content.get('shell_content_text')
+            self.dispatch_query_msg(user_query_msg)
 
-                message = f"[llm_ask 用户的问题]\n{llm_ask}\n"
-                if shell_content_text:
-                    message += f"\n\n[shell_content_text 当前屏幕的完整内容]\n{shell_content_text}\n"
+    def dispatch_query_msg(self, user_query_msg: dict):
+        msg_code = user_query_msg.get('msg_code')
+        # print(f'LLM Client received message code: {msg_code}, query: {user_query_msg}')
+        payload = user_query_msg.get('payload', {})
+        session_id = payload.get('session_id')
 
-                message_list = self.generate_new_message_list(
-                    session_id, SIDE_CHAT_ID, message, llm_ask, system_role=LlmClient.CHAT_SYSTEM_ROLE)
-                self.send_user_chat_message_to_llm(session_id, chat_session_id, message_list, llm_model_name)
-                continue
+        if msg_code == LLM_ASK_CODE:
+            content = payload.get('content', {})
+            generation = self.new_generation(session_id, content.get('chat_session_id'))
+            self.get_session_lane(session_id).submit(self.ask_chat, session_id, content, generation)
+            return
 
-            if msg_code == LLM_MODEL_CHECK or msg_code == LLM_INLINE_MODEL_CHECK:
-                # print(f'LLM model check for session {session_id}')
-                self.send_model_check_request(session_id, msg_code)
+        if msg_code == LLM_CANCEL_CODE:
+            self.cancel_generations(session_id, payload.get('content', {}).get('chat_session_id'))
+            return
 
-                # LLM INLINE MODEL CHECK 是临时对话的起点，所以在这条消息做初始化
-                if msg_code == LLM_INLINE_MODEL_CHECK:
-                    self.clear_chat_record(session_id, INLINE_CHAT_ID)
-                continue
+        if msg_code == LLM_MODEL_CHECK or msg_code == LLM_INLINE_MODEL_CHECK:
+            # print(f'LLM model check for session {session_id}')
+            self.answer_model_check(session_id, msg_code)
 
-            if msg_code == LLM_INLINE_ASK_CODE:
-                content = user_query_msg.get('payload', {}).get('content', {})
-                llm_model_name = content.get('llm_model_name')
-                inline_ask_text = content.get('inline_ask')
-                shell_focus_text = content.get('shell_focus_text', '')
-                shell_content_text = content.get('shell_content_text', '')
-
-                message = f"[inline_ask 用户的问题]\n{inline_ask_text}\n"
-                if shell_content_text:
-                    message += f"\n\n[shell_content_text 当前屏幕的完整内容]\n{shell_content_text}\n"
-                if shell_focus_text:
-                    message += f"\n\n[shell_focus_text 用户关注的特定区域文本]\n{shell_focus_text}\n"
-
-                message_list = self.generate_new_message_list(
-                    session_id, INLINE_CHAT_ID, message, inline_ask_text, system_role=LlmClient.INLINE_CHAT_SYSTEM_ROLE)
-                self.send_user_chat_message_to_llm(session_id, INLINE_CHAT_ID, message_list, llm_model_name)
-                continue
+            # LLM INLINE MODEL CHECK 是临时对话的起点，所以在这条消息做初始化
+            if msg_code == LLM_INLINE_MODEL_CHECK:
+                self.cancel_generations(session_id, INLINE_CHAT_ID)
+                self.get_session_lane(session_id).submit(self.clear_chat_record, session_id, INLINE_CHAT_ID)
+            return
 
-            if msg_code == LLM_CHAT_HISTORY_REQ_CODE:
-                self.send_chat_history_to_ui(session_id)
-                continue
+        if msg_code == LLM_INLINE_ASK_CODE:
+            generation = self.new_generation(session_id, INLINE_CHAT_ID)
+            self.get_session_lane(session_id).submit(self.ask_inline, session_id, payload.get('content', {}), generation)
+            return
 
-            if msg_code == LLM_NEW_CHAT_CODE:
-                self.move_current_chat_record_to_history(session_id)
-                continue
+        if msg_code == LLM_CHAT_HISTORY_REQ_CODE:
+            self.send_chat_history_to_ui(session_id, payload.get('content', {}).get('offset', 0))
+            return
 
-            if msg_code == LLM_LOAD_CHAT_BY_HISTORY_IDX:
-                history_idx = user_query_msg.get('payload', {}).get('content', {}).get('history_idx')
-                self.load_history_chat(session_id, history_idx)
-                continue
+        if msg_code == LLM_NEW_CHAT_CODE:
+            self.cancel_generations(session_id, SIDE_CHAT_ID)
+            self.get_session_lane(session_id).submit(self.move_current_chat_record_to_history, session_id)
+            return
 
-            if msg_code == LLM_SERVER_URL_UPDATE_CODE:
-                server_info = user_query_msg.get('payload', {})
-                self.__llm_service_url = f"http://{server_info.get('llm_server')}:{server_info.get('llm_port')}"
+        if msg_code == LLM_LOAD_CHAT_BY_HISTORY_IDX:
+            history_idx = payload.get('content', {}).get('history_idx')
+            self.get_session_lane(session_id).submit(self.load_history_chat, session_id, history_idx)
+            return
 
-    def store_chat_record(self):
-        for chat_record_map in self.__session_chat_record_map.values():
-            for chat_id, chat_record in chat_record_map.items():
-                if chat_id == SIDE_CHAT_ID:
-                    self.__history_chat_records.append(chat_record)
+        if msg_code == LLM_SERVER_URL_UPDATE_CODE:
+            self.__llm_service_url = f"http://{payload.get('llm_server')}:{payload.get('llm_port')}"
+            self.invalidate_model_list()
+            return
 
-        with open(BASE_DIR / 'chat_records.json', 'w', encoding='utf-8') as f:
-            json.dump(self.__history_chat_records, f, ensure_ascii=False, indent=4)
+        if msg_code == REMOVE_SESSION_CODE:
+            self.remove_session(session_id)
+
+    def remove_session(self, session_id):
+        self.cancel_generations(session_id)
+        with self.__model_list_lock:
+            self.__model_list_subscribers = {x for x in self.__model_list_subscribers if x[0] != session_id}
+
+        # 已排队的任务仍会执行，记录在lane的最后一个任务中清理，之后不再有任务写入
+        if (lane := self.__session_lanes.pop(session_id, None)) is not None:
+            lane.submit(self.remove_session_records, session_id)
+        else:
+            self.remove_session_records(session_id)
+
+    def remove_session_records(self, session_id):
+        with self.__chat_record_lock:
+            session_records = self.__session_chat_record_map.pop(session_id, {})
+            if chat_record := session_records.get(SIDE_CHAT_ID):
+                self.store_chat_turns(chat_record)
+            self.__shell_context.remove_session(session_id)
+
+    def get_session_state_stats(self) -> Dict[str, int]:
+        """Number of sessions each kind of per-session state is kept for."""
+        with self.__chat_record_lock:
+            chat_record_count = len(self.__session_chat_record_map)
+        with self.__model_list_lock:
+            subscriber_count = len({x[0] for x in self.__model_list_subscribers})
+        with self.__generations_lock:
+            generation_count = len({x[0] for x in self.__generations})
+        return {
+            'lanes': len(self.__session_lanes),
+            'chat_records': chat_record_count,
+            'model_list_subscribers': subscriber_count,
+            'generations': generation_count,
+        }
+
+    def skip_cancelled_ask(self, session_id, chat_session_id, record_chat_id, content: dict,
+                           generation: Optional[LlmGeneration]) -> bool:
+        """
+        Finish a generation cancelled while its ask was queued, before the question enters the chat record.
+        The screen it carried is kept as the latest screen of the chat, since the UI will not send it again.
+        """
+        if generation is None or not generation.is_cancelled:
+            return False
+        self.finish_generation(session_id, chat_session_id, generation)
+        if content.get('use_screen_context', False) and content.get('shell_content_text'):
+            shell_content_text = compact_shell_text(content.get('shell_content_text'), self.__shell_token_budget)
+            with self.__chat_record_lock:
+                self.__shell_context.update_latest_screen(session_id, record_chat_id, shell_content_text)
+        return True
+
+    def ask_chat(self, session_id, content: dict, generation: LlmGeneration = None):
+        chat_session_id = content.get('chat_session_id')
+        # 排队时已被取消的问题不写入对话记录，否则下一次提问会出现连续两条没有回答的用户消息
+        if self.skip_cancelled_ask(session_id, chat_session_id, SIDE_CHAT_ID, content, generation):
+            return
+        llm_ask = content.get('llm_ask')
+        llm_model_name = content.get('llm_model_name')
+        shell_content_text = compact_shell_text(content.get('shell_content_text'), self.__shell_token_budget)
+
+        message = f"[llm_ask 用户的问题]\n{llm_ask}\n"
+
+        message_list = self.generate_new_message_list(
+            session_id, SIDE_CHAT_ID, message, llm_ask, shell_content_text=shell_content_text,
+            use_screen_context=content.get('use_screen_context', False))
+        self.send_user_chat_message_to_llm(
+            session_id, chat_session_id, message_list, llm_model_name, generation, LlmClient.CHAT_SYSTEM_ROLE,
+            use_answer_cache=content.get('use_answer_cache', True))
+        self.store_chat_turns(self.get_chat_record(session_id, SIDE_CHAT_ID))
+
+    def ask_inline(self, session_id, content: dict, generation: LlmGeneration = None):
+        if self.skip_cancelled_ask(session_id, INLINE_CHAT_ID, INLINE_CHAT_ID, content, generation):
+            return
+        llm_model_name = content.get('llm_model_name')
+        inline_ask_text = content.get('inline_ask')
+        shell_focus_text = compact_shell_text(content.get('shell_focus_text', ''), self.__shell_token_budget)
+        shell_content_text = compact_shell_text(content.get('shell_content_text', ''), self.__shell_token_budget)
+
+        message = f"[inline_ask 用户的问题]\n{inline_ask_text}\n"
+        focus_message = ''
+        if shell_focus_text:
+            focus_message = f"\n\n{LlmClient.SHELL_FOCUS_TITLE}\n{shell_focus_text}\n"
+
+        message_list = self.generate_new_message_list(
+            session_id, INLINE_CHAT_ID, message, inline_ask_text,
+            shell_content_text=shell_content_text, use_screen_context=content.get('use_screen_context', False),
+            tail_message=focus_message)
+        self.send_user_chat_message_to_llm(
+            session_id, INLINE_CHAT_ID, message_list, llm_model_name, generation, LlmClient.INLINE_CHAT_SYSTEM_ROLE,
+            use_answer_cache=content.get('use_answer_cache', True))
+
+    def store_chat_record(self):
+        with self.__chat_record_lock:
+            for chat_record_map in self.__session_chat_record_map.values():
+                if chat_record := chat_record_map.get(SIDE_CHAT_ID):
+                    self.store_chat_turns(chat_record)
+            if self.__chat_store is not None:
+                self.__chat_store.close()
+                self.__chat_store = None
 
     def load_chat_record(self):
         try:
-            with open(BASE_DIR / 'chat_records.json', 'r', encoding='utf-8') as f:
-                self.__history_chat_records = json.load(f)
-        except Exception:
-            self.__history_chat_records = []
+            self.__chat_store = LlmChatStore(BASE_DIR / 'chat_records.db')
+            # 旧版本在退出时把全部记录写入chat_records.json，首次启动时导入
+            self.__chat_store.migrate_json(BASE_DIR / 'chat_records.json')
+        except (sqlite3.Error, OSError) as e:
+            print(f'open chat record store error: {e}')
 
     def load_history_chat(self, session_id, history_idx):
-        chat_record = self.pop_history_chat_record_by_idx(history_idx)
+        # history_idx是历史列表中给出的记录id
         self.move_current_chat_record_to_history(session_id)
+        with self.__chat_record_lock:
+            chat_record = self.__chat_store.load_chat(history_idx) if self.__chat_store is not None else None
         if not chat_record:
             return
+        chat_record.update(
+            chat_id=SIDE_CHAT_ID, record_id=history_idx, stored_message_count=len(chat_record['message_list'])
+        )
         self.update_chat_record(session_id, chat_record)
         self.__response_queue.put(
             {
@@ -221,56 +495,105 @@ class LlmClient(Thread):
         )
 
     def update_chat_record(self, session_id, chat_record):
-        session_records = self.__session_chat_record_map.setdefault(session_id, {})
-        session_records[SIDE_CHAT_ID] = chat_record
+        with self.__chat_record_lock:
+            # 历史对话中的屏幕内容可能已经过时，下一次提问发送完整内容
+            self.__shell_context.reset(session_id, SIDE_CHAT_ID)
+            session_records = self.__session_chat_record_map.setdefault(session_id, {})
+            session_records[SIDE_CHAT_ID] = chat_record
+
+    @staticmethod
+    def get_model_names(model_info: dict) -> list:
+        # /api/ps的结果中expires_at等字段每次都会变化，只比较模型名
+        return sorted(model.get('name') or model.get('model') or '' for model in model_info.get('models', []))
+
+    def send_model_list(self, session_id: str, response_code: int, model_info: dict):
+        self.__response_queue.put(
+            {
+                'msg_code': response_code,
+                'payload': {
+                    'session_id': session_id,
+                    'content': model_info
+                }
+            }
+        )
 
-    def send_model_check_request(self, session_id: str, check_msg_code: int):
+    def answer_model_check(self, session_id: str, check_msg_code: int):
+        response_code = LLM_INLINE_MODEL_LIST_CODE if check_msg_code == LLM_INLINE_MODEL_CHECK else LLM_MODEL_LIST_CODE
+        with self.__model_list_lock:
+            self.__model_list_subscribers.add((session_id, response_code))
+            model_info = self.__model_list
+            need_refresh = not self.__is_model_list_refreshing and \
+                (model_info is None or time.monotonic() - self.__model_list_time > LlmClient.MODEL_LIST_TTL_SECS)
+            if need_refresh:
+                self.__is_model_list_refreshing = True
+            url_version = self.__model_list_url_version
+
+        # 有缓存时立即回复，第一次请求等待刷新结果
+        if model_info is not None:
+            self.send_model_list(session_id, response_code, model_info)
+        if need_refresh:
+            self.__control_executor.submit(self.refresh_model_list, url_version)
+
+    def invalidate_model_list(self):
+        with self.__model_list_lock:
+            self.__model_list = None
+            self.__model_list_url_version += 1
+            need_refresh = self.__is_model_list_refreshing = bool(self.__model_list_subscribers)
+            url_version = self.__model_list_url_version
+        # 已经打开过模型列表的界面随后收到新服务器的模型列表
+        if need_refresh:
+            self.__control_executor.submit(self.refresh_model_list, url_version)
+
+    def refresh_model_list(self, url_version: int):
         url = f"{self.__llm_service_url}{self.__llm_api_map['model_check']['ollama']}"
-        respones_code = (
-            LLM_INLINE_MODEL_LIST_CODE if check_msg_code == LLM_INLINE_MODEL_CHECK else LLM_MODEL_LIST_CODE)
         try:
-            response = requests.get(url)
+            response = self.__http_session.get(url, timeout=CONTROL_TIMEOUT)
             response.raise_for_status()
             model_info = response.json()
-            self.__response_queue.put(
-                {
-                    'msg_code': respones_code,
-                    'payload': {
-                        'session_id': session_id,
-                        'content': model_info
-                    }
-                }
-            )
         except Exception as e:
             print(e)
-            self.__response_queue.put(
-                {
-                    'msg_code': respones_code,
-                    'payload': {
-                        'session_id': session_id,
-                        'content': {'models': []}
-                    }
-                }
-            )
-
-    def send_chat_history_to_ui(self, session_id: str):
-        chat_history_brief = []
-        for idx, chat_record in enumerate(self.__history_chat_records):
-            chat_start_time = chat_record.get('start_time', '')
-            chat_message_list = chat_record.get('message_list', [])
-            if not chat_message_list:
-                continue
-            first_message_info = chat_message_list[0]
-            if first_message_info.get('role') != 'user':
-                continue
-            first_message = first_message_info.get('org_user_msg', '')
-            chat_history_brief.append(
-                {
-                    'history_idx': idx,
-                    'start_time': chat_start_time,
-                    'first_message': first_message
-                }
-            )
+            model_info = None
+
+        with self.__model_list_lock:
+            if url_version != self.__model_list_url_version:
+                return
+            self.__is_model_list_refreshing = False
+            old_model_info = self.__model_list
+            if model_info is None:
+                # 刷新失败时保留之前的列表，没有列表时回复空列表
+                if old_model_info is not None:
+                    return
+                model_info = {'models': []}
+            else:
+                self.__model_list = model_info
+                self.__model_list_time = time.monotonic()
+            if old_model_info is not None and \
+                    LlmClient.get_model_names(old_model_info) == LlmClient.get_model_names(model_info):
+                return
+            subscribers = list(self.__model_list_subscribers)
+
+        for session_id, response_code in subscribers:
+            self.send_model_list(session_id, response_code, model_info)
+
+    def send_chat_history_to_ui(self, session_id: str, offset: int = 0):
+        with self.__chat_record_lock:
+            if self.__chat_store is None:
+                return
+            # 各session当前打开的对话不出现在历史列表中
+            open_record_ids = [
+                record['record_id'] for records in self.__session_chat_record_map.values()
+                if 'record_id' in (record := records.get(SIDE_CHAT_ID) or {})
+            ]
+            rows, has_more = self.__chat_store.list_chats(offset, LlmClient.HISTORY_PAGE_SIZE, open_record_ids)
+
+        chat_history_brief = [
+            {
+                'history_idx': record_id,
+                'start_time': start_time,
+                'first_message': first_message
+            }
+            for record_id, start_time, first_message in rows
+        ]
         if not chat_history_brief:
             return
 
@@ -279,28 +602,113 @@ class LlmClient(Thread):
                 'msg_code': LLM_CHAT_HISTORY_RSP_CODE,
                 'payload': {
                     'session_id': session_id,
-                    'content': chat_history_brief
+                    'content': chat_history_brief,
+                    'next_offset': offset + len(rows) if has_more else None
                 }
             }
         )
 
-    def send_user_chat_message_to_llm(self, session_id, chat_session_id, message_list, llm_model_name: str):
-        data = {
-            "model": llm_model_name,
-            "messages": message_list,
-            "stream": True,
-        }
+    def record_generation_stats(self, llm_model_name: str, connect_secs, request_begin: float, first_token_time,
+                                token_count: int, done_info: dict, is_follow_up: bool):
+        # ollama在最后一条消息中给出生成的token数和耗时，以及实际计算的prompt token数(命中缓存的部分不计算)
+        eval_count, eval_duration_ns = done_info.get('eval_count'), done_info.get('eval_duration')
+        if eval_count and eval_duration_ns:
+            token_count, generation_secs = eval_count, eval_duration_ns / 1e9
+        else:
+            generation_secs = time.perf_counter() - first_token_time if first_token_time else 0.0
+        first_token_secs = first_token_time - request_begin if first_token_time else None
+        prompt_eval_count = done_info.get('prompt_eval_count')
+        self.__http_stats.record(
+            llm_model_name, connect_secs, first_token_secs, token_count, generation_secs, is_follow_up, prompt_eval_count
+        )
+        print(
+            f'llm {llm_model_name}: '
+            f'connect {"reused" if connect_secs is None else f"{connect_secs * 1000:.1f}ms"}, '
+            f'{"follow-up " if is_follow_up else ""}'
+            f'first token {"-" if first_token_secs is None else f"{first_token_secs * 1000:.0f}ms"}, '
+            f'prompt eval {"-" if prompt_eval_count is None else prompt_eval_count} tokens, '
+            f'{token_count / generation_secs if generation_secs else 0.0:.1f} tokens/s'
+        )
+
+    @staticmethod
+    def get_answer_cache_messages(message_list: list) -> list:
+        messages = []
+        for message in message_list:
+            content = message['content']
+            if message.get('shell_context') and LlmClient.SHELL_FOCUS_TITLE in content:
+                # 有关注区域时回答取决于关注的文本，屏幕其余内容不参与缓存键
+                content = content.replace(ShellContextManager.format_shell_context(message['shell_context']), '', 1)
+            messages.append({'role': message['role'], 'content': content})
+        return messages
+
+    def replay_cached_answer(self, session_id, chat_session_id, chunks: list):
+        for idx, (is_think, content) in enumerate(chunks):
+            self.__answer_coalescer.put(
+                {
+                    'msg_code': LLM_ANSWER_CODE,
+                    'payload': {
+                        'session_id': session_id,
+                        'chat_session_id': chat_session_id,
+                        'is_think': is_think,
+                        'content': content,
+                        'is_done': idx == len(chunks) - 1
+                    }
+                }
+            )
+
+    def send_user_chat_message_to_llm(self, session_id, chat_session_id, message_list, llm_model_name: str,
+                                      generation: LlmGeneration = None, system_role: dict = None,
+                                      use_answer_cache: bool = True):
+        generation = generation or LlmGeneration()
+        if generation.is_cancelled:
+            self.finish_generation(session_id, chat_session_id, generation)
+            return
+
+        with self.__chat_record_lock:
+            # 系统提示词和之前的对话逐字节不变，服务端可以复用上一轮的KV缓存，只计算新的一轮
+            messages = [system_role] if system_role else []
+            messages += [{'role': message['role'], 'content': message['content']} for message in message_list]
+            data = {
+                "model": llm_model_name,
+                "messages": messages,
+                "stream": True,
+                "keep_alive": LlmClient.KEEP_ALIVE,
+            }
+            is_follow_up = any(message['role'] == 'assistant' for message in message_list)
+            cache_key = LlmAnswerCache.make_key(
+                llm_model_name, messages[:1] + LlmClient.get_answer_cache_messages(message_list)
+            )
+
+        if use_answer_cache and (chunks := self.__answer_cache.get(cache_key)):
+            self.finish_generation(session_id, chat_session_id, generation)
+            self.replay_cached_answer(session_id, chat_session_id, chunks)
+            print(f'llm {llm_model_name}: answered from cache, {self.__answer_cache.stats()}')
+            with self.__chat_record_lock:
+                message_list.append({'role': 'assistant', 'content': ''.join(chunk[1] for chunk in chunks)})
+            return
 
         full_response = ""
+        answer_chunks = []  # [is_think, content]，相邻的同类内容合并
         url = f"{self.__llm_service_url}{self.__llm_api_map['chat']['ollama']}"
+        request_begin = time.perf_counter()
+        response = connect_secs = first_token_time = None
+        token_count = 0
+        done_info = {}
         try:
-            response = requests.post(url, json=data, stream=True)
+            response = self.__http_session.post(url, json=data, stream=True, timeout=STREAM_TIMEOUT)
+            connect_secs = take_connect_secs(response)
+            if not generation.attach(response):
+                LlmGeneration.abort_response(response)
+                return
             response.raise_for_status()
 
             is_think = False
             is_explicit_think_label = False
 
             for line in response.iter_lines():
+                if generation.is_cancelled or self.__stop_event.is_set():
+                    LlmGeneration.abort_response(response)
+                    break
                 if line:
                     try:
                         # 解析每行的JSON响应
@@ -309,6 +717,8 @@ class LlmClient(Thread):
 
                         message = json_response.get('message', {})
                         is_done = json_response.get('done', False)
+                        if is_done:
+                            done_info = json_response
                         if not message:
                             continue
 
@@ -335,10 +745,14 @@ class LlmClient(Thread):
                             else:
                                 msg = content or thinking_msg
 
+                        if msg:
+                            token_count += 1
+                            if first_token_time is None:
+                                first_token_time = time.perf_counter()
                         if is_done:
                             msg += '\n\n'
 
-                        self.__response_queue.put(
+                        self.__answer_coalescer.put(
                             {
                                 'msg_code': LLM_ANSWER_CODE,
                                 'payload': {
@@ -351,11 +765,65 @@ class LlmClient(Thread):
                             }
                         )
                         full_response += msg
+                        if answer_chunks and answer_chunks[-1][0] == is_think:
+                            answer_chunks[-1][1] += msg
+                        elif msg:
+                            answer_chunks.append([is_think, msg])
 
                     except json.JSONDecodeError:
                         continue
-            assistant = {'role': 'assistant', 'content': full_response}
-            message_list.append(assistant)
         except requests.exceptions.RequestException as e:
-            print(f"\n请求错误: {e}")
-            return
+            if not generation.is_cancelled:
+                print(f"\n请求错误: {e}")
+                # 超时或连接失败时结束当前回答，界面可以继续提问
+                self.__answer_coalescer.put(
+                    {
+                        'msg_code': LLM_ANSWER_CODE,
+                        'payload': {
+                            'session_id': session_id,
+                            'chat_session_id': chat_session_id,
+                            'is_think': False,
+                            'content': f'\n\n[request error: {e}]\n\n',
+                            'is_done': True
+                        }
+                    }
+                )
+                return
+        except (OSError, ValueError, AttributeError):
+            # 取消时连接在读取过程中被关闭
+            if not generation.is_cancelled:
+                raise
+        finally:
+            # 流式响应读完后需要close才会把连接放回连接池
+            if response is not None:
+                response.close()
+            self.finish_generation(session_id, chat_session_id, generation)
+
+        if generation.is_cancelled:
+            if generation.is_done_notify_needed:
+                self.__answer_coalescer.put(
+                    {
+                        'msg_code': LLM_ANSWER_CODE,
+                        'payload': {
+                            'session_id': session_id,
+                            'chat_session_id': chat_session_id,
+                            'is_think': False,
+                            'content': '\n\n',
+                            'is_done': True
+                        }
+                    }
+                )
+            if not full_response:
+                return
+
+        if not generation.is_cancelled and done_info and answer_chunks:
+            self.__answer_cache.put(cache_key, llm_model_name, answer_chunks)
+
+        self.record_generation_stats(
+            llm_model_name, connect_secs, request_begin, first_token_time, token_count, done_info, is_follow_up
+        )
+
+        # 被取消的回答也保留已输出的部分，后续提问仍能看到上下文
+        assistant = {'role': 'assistant', 'content': full_response}
+        with self.__chat_record_lock:
+            message_list.append(assistant)
@@ -0,0 +1,129 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import re
+from typing import List, Final
+
+from src.controller.llm_context import estimate_tokens
+
+ANSI_ESCAPE_PATTERN: Final = re.compile(r'\x1b(\[[0-9;?]*[ -/]*[@-~]|\][^\x07\x1b]*(\x07|\x1b\\)|[@-Z\\-_])')
+CONTROL_CHAR_PATTERN: Final = re.compile(r'[\x00-\x08\x0b-\x1f\x7f]')
+# 数字、十六进制地址和时间戳不同的行视为同一模板
+TEMPLATE_PATTERN: Final = re.compile(r'0x[0-9a-fA-F]+|[0-9a-fA-F]{8,}|\d+')
+
+DEFAULT_TOKEN_BUDGET: Final[int] = 3072
+MAX_LINE_CHARS: Final[int] = 400
+MAX_BLOCK_LINES: Final[int] = 4
+MIN_REPEAT_COUNT: Final[int] = 3
+
+
+def strip_control_residue(line: str) -> str:
+    line = ANSI_ESCAPE_PATTERN.sub('', line)
+    # 回车覆盖输出(进度条)只保留最后一次的内容
+    if '\r' in line:
+        line = line.rstrip('\r').rsplit('\r', 1)[-1]
+    while '\b' in line:
+        idx = line.index('\b')
+        line = line[:max(0, idx - 1)] + line[idx + 1:]
+    return CONTROL_CHAR_PATTERN.sub('', line).rstrip()
+
+
+def truncate_line(line: str, max_chars: int = MAX_LINE_CHARS) -> str:
+    if len(line) <= max_chars:
+        return line
+    keep_chars = max_chars // 2
+    return f'{line[:keep_chars]} …[省略{len(line) - keep_chars * 2}个字符]… {line[-keep_chars:]}'
+
+
+def line_template(line: str) -> str:
+    return TEMPLATE_PATTERN.sub('#', line)
+
+
+def find_repeat(templates: List[str], start_idx: int) -> tuple:
+    """Return (block_size, repeat_count) of the longest run of repeated blocks starting at start_idx."""
+    best_block_size, best_count = 1, 1
+    for block_size in range(1, MAX_BLOCK_LINES + 1):
+        block = templates[start_idx:start_idx + block_size]
+        if len(block) < block_size:
+            break
+        count = 1
+        next_idx = start_idx + block_size
+        while templates[next_idx:next_idx + block_size] == block:
+            count += 1
+            next_idx += block_size
+        if count >= MIN_REPEAT_COUNT and count * block_size > best_count * best_block_size:
+            best_block_size, best_count = block_size, count
+    return best_block_size, best_count
+
+
+def collapse_repeats(lines: List[str]) -> List[str]:
+    templates = [line_template(line) for line in lines]
+    result = []
+    idx = 0
+    while idx < len(lines):
+        block_size, count = find_repeat(templates, idx)
+        if count < MIN_REPEAT_COUNT:
+            result.append(lines[idx])
+            idx += 1
+            continue
+
+        run = lines[idx:idx + block_size * count]
+        first_block, last_block = run[:block_size], run[-block_size:]
+        if all(run[offset] == first_block[offset % block_size] for offset in range(len(run))):
+            result += first_block
+            if block_size == 1 and not first_block[0]:
+                # 连续的空行只保留一行
+                idx += count
+                continue
+            result.append(f'[以上{block_size}行重复 ×{count}]')
+        else:
+            # 只有数字不同的行(进度条、ping、重试)：保留第一次和最后一次
+            result += first_block
+            result.append(f'[… 相似的{block_size}行重复 ×{count - 2} …]')
+            result += last_block
+        idx += block_size * count
+    return result
+
+
+def fit_token_budget(lines: List[str], token_budget: int) -> List[str]:
+    """Keep the newest lines that fit token_budget, the end of a screen is usually the most relevant part."""
+    used_tokens = 0
+    first_kept_idx = len(lines)
+    while first_kept_idx > 0:
+        line_tokens = estimate_tokens(lines[first_kept_idx - 1])
+        if used_tokens + line_tokens > token_budget:
+            break
+        used_tokens += line_tokens
+        first_kept_idx -= 1
+
+    if first_kept_idx == 0:
+        return lines
+    return [f'[前面的{first_kept_idx}行已省略]'] + lines[first_kept_idx:]
+
+
+def compact_shell_text(text: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """
+    Shrink shell text before it goes into a prompt: strip control residue, collapse runs of identical
+    or number-only-different lines into ×N notes, truncate long lines and keep the newest lines
+    within token_budget.
+    """
+    if not text:
+        return text
+    # QTextCursor.selectedText()用U+2029分隔段落
+    text = text.replace('\u2029', '\n')
+    lines = [truncate_line(strip_control_residue(line)) for line in text.split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(fit_token_budget(collapse_repeats(lines), token_budget))
@@ -0,0 +1,180 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import difflib
+from typing import Dict, List, Optional, Final
+
+SHELL_CONTEXT_FULL: Final[str] = 'full'
+SHELL_CONTEXT_NEW_LINES: Final[str] = 'new_lines'
+SHELL_CONTEXT_DIFF: Final[str] = 'diff'
+
+SHELL_CONTEXT_TITLES: Final[Dict[str, str]] = {
+    SHELL_CONTEXT_FULL: '[shell_content_text 当前屏幕的完整内容]',
+    SHELL_CONTEXT_NEW_LINES: '[shell_content_new_lines 上次发送后屏幕新增的行]',
+    SHELL_CONTEXT_DIFF: '[shell_content_diff 当前屏幕相对上次发送内容的变化(unified diff)]',
+}
+SHELL_CONTEXT_OMITTED: Final[str] = '\n\n[shell_content_text 较早的屏幕内容已省略]\n'
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: about 4 ASCII characters or 1 CJK character per token."""
+    ascii_count = len(text.encode('ascii', errors='ignore'))
+    return ascii_count // 4 + (len(text) - ascii_count) + 1
+
+
+def estimate_message_list_tokens(message_list: List[dict]) -> int:
+    return sum(estimate_tokens(message.get('content', '')) for message in message_list)
+
+
+def find_scroll_overlap(old_lines: List[str], new_lines: List[str]) -> int:
+    """Length of the longest tail of old_lines that new_lines starts with, i.e. the lines still on screen after scrolling."""
+    if not new_lines:
+        return 0
+    for start_idx in range(len(old_lines)):
+        if old_lines[start_idx] != new_lines[0]:
+            continue
+        overlap = len(old_lines) - start_idx
+        if overlap <= len(new_lines) and old_lines[start_idx:] == new_lines[:overlap]:
+            return overlap
+    return 0
+
+
+class ShellContextManager:
+    """
+    Remembers which screen content was already sent in each chat, so that later turns only carry
+    what changed.
+
+    The first turn of a chat sends the full screen. Later turns send the lines added by scrolling,
+    or a line-level diff, whichever applies and is clearly smaller than the full screen; an
+    unchanged screen is not sent again. The sent section is kept on the user message under
+    'shell_context', so that copies of earlier turns can be replaced by a short note when the chat
+    grows over the token budget. Trimming rewrites earlier messages and so invalidates the model
+    server's prefix cache, so it goes down to TRIM_TARGET_RATIO of the budget at once instead of
+    trimming a little on every turn.
+    """
+    DEFAULT_TOKEN_BUDGET: Final[int] = 8192
+    # 增量内容不小于完整内容的一半时，直接发送完整内容
+    MAX_DELTA_RATIO: Final[float] = 0.5
+    TRIM_TARGET_RATIO: Final[float] = 0.6
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.__token_budget = token_budget
+        self.__latest_screens: Dict[tuple, str] = {}  # (session_id, chat_id): 最近一次收到的屏幕内容
+        self.__sent_screens: Dict[tuple, List[str]] = {}  # (session_id, chat_id): 模型已经看到的屏幕内容
+
+    def reset(self, session_id, chat_id=None):
+        for key in [key for key in self.__sent_screens if key[0] == session_id and chat_id in (None, key[1])]:
+            self.__sent_screens.pop(key)
+
+    def update_latest_screen(self, session_id, chat_id, screen_text: str):
+        self.__latest_screens[(session_id, chat_id)] = screen_text
+
+    def remove_session(self, session_id):
+        self.reset(session_id)
+        for key in [key for key in self.__latest_screens if key[0] == session_id]:
+            self.__latest_screens.pop(key)
+
+    def next_shell_context(self, session_id, chat_id, screen_text: str, message_list: List[dict],
+                           use_screen_context: bool, reserved_tokens: int = 0) -> Optional[dict]:
+        """
+        Return the {'kind', 'text'} section to send with the next user message, or None when screen
+        context is disabled or the model already sees the current screen. May trim the shell context of
+        earlier messages in message_list.
+        """
+        if not use_screen_context:
+            return None
+
+        # 侧边栏对话和inline对话各自记录屏幕的更新时间，界面只在屏幕变化后才发送内容，新对话仍然需要最近一次的屏幕内容
+        key = (session_id, chat_id)
+        if screen_text:
+            self.update_latest_screen(session_id, chat_id, screen_text)
+        else:
+            screen_text = self.__latest_screens.get(key, '')
+        if not screen_text:
+            return None
+
+        new_lines = screen_text.splitlines()
+        shell_context = self.__build_shell_context(self.__sent_screens.get(key), new_lines, screen_text)
+
+        used_tokens = estimate_message_list_tokens(message_list) + reserved_tokens
+        if shell_context:
+            used_tokens += estimate_tokens(shell_context['text'])
+        if used_tokens > self.__token_budget:
+            target_tokens = int(self.__token_budget * ShellContextManager.TRIM_TARGET_RATIO)
+            if not self.trim_superseded(message_list, used_tokens - target_tokens):
+                # 增量内容依赖之前发送的屏幕内容，全部省略后改为发送完整内容
+                ShellContextManager.omit_shell_context(message_list)
+                shell_context = {'kind': SHELL_CONTEXT_FULL, 'text': screen_text}
+
+        self.__sent_screens[key] = new_lines
+        return shell_context
+
+    @staticmethod
+    def __build_shell_context(sent_lines: Optional[List[str]], new_lines: List[str], screen_text: str) -> Optional[dict]:
+        if sent_lines is None:
+            return {'kind': SHELL_CONTEXT_FULL, 'text': screen_text}
+        if sent_lines == new_lines:
+            return None
+
+        max_delta_len = len(screen_text) * ShellContextManager.MAX_DELTA_RATIO
+        overlap = find_scroll_overlap(sent_lines, new_lines)
+        if overlap:
+            text = '\n'.join(new_lines[overlap:])
+            if len(text) < max_delta_len:
+                return {'kind': SHELL_CONTEXT_NEW_LINES, 'text': text}
+
+        text = '\n'.join(difflib.unified_diff(sent_lines, new_lines, n=1, lineterm=''))
+        if len(text) < max_delta_len:
+            return {'kind': SHELL_CONTEXT_DIFF, 'text': text}
+        return {'kind': SHELL_CONTEXT_FULL, 'text': screen_text}
+
+    @staticmethod
+    def format_shell_context(shell_context: Optional[dict]) -> str:
+        if not shell_context:
+            return ''
+        return f"\n\n{SHELL_CONTEXT_TITLES[shell_context['kind']]}\n{shell_context['text']}\n"
+
+    @staticmethod
+    def trim_superseded(message_list: List[dict], excess_tokens: int) -> bool:
+        """
+        Omit, oldest first, shell context that a later full screen makes redundant, until excess_tokens
+        are freed. Return whether that was enough.
+        """
+        last_full_idx = -1
+        for idx, message in enumerate(message_list):
+            if (message.get('shell_context') or {}).get('kind') == SHELL_CONTEXT_FULL:
+                last_full_idx = idx
+
+        for idx in range(last_full_idx):
+            if excess_tokens <= 0:
+                break
+            excess_tokens -= ShellContextManager.omit_message_shell_context(message_list[idx])
+        return excess_tokens <= 0
+
+    @staticmethod
+    def omit_shell_context(message_list: List[dict]):
+        for message in message_list:
+            ShellContextManager.omit_message_shell_context(message)
+
+    @staticmethod
+    def omit_message_shell_context(message: dict) -> int:
+        shell_context = message.get('shell_context')
+        if not shell_context:
+            return 0
+        section = ShellContextManager.format_shell_context(shell_context)
+        old_content = message.get('content', '')
+        message['content'] = old_content.replace(section, SHELL_CONTEXT_OMITTED, 1)
+        message['shell_context'] = None
+        return estimate_tokens(old_content) - estimate_tokens(message['content'])
@@ -0,0 +1,147 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import time
+from threading import Lock
+from typing import Dict, Final, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# (connect, read) 超时；流式回答的读超时是两次数据之间的最长间隔，需要覆盖模型加载时间
+CONNECT_TIMEOUT_SECS: Final[float] = 3.05
+CONTROL_TIMEOUT: Final[tuple] = (CONNECT_TIMEOUT_SECS, 10)
+STREAM_TIMEOUT: Final[tuple] = (CONNECT_TIMEOUT_SECS, 120)
+
+RETRY_TOTAL: Final[int] = 3
+RETRY_BACKOFF_FACTOR: Final[float] = 0.2
+RETRY_STATUS_CODES: Final[tuple] = (500, 502, 503, 504)
+
+
+class ConnectTimerMixin:
+    """Remembers how long the TCP connect took, until take_connect_secs() reads it."""
+    connect_secs: Optional[float] = None
+
+    def connect(self):
+        begin = time.perf_counter()
+        super().connect()
+        self.connect_secs = time.perf_counter() - begin
+
+
+class TimedHTTPConnection(ConnectTimerMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(ConnectTimerMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class LlmHttpAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+def new_llm_http_session(pool_size: int) -> requests.Session:
+    """
+    Keep-alive session for the LLM server. Connection errors are retried for every method since the
+    request has not been sent yet; read errors and 5xx answers only for idempotent GETs.
+    """
+    retry = Retry(
+        total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET']), raise_on_status=False
+    )
+    adapter = LlmHttpAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def take_connect_secs(response: requests.Response) -> Optional[float]:
+    """Connect time of the connection behind a streaming response, None if it was reused from the pool."""
+    connection = getattr(response.raw, 'connection', None)
+    connect_secs = getattr(connection, 'connect_secs', None)
+    if connect_secs is not None:
+        connection.connect_secs = None
+    return connect_secs
+
+
+class LlmHttpStats:
+    """Per model counters of the chat requests, read from any thread."""
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__model_stats: Dict[str, dict] = {}
+
+    def record(self, model: str, connect_secs: Optional[float], first_token_secs: Optional[float],
+               token_count: int, generation_secs: float, is_follow_up: bool = False,
+               prompt_eval_count: Optional[int] = None):
+        with self.__lock:
+            stats = self.__model_stats.setdefault(
+                model,
+                {
+                    'request_count': 0, 'new_connection_count': 0, 'total_connect_secs': 0.0,
+                    'first_token_count': 0, 'total_first_token_secs': 0.0, 'max_first_token_secs': 0.0,
+                    'token_count': 0, 'total_generation_secs': 0.0,
+                    'follow_up_first_token_count': 0, 'total_follow_up_first_token_secs': 0.0,
+                    'prompt_eval_count': 0,
+                }
+            )
+            stats['request_count'] += 1
+            if connect_secs is not None:
+                stats['new_connection_count'] += 1
+                stats['total_connect_secs'] += connect_secs
+            if first_token_secs is not None:
+                stats['first_token_count'] += 1
+                stats['total_first_token_secs'] += first_token_secs
+                stats['max_first_token_secs'] = max(stats['max_first_token_secs'], first_token_secs)
+                # 后续轮次的首token时间反映服务端KV缓存的复用情况
+                if is_follow_up:
+                    stats['follow_up_first_token_count'] += 1
+                    stats['total_follow_up_first_token_secs'] += first_token_secs
+            if prompt_eval_count is not None:
+                stats['prompt_eval_count'] += prompt_eval_count
+            stats['token_count'] += token_count
+            stats['total_generation_secs'] += generation_secs
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.__lock:
+            result = {}
+            for model, stats in self.__model_stats.items():
+                result[model] = dict(
+                    stats,
+                    avg_connect_secs=stats['total_connect_secs'] / stats['new_connection_count']
+                    if stats['new_connection_count'] else 0.0,
+                    avg_first_token_secs=stats['total_first_token_secs'] / stats['first_token_count']
+                    if stats['first_token_count'] else 0.0,
+                    avg_follow_up_first_token_secs=stats['total_follow_up_first_token_secs'] /
+                    stats['follow_up_first_token_count'] if stats['follow_up_first_token_count'] else 0.0,
+                    tokens_per_sec=stats['token_count'] / stats['total_generation_secs']
+                    if stats['total_generation_secs'] else 0.0,
+                )
+            return result
@@ -15,25 +15,39 @@
 
 import queue
 import time
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Process, Event
 from multiprocessing.connection import Connection
-from threading import Thread
-from typing import Dict, Optional, Callable
+from threading import Thread, Lock
+from typing import Dict, Optional, Callable, List, Final
 
-from src.common.common_definition import RESPONSE_LOGIN_SUCCESS, get_llm_url
+from src.common.common_definition import RESPONSE_LOGIN_SUCCESS, RESPONSE_LOGIN_IN_PROGRESS, RECORD_DIR, get_llm_url, \
+    get_record_sessions_enabled, get_llm_max_concurrency, get_llm_context_token_budget, \
+    get_llm_shell_token_budget
+from src.common.msg_codec import send_msg, recv_msg
 from src.common.msg_code import LOGIN_RSP_CODE, LOGIN_CODE, USER_COMMAND_CODE, LLM_ASK_CODE, \
     LLM_MODEL_CHECK, SESSION_STRING_CODE, SESSION_VIEW_CONTENT_CODE, SCROLL_WINDOW_CODE, LLM_MODEL_LIST_CODE, \
     LLM_ANSWER_CODE, LLM_CHAT_HISTORY_REQ_CODE, LLM_CHAT_HISTORY_RSP_CODE, REMOVE_SESSION_CODE, REMOVE_AGENT_CODE, \
     LLM_THREAD_STOP, LLM_INLINE_MODEL_CHECK, LLM_INLINE_MODEL_LIST_CODE, LLM_INLINE_ASK_CODE, \
     LLM_LOAD_CHAT_BY_HISTORY_IDX, \
     LLM_RSP_CHAT_BY_CHAT_ID, SESSION_INACTIVE_CODE, LLM_SERVER_URL_UPDATE_CODE, RECONNECT_SHELL_FAIL_CODE, \
-    LLM_NEW_CHAT_CODE
+    LLM_NEW_CHAT_CODE, SESSION_VISIBILITY_CODE, WINDOW_VISIBILITY_CODE, RECONNECT_STATUS_CODE, \
+    BROADCAST_GROUP_CODE, BROADCAST_STATS_CODE, BATCH_COMMAND_CODE, BATCH_CANCEL_CODE, BATCH_RESULT_CODE, \
+    LLM_CANCEL_CODE
 from src.controller.llm_client import LlmClient
 from src.controller.session_document import SessionDocument
+from src.controller.sink_scheduler import SinkScheduler
+from src.model.recorder.session_recorder import RecordWriter
+from src.model.sync_ssh.batch.batch_runner import BatchCommandRunner, host_label
+from src.model.sync_ssh.io_engine.io_engine import IoEngine
 from src.model.sync_ssh.remote_agent.remote_agent import RemoteAgent
+from src.model.sync_ssh.ssh.ssh_client import XClient
 
 
 class RemoteAgentRouter:
+    # agent关闭时需要等待正在执行的阻塞操作结束，不能无限等待
+    AGENT_JOIN_TIMEOUT_SECS: Final[float] = 5.0
+
     def __init__(self):
         self.__agent_map: Dict[tuple, tuple] = {}  # agent_key: (recv_queue, agent)
         self.__session_2_agent_map: Dict[str, tuple] = {}  # session_id: (recv_queue, agent_key)
@@ -54,50 +68,99 @@ class RemoteAgentRouter:
             recv_queue, _ = item
             self.__session_2_agent_map[session_id] = (recv_queue, agent_key)
 
+    def get_agent_list(self) -> List[RemoteAgent]:
+        return [item[1] for item in self.__agent_map.values()]
+
+    def get_session_agent(self, session_id: str) -> Optional[RemoteAgent]:
+        if item := self.__session_2_agent_map.get(session_id):
+            return self.get_remote_agent(item[1])
+
+        return None
+
     def get_agent_queue(self, session_id: str) -> Optional[queue.Queue]:
         if item := self.__session_2_agent_map.get(session_id):
             return item[0]
 
         return None
 
-    def remove_session_mapping(self, session_id: str):
+    def remove_session_mapping(self, session_id: str) -> Optional[tuple]:
+        """
+        Remove the session and return the (recv_queue, agent) of its agent when no session uses the agent
+        any more. The caller closes that agent with notify_agent_close after releasing its lock.
+        """
         item = self.__session_2_agent_map.pop(session_id, None)
         if item:
             session_agent_key = item[1]
 
             for x in self.__session_2_agent_map.values():
                 if x[1] == session_agent_key:
-                    return
+                    return None
 
             # 当agent没有任何session映射时，关闭agent
-            item = self.__agent_map.get(session_agent_key)
-            if item:
-                RemoteAgentRouter.notify_agent_close(*item)
-            self.__agent_map.pop(session_agent_key, None)
-            return
+            return self.__agent_map.pop(session_agent_key, None)
+        return None
 
     def close_all_agent(self):
-        for item in self.__agent_map.values():
-            RemoteAgentRouter.notify_agent_close(*item)
+        items = list(self.__agent_map.values())
+        self.__agent_map.clear()
+        self.__session_2_agent_map.clear()
+        # 先通知所有agent，再逐个等待，总等待时间不随agent数量叠加
+        for agent_queue, _ in items:
+            RemoteAgentRouter.send_agent_close(agent_queue)
+        for _, agent in items:
+            RemoteAgentRouter.join_agent(agent)
 
     @staticmethod
     def notify_agent_close(agent_queue, agent: RemoteAgent):
+        RemoteAgentRouter.send_agent_close(agent_queue)
+        RemoteAgentRouter.join_agent(agent)
+
+    @staticmethod
+    def send_agent_close(agent_queue):
         agent_queue.put(
             {
                 'msg_code': REMOVE_AGENT_CODE,
                 'payload': {}
             }
         )
-        agent.join()
+
+    @staticmethod
+    def join_agent(agent: RemoteAgent):
+        if not agent.join(RemoteAgentRouter.AGENT_JOIN_TIMEOUT_SECS):
+            print(f'remote agent not stopped in {RemoteAgentRouter.AGENT_JOIN_TIMEOUT_SECS}s, leave it to close alone')
+
+
+class PendingLogin:
+    """A connection being established in the login pool and the login messages waiting for it."""
+
+    def __init__(self, connect_params: dict):
+        self.connect_params = connect_params
+        self.client = RemoteAgent.new_client(connect_params)
+        self.login_msgs: Dict[str, dict] = {}  # session_id: login msg
+        self.is_cancelled = False
+
+    def cancel(self):
+        # 认证阶段关闭transport可以让connect提前失败，TCP连接阶段只能等待超时
+        self.is_cancelled = True
+        self.client.close()
 
 
 class MainController(Process):
     PERIOD_SLEEP_SECS = 0.05
+    # sink queue有积压时只短暂让出CPU，否则处理能力被限制在约 20ms / 70ms
+    BACKLOG_SLEEP_SECS = 0.005
+    SINK_TIME_BUDGET_SECS = 0.02
+    SINK_STATS_LOG_INTERVAL_SECS = 10
+    LOGIN_WORKERS = 8
+    # 录像关键帧：间隔越短回放定位越快，关键帧只保留最近的历史行
+    KEYFRAME_INTERVAL_SECS = 30
+    KEYFRAME_HISTORY_LINES = 500
+    BROADCAST_STATS_INTERVAL_SECS = 1.0
 
     # 消息透传msg code 列表
     PASS_THROUGH_MSG_CODES = [
         LOGIN_RSP_CODE, LLM_MODEL_LIST_CODE, LLM_ANSWER_CODE, LLM_CHAT_HISTORY_RSP_CODE, LLM_INLINE_MODEL_LIST_CODE,
-        LLM_RSP_CHAT_BY_CHAT_ID
+        LLM_RSP_CHAT_BY_CHAT_ID, BATCH_RESULT_CODE
     ]
 
     def __init__(self, bk_side: Connection):
@@ -105,6 +168,8 @@ class MainController(Process):
         self.__bk_side = bk_side
         self.__agent_router = RemoteAgentRouter()
         self.__sink_queue = None
+        self.__sink_scheduler: Optional[SinkScheduler] = None
+        self.__last_sink_stats_log_time = 0.0
         self.__llm_query_queue = None
         self.__session_document_map: Dict[str, SessionDocument] = dict()
         self.__remote_msg_handler_method_map: Dict[int, Callable] = {
@@ -112,11 +177,32 @@ class MainController(Process):
             SESSION_STRING_CODE: self.process_session_string_msg,
             SESSION_INACTIVE_CODE: self.process_session_inactive_msg,
             RECONNECT_SHELL_FAIL_CODE: self.process_reconnect_shell_fail_msg,
+            RECONNECT_STATUS_CODE: self.process_reconnect_status_msg,
         }
         self.__front_handle_thread: Optional[Thread] = None
         self.__llm_client_thread: Optional[LlmClient] = None
+        self.__io_engine: Optional[IoEngine] = None
+        self.__login_executor: Optional[ThreadPoolExecutor] = None
+        self.__record_writer: Optional[RecordWriter] = None
+        self.__last_keyframe_times: Dict[str, float] = {}
+        # 前端消息线程与登录线程都会访问router和pending logins
+        self.__agent_router_lock = Lock()
+        self.__pending_logins: Dict[tuple, PendingLogin] = {}
         self.__proces_stop_event = Event()
 
+        # 后台标签页和最小化窗口不生成画面帧，文档仍然持续解析更新
+        self.__hidden_session_ids = set()
+        self.__is_window_visible = True
+        self.__visibility_lock = Lock()
+
+        # 广播组：组内任一session的输入会同时发送给组内所有session
+        self.__broadcast_session_ids = set()
+        self.__broadcast_lock = Lock()
+        self.__last_broadcast_stats_time = 0.0
+
+        self.__batch_runners: Dict[str, BatchCommandRunner] = {}  # batch_id: runner
+        self.__batch_runners_lock = Lock()
+
     def stop(self):
         print("set stop event for RemoteAgentsManager.")
         self.__proces_stop_event.set()
@@ -124,26 +210,45 @@ class MainController(Process):
     def run(self):
         print("RemoteAgentsManager start running.")
         self.__sink_queue = queue.Queue()
+        self.__sink_scheduler = SinkScheduler(
+            self.__sink_queue, self.dispatch_sink_msg, time_budget_secs=MainController.SINK_TIME_BUDGET_SECS
+        )
         self.__llm_query_queue = queue.Queue()
 
+        # 所有RemoteAgent共用一个IO事件循环
+        self.__io_engine = IoEngine()
+        self.__io_engine.start()
+        self.__login_executor = ThreadPoolExecutor(
+            max_workers=MainController.LOGIN_WORKERS, thread_name_prefix='login'
+        )
+        if get_record_sessions_enabled():
+            self.__record_writer = RecordWriter(RECORD_DIR)
+            self.__record_writer.start()
+
         self.__front_handle_thread = Thread(target=self.__handle_msg_from_front)
         self.__front_handle_thread.start()
 
         llm_service_url = get_llm_url()
         self.__llm_client_thread = LlmClient(
             llm_service_url=llm_service_url, query_queue=self.__llm_query_queue,
-            response_queue=self.__sink_queue
+            response_queue=self.__sink_queue, max_concurrency=get_llm_max_concurrency(),
+            context_token_budget=get_llm_context_token_budget(), shell_token_budget=get_llm_shell_token_budget()
         )
         self.__llm_client_thread.start()
 
         while not self.__proces_stop_event.is_set():
-            self.process_msg_from_sink_queue(max_read_msg_count=20)
+            self.process_msg_from_sink_queue()
 
             if view_update_contents := self.flush_view_update_contents():
                 if not self.__bk_side.closed:
-                    self.__bk_side.send(view_update_contents)
+                    send_msg(self.__bk_side, view_update_contents)
 
-            time.sleep(MainController.PERIOD_SLEEP_SECS)
+            if broadcast_stats_msg := self.build_broadcast_stats_msg():
+                if not self.__bk_side.closed:
+                    send_msg(self.__bk_side, broadcast_stats_msg)
+
+            time.sleep(MainController.BACKLOG_SLEEP_SECS if self.__sink_scheduler.pending_count() else
+                       MainController.PERIOD_SLEEP_SECS)
 
         if self.__llm_client_thread:
             self.__llm_query_queue.put({'msg_code': LLM_THREAD_STOP, 'payload': {}})
@@ -155,20 +260,39 @@ class MainController(Process):
         if self.__bk_side and not self.__bk_side.closed:
             self.__bk_side.close()
 
+        with self.__agent_router_lock:
+            for pending_login in self.__pending_logins.values():
+                pending_login.cancel()
+            self.__pending_logins.clear()
+        self.__login_executor.shutdown(wait=False, cancel_futures=True)
+
+        with self.__batch_runners_lock:
+            for runner in self.__batch_runners.values():
+                runner.cancel()
+
         self.__agent_router.close_all_agent()
+        self.__io_engine.stop()
+        if self.__record_writer:
+            self.__record_writer.stop()
         print("MainController stop success.")
 
-    def process_msg_from_sink_queue(self, max_read_msg_count: int):
-        msg_count = 0
-        while not self.__sink_queue.empty() and msg_count < max_read_msg_count:
-            try:
-                msg = self.__sink_queue.get_nowait()
-            except Exception as e:
-                break
-            msg_count += 1
-            view_update_msg = self.process_session_remote_msg(msg)
-            if view_update_msg and not self.__bk_side.closed:
-                self.__bk_side.send(view_update_msg)
+    def process_msg_from_sink_queue(self):
+        self.__sink_scheduler.run_tick()
+
+        # 有积压时周期性打印各lane的队列深度和处理耗时
+        now = time.monotonic()
+        if self.__sink_scheduler.pending_count() and \
+                now - self.__last_sink_stats_log_time >= MainController.SINK_STATS_LOG_INTERVAL_SECS:
+            self.__last_sink_stats_log_time = now
+            print(f'sink queue backlog: {self.get_sink_stats()}')
+
+    def get_sink_stats(self) -> Dict[str, dict]:
+        return self.__sink_scheduler.stats() if self.__sink_scheduler else {}
+
+    def dispatch_sink_msg(self, msg: dict):
+        view_update_msg = self.process_session_remote_msg(msg)
+        if view_update_msg and not self.__bk_side.closed:
+            send_msg(self.__bk_side, view_update_msg)
 
     def process_session_remote_msg(self, msg: dict) -> dict | None:
         msg_code = msg.get('msg_code')
@@ -199,6 +323,17 @@ class MainController(Process):
             session_id = session_msg.get('session_id')
             if session_document := self.__session_document_map.get(session_id):
                 session_document.handle_msgs(session_msg.get('inner_msgs', []))
+                if (record_offset := session_msg.get('record_offset')) is not None:
+                    self.record_keyframe_if_due(session_id, session_document, record_offset)
+
+    def record_keyframe_if_due(self, session_id: str, session_document: SessionDocument, record_offset: int):
+        now = time.monotonic()
+        if now - self.__last_keyframe_times.get(session_id, 0.0) < MainController.KEYFRAME_INTERVAL_SECS:
+            return
+        self.__last_keyframe_times[session_id] = now
+        # sink线程只复制文档，编码和压缩在RecordWriter线程中进行
+        keyframe_document = session_document.keyframe_copy(MainController.KEYFRAME_HISTORY_LINES)
+        self.__record_writer.add_keyframe(session_id, record_offset, keyframe_document)
 
     def process_session_inactive_msg(self, msg: dict) -> None:
         payload = msg.get('payload', {})
@@ -214,9 +349,26 @@ class MainController(Process):
                 'reconnect shell failed. Please check network or server status, and Press \'r\' to retry.'
             )
 
+    def process_reconnect_status_msg(self, msg: dict) -> None:
+        payload = msg.get('payload', {})
+        session_id = payload.get('session_id')
+        content = payload.get('content', {})
+        if session_document := self.__session_document_map.get(session_id):
+            delay_secs = content.get('delay_secs', 0)
+            session_document.insert_session_status_msg(
+                f'reconnecting (attempt {content.get("attempt")})' + (f' in {delay_secs}s...' if delay_secs else '...')
+            )
+
+    def is_session_visible(self, session_id: str) -> bool:
+        with self.__visibility_lock:
+            return self.__is_window_visible and session_id not in self.__hidden_session_ids
+
     def flush_view_update_contents(self) -> dict:
         update_view_contents = []
         for session_id, session_document in self.__session_document_map.items():
+            if not self.is_session_visible(session_id):
+                continue
+
             if current_content := session_document.view_area_content:
                 view_area_max_row = session_document.get_max_row()
                 update_view_contents.append(
@@ -244,7 +396,7 @@ class MainController(Process):
     def __handle_msg_from_front(self):
         while True:
             try:
-                msg = self.__bk_side.recv()
+                msg = recv_msg(self.__bk_side)
             except (EOFError, OSError, ValueError):
                 print('Front connection closed, stop handling messages from front.')
                 break
@@ -267,9 +419,29 @@ class MainController(Process):
                 self.process_scroll_window(msg)
                 continue
 
+            if msg_code == SESSION_VISIBILITY_CODE:
+                self.process_session_visibility(msg)
+                continue
+
+            if msg_code == WINDOW_VISIBILITY_CODE:
+                self.process_window_visibility(msg)
+                continue
+
+            if msg_code == BROADCAST_GROUP_CODE:
+                self.process_broadcast_group(msg)
+                continue
+
+            if msg_code == BATCH_COMMAND_CODE:
+                self.process_batch_command(msg)
+                continue
+
+            if msg_code == BATCH_CANCEL_CODE:
+                self.process_batch_cancel(msg)
+                continue
+
             if msg_code in [LLM_ASK_CODE, LLM_MODEL_CHECK, LLM_CHAT_HISTORY_REQ_CODE, LLM_INLINE_MODEL_CHECK,
                             LLM_INLINE_ASK_CODE, LLM_LOAD_CHAT_BY_HISTORY_IDX, LLM_SERVER_URL_UPDATE_CODE,
-                            LLM_NEW_CHAT_CODE]:
+                            LLM_NEW_CHAT_CODE, LLM_CANCEL_CODE]:
                 self.__llm_query_queue.put(msg)
                 continue
 
@@ -280,6 +452,30 @@ class MainController(Process):
         if session_document := self.__session_document_map.get(session_id):
             session_document.add_ui_scroll_req(scroll_req)
 
+    def process_session_visibility(self, msg: dict):
+        payload = msg.get('payload', {})
+        session_id = payload.get('session_id')
+        is_visible = payload.get('content', {}).get('visible', True)
+        with self.__visibility_lock:
+            if not is_visible:
+                self.__hidden_session_ids.add(session_id)
+                return
+            self.__hidden_session_ids.discard(session_id)
+
+        if session_document := self.__session_document_map.get(session_id):
+            session_document.request_full_view_update()
+
+    def process_window_visibility(self, msg: dict):
+        is_visible = msg.get('payload', {}).get('content', {}).get('visible', True)
+        with self.__visibility_lock:
+            self.__is_window_visible = is_visible
+        if not is_visible:
+            return
+
+        for session_id, session_document in list(self.__session_document_map.items()):
+            if self.is_session_visible(session_id):
+                session_document.request_full_view_update()
+
     def process_login_msg(self, msg: dict):
         # print(f'process login msg')
         login_content = msg.get('payload').get('content', {})
@@ -292,52 +488,245 @@ class MainController(Process):
             login_content.get('password', ''),
         )
 
-        remote_agent = self.__agent_router.get_remote_agent(agent_key)
-        if not remote_agent:
-            self.start_new_remote_agent(login_content, agent_key, session_id)
-        else:
-            self.__agent_router.map_session_id_2_agent_queue(agent_key, session_id)
-
-        if agent_recv_queue := self.__agent_router.get_agent_queue(session_id):
-            agent_recv_queue.put(msg)
+        with self.__agent_router_lock:
+            if self.__agent_router.get_remote_agent(agent_key):
+                self.report_login_progress(session_id, 'opening shell')
+                self.__agent_router.map_session_id_2_agent_queue(agent_key, session_id)
+                self.__agent_router.get_agent_queue(session_id).put(msg)
+            elif pending_login := self.__pending_logins.get(agent_key):
+                # 同一主机的连接正在建立，等待其完成后共用
+                self.report_login_progress(session_id, 'waiting for connection')
+                pending_login.login_msgs[session_id] = msg
+            else:
+                self.report_login_progress(session_id, 'connecting')
+                self.start_new_remote_agent(login_content, agent_key, session_id, msg)
+
+    def report_login_progress(self, session_id: str, stage: str):
+        self.__sink_queue.put(
+            {
+                'msg_code': LOGIN_RSP_CODE,
+                'payload': {
+                    'session_id': session_id,
+                    'content': {'result': RESPONSE_LOGIN_IN_PROGRESS, 'stage': stage},
+                }
+            }
+        )
 
-    def start_new_remote_agent(self, login_content, agent_key, session_id):
+    def start_new_remote_agent(self, login_content, agent_key, session_id, msg):
         connect_params = {
             'hostname': login_content.get('hostname'),
             'port': login_content.get('port', 22),
             'username': login_content.get('username'),
             'password': login_content.get('password', ''),
         }
-        client, result = RemoteAgent.get_client(connect_params)
-        if client is None:
+        if login_content.get('local'):
+            # 本地终端只需要启动shell，不需要登录参数
+            connect_params = {'hostname': login_content.get('hostname'), 'local': True}
+        pending_login = PendingLogin(connect_params)
+        pending_login.login_msgs[session_id] = msg
+        self.__pending_logins[agent_key] = pending_login
+        self.__login_executor.submit(self.connect_remote_agent, agent_key, pending_login)
+
+    def connect_remote_agent(self, agent_key: tuple, pending_login: PendingLogin):
+        # 在登录线程池中执行，不阻塞前端消息线程
+        client, result = RemoteAgent.get_client(pending_login.connect_params, pending_login.client)
+
+        with self.__agent_router_lock:
+            if self.__pending_logins.get(agent_key) is pending_login:
+                self.__pending_logins.pop(agent_key)
+
+            if pending_login.is_cancelled or not pending_login.login_msgs:
+                if client:
+                    client.close()
+                return
+
+            if client is None:
+                for session_id in pending_login.login_msgs:
+                    self.__sink_queue.put(
+                        {
+                            'msg_code': LOGIN_RSP_CODE,
+                            'payload': {
+                                'session_id': session_id,
+                                'content': {'result': result},
+                            }
+                        }
+                    )
+                return
+
+            remote_agent = RemoteAgent(client, self.__sink_queue, self.__io_engine, self.__record_writer)
+            recv_queue = remote_agent.get_recv_queue()
+            for session_id, msg in pending_login.login_msgs.items():
+                self.report_login_progress(session_id, 'opening shell')
+                self.__agent_router.add_agent(agent_key, session_id, recv_queue, remote_agent)
+                recv_queue.put(msg)
+            remote_agent.start()
+
+    def cancel_pending_login(self, session_id: str):
+        for agent_key, pending_login in list(self.__pending_logins.items()):
+            if pending_login.login_msgs.pop(session_id, None) is None:
+                continue
+            if not pending_login.login_msgs:
+                self.__pending_logins.pop(agent_key)
+                pending_login.cancel()
+            return
+
+    def process_broadcast_group(self, msg: dict):
+        session_ids = msg.get('payload', {}).get('content', {}).get('session_ids', [])
+        with self.__broadcast_lock:
+            self.__broadcast_session_ids = set(session_ids)
+
+    def get_broadcast_targets(self, session_id: str) -> list:
+        with self.__broadcast_lock:
+            if session_id not in self.__broadcast_session_ids:
+                return [session_id]
+            return sorted(self.__broadcast_session_ids)
+
+    def process_user_command(self, msg: dict):
+        payload = msg.get('payload', {})
+        session_id = payload.get('session_id')
+        content = payload.get('content', {})
+        target_session_ids = self.get_broadcast_targets(session_id)
+        if len(target_session_ids) > 1 and 'command' in content:
+            # 每个目标agent在自己的发送通道中写channel，不同transport之间并行发送
+            broadcast_time = time.perf_counter()
+            target_msgs = [
+                {
+                    'msg_code': USER_COMMAND_CODE,
+                    'payload': {
+                        'session_id': target_session_id,
+                        'content': dict(content, broadcast_time=broadcast_time)
+                    }
+                } for target_session_id in target_session_ids
+            ]
+        else:
+            target_msgs = [msg]
+
+        for target_msg in target_msgs:
+            target_session_id = target_msg['payload']['session_id']
+            with self.__agent_router_lock:
+                agent_recv_queue = self.__agent_router.get_agent_queue(target_session_id)
+            if agent_recv_queue:
+                agent_recv_queue.put(target_msg)
+            if 'command' in content:
+                self.__sink_scheduler.mark_interactive(target_session_id)
+                if session_document := self.__session_document_map.get(target_session_id):
+                    session_document.set_stick_to_bottom(True)
+
+    def find_pooled_client(self, connect_params: dict) -> Optional[XClient]:
+        # 已登录的主机直接复用其transport，exec channel与交互shell共用连接
+        with self.__agent_router_lock:
+            agents = self.__agent_router.get_agent_list()
+        for agent in agents:
+            client = agent.get_current_client()
+            if isinstance(client, XClient) and client.is_active() and \
+                    host_label(client.get_connect_params()) == host_label(connect_params):
+                return client
+        return None
+
+    def get_connected_host_params(self) -> List[dict]:
+        with self.__agent_router_lock:
+            agents = self.__agent_router.get_agent_list()
+        return [
+            agent.get_current_client().get_connect_params() for agent in agents
+            if isinstance(agent.get_current_client(), XClient) and agent.is_active()
+        ]
+
+    def process_batch_command(self, msg: dict):
+        content = msg.get('payload', {}).get('content', {})
+        batch_id = content.get('batch_id')
+        connect_params_list = list(content.get('hosts', []))
+        if content.get('connected_hosts'):
+            connect_params_list += self.get_connected_host_params()
+
+        # 同一主机只执行一次
+        host_params = {}
+        for connect_params in connect_params_list:
+            host_params.setdefault(host_label(connect_params), connect_params)
+
+        def on_result(row: dict):
             self.__sink_queue.put(
                 {
-                    'msg_code': LOGIN_RSP_CODE,
+                    'msg_code': BATCH_RESULT_CODE,
                     'payload': {
-                        'session_id': session_id,
-                        'content': {'result': result},
+                        'content': {'batch_id': batch_id, 'host_count': len(host_params), 'row': row}
                     }
                 }
             )
+
+        if not host_params:
+            self.__sink_queue.put(
+                {
+                    'msg_code': BATCH_RESULT_CODE,
+                    'payload': {'content': {'batch_id': batch_id, 'host_count': 0, 'row': None}}
+                }
+            )
             return
 
-        recv_queue = queue.Queue()
-        remote_agent = RemoteAgent(client, recv_queue, self.__sink_queue)
-        self.__agent_router.add_agent(agent_key, session_id, recv_queue, remote_agent)
-        remote_agent.start()
+        runner = BatchCommandRunner(
+            content.get('command', ''), list(host_params.values()), on_result=on_result,
+            client_provider=self.find_pooled_client,
+            max_concurrency=content.get('max_concurrency', BatchCommandRunner.DEFAULT_MAX_CONCURRENCY),
+            timeout_secs=content.get('timeout_secs', BatchCommandRunner.DEFAULT_TIMEOUT_SECS)
+        )
+        with self.__batch_runners_lock:
+            for finished_batch_id in [x for x, r in self.__batch_runners.items() if not r.is_alive()]:
+                self.__batch_runners.pop(finished_batch_id)
+            self.__batch_runners[batch_id] = runner
+        runner.start()
+
+    def process_batch_cancel(self, msg: dict):
+        batch_id = msg.get('payload', {}).get('content', {}).get('batch_id')
+        with self.__batch_runners_lock:
+            if runner := self.__batch_runners.pop(batch_id, None):
+                runner.cancel()
+
+    def build_broadcast_stats_msg(self) -> dict | None:
+        now = time.monotonic()
+        if now - self.__last_broadcast_stats_time < MainController.BROADCAST_STATS_INTERVAL_SECS:
+            return None
+        self.__last_broadcast_stats_time = now
+
+        with self.__broadcast_lock:
+            session_ids = list(self.__broadcast_session_ids)
+        if not session_ids:
+            return None
+
+        targets = {}
+        with self.__agent_router_lock:
+            agents = {session_id: self.__agent_router.get_session_agent(session_id) for session_id in session_ids}
+        for session_id, agent in agents.items():
+            if agent is None:
+                continue
+            if stats := agent.get_send_latency_stats().get(session_id):
+                targets[session_id] = {
+                    'count': stats['count'],
+                    'last_ms': stats['last_secs'] * 1000,
+                    'avg_ms': stats['total_secs'] / stats['count'] * 1000,
+                    'max_ms': stats['max_secs'] * 1000,
+                }
 
-    def process_user_command(self, msg: dict):
-        session_id = msg.get('payload', {}).get('session_id')
-        if agent_recv_queue := self.__agent_router.get_agent_queue(session_id):
-            agent_recv_queue.put(msg)
-        content = msg.get('payload', {}).get('content', {})
-        if 'command' in content:
-            if session_document := self.__session_document_map.get(session_id):
-                session_document.set_stick_to_bottom(True)
+        return {
+            'msg_code': BROADCAST_STATS_CODE,
+            'payload': {'content': {'targets': targets}}
+        } if targets else None
 
     def remove_session(self, msg: dict):
         session_id = msg.get('payload', {}).get('session_id')
-        if agent_recv_queue := self.__agent_router.get_agent_queue(session_id):
-            agent_recv_queue.put(msg)
-
-        self.__agent_router.remove_session_mapping(session_id)
+        with self.__agent_router_lock:
+            self.cancel_pending_login(session_id)
+            if agent_recv_queue := self.__agent_router.get_agent_queue(session_id):
+                agent_recv_queue.put(msg)
+
+            closed_agent_item = self.__agent_router.remove_session_mapping(session_id)
+        # 在锁外等待agent结束，避免其它线程的登录、按键转发等待agent关闭
+        if closed_agent_item:
+            RemoteAgentRouter.notify_agent_close(*closed_agent_item)
+        self.__sink_scheduler.remove_session(session_id)
+        # LLM客户端清理该session的回答、对话记录和模型列表订阅
+        if self.__llm_query_queue:
+            self.__llm_query_queue.put(msg)
+        self.__last_keyframe_times.pop(session_id, None)
+        with self.__broadcast_lock:
+            self.__broadcast_session_ids.discard(session_id)
+        with self.__visibility_lock:
+            self.__hidden_session_ids.discard(session_id)
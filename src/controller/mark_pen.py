@@ -21,8 +21,18 @@ CharCell = namedtuple('CharCell', ['style', 'char'])
 
 
 class MarkPen:
-    def __init__(self):
-        self.__font_style = FontStyle()
+    def __init__(self, font_style: FontStyle = None):
+        self.__font_style = font_style or FontStyle()
+
+    def copy(self) -> 'MarkPen':
+        return MarkPen(FontStyle.from_dict(self.__font_style.to_dict()))
+
+    def to_dict(self) -> dict:
+        return self.__font_style.to_dict()
+
+    @staticmethod
+    def from_dict(style_dict: dict) -> 'MarkPen':
+        return MarkPen(FontStyle.from_dict(style_dict))
 
     def render(self, text: str) -> List[CharCell | str]:
         return [CharCell(style=self.__font_style.style, char=char) for char in text]
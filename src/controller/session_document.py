@@ -16,6 +16,7 @@
 import threading
 from typing import List, Dict, Callable, Tuple, Final
 
+from src.common.font_style import FontStyle, StyleTuple
 from src.common.msg_code import InnerMsgCode
 from src.controller.mark_pen import MarkPen
 from src.controller.text_line import SessionTextLine
@@ -71,6 +72,74 @@ class SessionDocument:
             InnerMsgCode.DEC_SET_CODE: self.handle_dec_set
         }
 
+    def keyframe_copy(self, history_line_count: int) -> 'SessionDocument':
+        """
+        Copy for a recording keyframe that keeps only the last history_line_count history lines.
+
+        Lines and pen are copied, so the copy can be encoded on the record writer thread while this
+        document keeps changing. Copying only duplicates the cell lists, which is far cheaper than encoding.
+        """
+        document = SessionDocument(self.__MAX_ROW)
+        document.__row_pos = self.__row_pos
+        document.__lines = [line.copy() for line in self.__lines]
+        history_lines = self.__history_lines[-history_line_count:] if history_line_count > 0 else []
+        document.__history_lines = [line.copy() for line in history_lines]
+        document.__backup_cursor_position = self.__backup_cursor_position
+        document.__scrolling_region = self.__scrolling_region
+        document.__is_alternate_screen_buffer_on = self.__is_alternate_screen_buffer_on
+        document.__push_lines_to_history_before_2J = self.__push_lines_to_history_before_2J
+        document.__pen = self.__pen.copy()
+        document.__content_changed = self.__content_changed
+        document.stick_to_bottom = self.stick_to_bottom
+        # 行号从最早的历史行算起，省略的历史行不再计入，向上滚动的视图仍指向相同的行
+        dropped_line_count = len(self.__history_lines) - len(history_lines)
+        document.window_bottom_line_number = max(self.window_bottom_line_number - dropped_line_count, self.__MAX_ROW)
+        return document
+
+    def keyframe_state(self) -> dict:
+        """JSON-ready state of the document for a recording keyframe, restored by from_keyframe_state."""
+        style_indexes: Dict[StyleTuple, int] = {}
+
+        def style_index(style: StyleTuple) -> int:
+            return style_indexes.setdefault(style, len(style_indexes))
+
+        lines = [line.to_state(style_index) for line in self.__lines]
+        history_lines = [line.to_state(style_index) for line in self.__history_lines]
+        return {
+            'max_row': self.__MAX_ROW,
+            'row_pos': self.__row_pos,
+            'backup_cursor_position': self.__backup_cursor_position,
+            'scrolling_region': self.__scrolling_region,
+            'is_alternate_screen_buffer_on': self.__is_alternate_screen_buffer_on,
+            'push_lines_to_history_before_2J': self.__push_lines_to_history_before_2J,
+            'stick_to_bottom': self.stick_to_bottom,
+            'window_bottom_line_number': self.window_bottom_line_number,
+            'pen': self.__pen.to_dict(),
+            'styles': [style.to_dict() for style in style_indexes],
+            'lines': lines,
+            'history_lines': history_lines,
+        }
+
+    @staticmethod
+    def from_keyframe_state(state: dict) -> 'SessionDocument':
+        document = SessionDocument(state['max_row'])
+        styles = [FontStyle.shared_style(style_dict) for style_dict in state['styles']]
+        document.__row_pos = state['row_pos']
+        # JSON中的元组变为列表
+        document.__backup_cursor_position = tuple(state['backup_cursor_position']) \
+            if state['backup_cursor_position'] else None
+        document.__scrolling_region = tuple(state['scrolling_region']) if state['scrolling_region'] else None
+        document.__is_alternate_screen_buffer_on = state['is_alternate_screen_buffer_on']
+        document.__push_lines_to_history_before_2J = state['push_lines_to_history_before_2J']
+        document.stick_to_bottom = state['stick_to_bottom']
+        document.window_bottom_line_number = state['window_bottom_line_number']
+        document.__pen = MarkPen.from_dict(state['pen'])
+        document.__lines = [SessionTextLine.from_state(line, styles) for line in state['lines']]
+        document.__history_lines = [SessionTextLine.from_state(line, styles) for line in state['history_lines']]
+        # 恢复的内容尚未显示过
+        document.__content_changed = True
+        return document
+
     def get_max_row(self) -> int:
         return self.__MAX_ROW
 
@@ -101,10 +170,20 @@ class SessionDocument:
         if inner_msgs:
             self.__content_changed = True
 
+    def request_full_view_update(self):
+        # 会话从后台切回前台时，即使内容未变也需要重新推送一帧完整画面
+        self.__content_changed = True
+
     def insert_session_fail_msg(self, msg: str):
+        self.__insert_session_notice(msg, '31;1')
+
+    def insert_session_status_msg(self, msg: str):
+        self.__insert_session_notice(msg, '33;1')
+
+    def __insert_session_notice(self, msg: str, font_style: str):
         self.move_to_start_of_next_line()
         self.handle_font_style('0')
-        self.handle_font_style('31;1')
+        self.handle_font_style(font_style)
         self.insert_plain_string(msg)
         self.handle_font_style('0')
         self.move_to_start_of_next_line()
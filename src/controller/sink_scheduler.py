@@ -0,0 +1,221 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import queue
+import time
+from collections import deque
+from typing import Dict, Callable, Final, List
+
+from src.common.msg_code import SESSION_STRING_CODE, LLM_ANSWER_CODE, LLM_MODEL_LIST_CODE, \
+    LLM_CHAT_HISTORY_RSP_CODE, LLM_INLINE_MODEL_LIST_CODE, LLM_RSP_CHAT_BY_CHAT_ID
+
+
+class SinkScheduler:
+    """
+    Fair scheduler for the messages in MainController's sink queue.
+
+    Messages are moved from the shared sink queue into one lane per session (SESSION_STRING payloads
+    are split per session), one lane for LLM messages and one lane for messages without a session.
+    Each tick serves the lanes in weighted deficit round-robin order until the queue is empty or the
+    CPU time budget is spent: every round a lane earns weight * QUANTUM_SECS of processing time and
+    keeps the overdraft of a message that took longer. Sharing time rather than message count keeps a
+    session whose messages are large from starving one that sends many small ones. The LLM lane and
+    sessions the user typed into recently get a larger weight. Messages that arrive for a removed
+    session are dropped instead of creating its lane again.
+    """
+    CONTROL_LANE: Final[str] = '__control__'
+    LLM_LANE: Final[str] = '__llm__'
+
+    LLM_MSG_CODES: Final[frozenset] = frozenset(
+        [LLM_ANSWER_CODE, LLM_MODEL_LIST_CODE, LLM_CHAT_HISTORY_RSP_CODE, LLM_INLINE_MODEL_LIST_CODE,
+         LLM_RSP_CHAT_BY_CHAT_ID]
+    )
+
+    DEFAULT_WEIGHT: Final[int] = 1
+    INTERACTIVE_WEIGHT: Final[int] = 4
+    LLM_WEIGHT: Final[int] = 8
+    # 每轮每单位权重可用的处理时间
+    QUANTUM_SECS: Final[float] = 0.002
+
+    # 用户按键后多长时间内该session视为交互中
+    INTERACTIVE_HOLD_SECS: Final[float] = 1.0
+    # 单个tick最多从sink queue搬运的消息数，防止生产者过快时一直停留在搬运阶段
+    MAX_PULL_COUNT: Final[int] = 4096
+
+    def __init__(self, sink_queue: queue.Queue, msg_handler: Callable[[dict], None], time_budget_secs: float = 0.02):
+        self.__sink_queue = sink_queue
+        self.__msg_handler = msg_handler
+        self.__time_budget_secs = time_budget_secs
+
+        self.__lanes: Dict[str, deque] = {self.CONTROL_LANE: deque(), self.LLM_LANE: deque()}
+        self.__session_ring: deque = deque()  # round-robin order of session lanes
+        self.__deficits: Dict[str, float] = {}  # lane_key: 本轮剩余的处理时间，可为负
+        self.__interactive_until: Dict[str, float] = {}  # session_id: monotonic deadline
+        self.__removed_session_ids: deque = deque()  # 由前端线程写入，在调度线程中清理
+        # 已清理的session，只在调度线程中访问；session_id为uuid，不会被新session复用
+        self.__closed_session_ids: set = set()
+        self.__dropped_late_count = 0
+
+        self.__processed_counts: Dict[str, int] = {}
+        self.__processing_secs: Dict[str, float] = {}
+
+    def mark_interactive(self, session_id: str):
+        # 由前端消息线程调用，单次字典赋值即可
+        self.__interactive_until[session_id] = time.monotonic() + self.INTERACTIVE_HOLD_SECS
+
+    def is_interactive(self, session_id: str) -> bool:
+        return self.__interactive_until.get(session_id, 0.0) > time.monotonic()
+
+    def remove_session(self, session_id: str):
+        self.__removed_session_ids.append(session_id)
+
+    def pending_count(self) -> int:
+        return sum(len(lane) for lane in self.__lanes.values())
+
+    def stats(self) -> Dict[str, dict]:
+        """Per lane queue depth, processed message count and accumulated processing time."""
+        lane_keys = set(self.__lanes) | set(self.__processed_counts)
+        return {
+            lane_key: {
+                'queue_depth': len(self.__lanes.get(lane_key, ())),
+                'processed_count': self.__processed_counts.get(lane_key, 0),
+                'processing_secs': self.__processing_secs.get(lane_key, 0.0),
+            }
+            for lane_key in lane_keys
+        }
+
+    def dropped_late_count(self) -> int:
+        """Number of messages dropped because their session was already removed."""
+        return self.__dropped_late_count
+
+    def pull(self) -> int:
+        pulled_count = 0
+        while pulled_count < self.MAX_PULL_COUNT:
+            try:
+                msg = self.__sink_queue.get_nowait()
+            except queue.Empty:
+                break
+            pulled_count += 1
+            self.__dispatch_to_lane(msg)
+        return pulled_count
+
+    def run_tick(self) -> int:
+        self.__drop_removed_sessions()
+        self.pull()
+
+        deadline = time.perf_counter() + self.__time_budget_secs
+        processed_count = 0
+        while True:
+            lane_keys = self.__lane_keys_of_round()
+            if not lane_keys:
+                return processed_count
+
+            for lane_key in lane_keys:
+                lane = self.__lanes[lane_key]
+                if lane_key == self.CONTROL_LANE:
+                    # 控制消息很少且处理很快，全部处理
+                    deficit = float('inf')
+                else:
+                    deficit = self.__deficits.get(lane_key, 0.0) + self.__lane_weight(lane_key) * self.QUANTUM_SECS
+                while lane and deficit > 0:
+                    deficit -= self.__process(lane_key, lane.popleft())
+                    processed_count += 1
+                    # 至少处理一条消息，避免预算过小时饿死所有lane
+                    if time.perf_counter() >= deadline:
+                        self.__save_deficit(lane_key, lane, deficit)
+                        return processed_count
+                self.__save_deficit(lane_key, lane, deficit)
+
+    def __save_deficit(self, lane_key: str, lane: deque, deficit: float):
+        if lane_key == self.CONTROL_LANE:
+            return
+        # lane清空后不保留剩余时间，否则空闲的session积攒额度后会长时间占用处理时间
+        self.__deficits[lane_key] = deficit if lane else min(deficit, 0.0)
+
+    def __drop_removed_sessions(self):
+        while self.__removed_session_ids:
+            session_id = self.__removed_session_ids.popleft()
+            self.__closed_session_ids.add(session_id)
+            self.__interactive_until.pop(session_id, None)
+            self.__processed_counts.pop(session_id, None)
+            self.__processing_secs.pop(session_id, None)
+            self.__deficits.pop(session_id, None)
+            if self.__lanes.pop(session_id, None) is not None:
+                self.__session_ring.remove(session_id)
+
+    def __dispatch_to_lane(self, msg: dict):
+        msg_code = msg.get('msg_code')
+        if msg_code in self.LLM_MSG_CODES:
+            self.__lanes[self.LLM_LANE].append(msg)
+            return
+
+        payload = msg.get('payload')
+        if msg_code == SESSION_STRING_CODE:
+            for session_msg in payload:
+                self.__append_to_session_lane(
+                    session_msg.get('session_id'), {'msg_code': SESSION_STRING_CODE, 'payload': [session_msg]}
+                )
+            return
+
+        # 带session_id的控制消息与该session的输出放在同一lane，保证顺序
+        session_id = payload.get('session_id') if isinstance(payload, dict) else None
+        if session_id is None:
+            self.__lanes[self.CONTROL_LANE].append(msg)
+        else:
+            self.__append_to_session_lane(session_id, msg)
+
+    def __append_to_session_lane(self, session_id: str, msg: dict):
+        lane = self.__lanes.get(session_id)
+        if lane is None:
+            if session_id in self.__closed_session_ids:
+                # agent在session移除后仍可能送来输出或状态消息，丢弃以免重新创建lane
+                self.__dropped_late_count += 1
+                return
+            lane = self.__lanes[session_id] = deque()
+            self.__session_ring.append(session_id)
+        lane.append(msg)
+
+    def __lane_keys_of_round(self) -> List[str]:
+        # 每轮旋转一次，预算耗尽时下一个tick从其它session开始
+        self.__session_ring.rotate(-1)
+
+        interactive_keys = []
+        other_keys = []
+        for session_id in self.__session_ring:
+            if self.__lanes[session_id]:
+                (interactive_keys if self.is_interactive(session_id) else other_keys).append(session_id)
+
+        return [
+            lane_key for lane_key in (self.CONTROL_LANE, self.LLM_LANE) if self.__lanes[lane_key]
+        ] + interactive_keys + other_keys
+
+    def __lane_weight(self, lane_key: str) -> int:
+        if lane_key == self.CONTROL_LANE:
+            return len(self.__lanes[lane_key])
+        if lane_key == self.LLM_LANE:
+            return self.LLM_WEIGHT
+        if self.is_interactive(lane_key):
+            return self.INTERACTIVE_WEIGHT
+        return self.DEFAULT_WEIGHT
+
+    def __process(self, lane_key: str, msg: dict) -> float:
+        begin = time.perf_counter()
+        try:
+            self.__msg_handler(msg)
+        finally:
+            elapsed_secs = time.perf_counter() - begin
+            self.__processed_counts[lane_key] = self.__processed_counts.get(lane_key, 0) + 1
+            self.__processing_secs[lane_key] = self.__processing_secs.get(lane_key, 0.0) + elapsed_secs
+        return elapsed_secs
@@ -13,9 +13,9 @@
 # limitations under the License.
 
 
-from typing import List, Union
+from typing import Callable, List, Union
 
-from src.common.font_style import FontStyle
+from src.common.font_style import FontStyle, StyleTuple
 from src.controller.mark_pen import CharCell
 
 
@@ -40,7 +40,35 @@ class SessionTextLine:
             else:
                 result.append({'style': current_style, 'chars': [current_char]})
 
-        return [{'style': x['style'], 'text': ''.join(x['chars'])} for x in result]
+        # 每个片段为 (style, text) 元组，减少跨进程传输时的dict构造开销
+        return [(x['style'], ''.join(x['chars'])) for x in result]
+
+    def copy(self) -> 'SessionTextLine':
+        text_line = SessionTextLine()
+        text_line.__write_pos = self.__write_pos
+        text_line.__cells = self.__cells.copy()
+        return text_line
+
+    def to_state(self, style_index: Callable[[StyleTuple], int]) -> list:
+        """[write_pos, [[style index, text], ...]]: consecutive cells of the same style form one run."""
+        runs = []
+        for cell in self.__cells[: SessionTextLine.END_POS]:
+            index = style_index(cell.style)
+            if runs and runs[-1][0] == index:
+                runs[-1][1].append(cell.char)
+            else:
+                runs.append([index, [cell.char]])
+        return [self.__write_pos, [[index, ''.join(chars)] for index, chars in runs]]
+
+    @staticmethod
+    def from_state(state: list, styles: List[StyleTuple]) -> 'SessionTextLine':
+        write_pos, runs = state
+        text_line = SessionTextLine()
+        # 每个CharCell只有一个字符，按字符拆分即可还原
+        text_line.__cells = [CharCell(style=styles[index], char=char) for index, text in runs for char in text]
+        text_line.__cells.append(SessionTextLine.END_MARK)
+        text_line.__write_pos = write_pos
+        return text_line
 
     def write(self, chars: List[Union[str, CharCell]], pos_move=True):
         write_len = len(chars)
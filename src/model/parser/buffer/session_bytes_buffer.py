@@ -60,6 +60,10 @@ class SessionBytesBuffer:
         self.keyboard_app_mode_on = False
         self.decoder = codecs.getincrementaldecoder("utf-8")(errors='replace')
 
+    def pending_byte_count(self) -> int:
+        """Bytes received but not turned into messages yet: an incomplete sequence or a partial utf-8 character."""
+        return len(self.buffer) + len(self.decoder.getstate()[0])
+
     def parse(self, income_bytes: bytes, last_send_bytes: bytes):
         self.buffer += income_bytes
 
@@ -0,0 +1,230 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import json
+import os
+import queue
+import re
+import struct
+import time
+import zlib
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Dict, Final, Iterator, List, NamedTuple, Optional, BinaryIO
+
+# 每个session的一次录像由两个文件组成:
+#   <name>.chunks    : 文件头 + 输出字节块记录 (timestamp, stream_offset, length) + bytes
+#   <name>.keyframes : 关键帧记录 (timestamp, stream_offset, length) + zlib(json(SessionDocument.keyframe_state()))
+# stream_offset 为该session输出字节流中的位置，回放时从关键帧所在位置继续解析
+CHUNKS_SUFFIX = '.chunks'
+KEYFRAMES_SUFFIX = '.keyframes'
+FILE_MAGIC = b'IREC'
+FILE_VERSION = 2
+
+_FILE_HEADER = struct.Struct('<4sBdH')  # magic, version, start time, page line count
+_RECORD_HEADER = struct.Struct('<dQI')  # timestamp, stream offset, length
+
+_OP_OPEN = 0
+_OP_CHUNK = 1
+_OP_KEYFRAME = 2
+_OP_CLOSE = 3
+_OP_STOP = 4
+
+
+class RecordHeader(NamedTuple):
+    start_time: float
+    page_line_count: int
+
+
+class KeyframeIndex(NamedTuple):
+    timestamp: float
+    stream_offset: int
+    file_pos: int
+    length: int
+
+
+def iter_records(f: BinaryIO, with_data: bool = True) -> Iterator[tuple]:
+    """Yield (timestamp, stream_offset, file_pos, length, data) for each record; data is None when not read."""
+    while header := f.read(_RECORD_HEADER.size):
+        if len(header) < _RECORD_HEADER.size:
+            return
+        timestamp, stream_offset, length = _RECORD_HEADER.unpack(header)
+        file_pos = f.tell()
+        if with_data:
+            data = f.read(length)
+            if len(data) < length:
+                # 录制中途退出时最后一条记录可能不完整
+                return
+            yield timestamp, stream_offset, file_pos, length, data
+        else:
+            f.seek(length, os.SEEK_CUR)
+            yield timestamp, stream_offset, file_pos, length, None
+
+
+def read_record_header(f: BinaryIO) -> RecordHeader:
+    magic, version, start_time, page_line_count = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError(f'not a session recording: {getattr(f, "name", f)}')
+    return RecordHeader(start_time, page_line_count)
+
+
+def read_keyframe_index(keyframes_path: Path) -> List[KeyframeIndex]:
+    if not keyframes_path.is_file():
+        return []
+    with open(keyframes_path, 'rb') as f:
+        return [KeyframeIndex(ts, offset, pos, length) for ts, offset, pos, length, _ in iter_records(f, False)]
+
+
+def load_keyframe(keyframes_path: Path, keyframe: KeyframeIndex) -> dict:
+    """Return the keyframe state; SessionDocument.from_keyframe_state rebuilds the document from it."""
+    with open(keyframes_path, 'rb') as f:
+        f.seek(keyframe.file_pos)
+        return json.loads(zlib.decompress(f.read(keyframe.length)))
+
+
+def encode_keyframe(document) -> bytes:
+    # 录像文件可能来自他人，只保存纯数据，加载时不会执行任何代码
+    return zlib.compress(json.dumps(document.keyframe_state(), separators=(',', ':')).encode(), 1)
+
+
+class _SessionFiles:
+    def __init__(self, record_dir: Path, session_id: str, start_time: float, page_line_count: int):
+        safe_session_id = re.sub(r'[^\w.-]', '_', session_id)
+        stem = f'{safe_session_id}_{time.strftime("%Y%m%d-%H%M%S", time.localtime(start_time))}'
+        self.chunks = open(record_dir / (stem + CHUNKS_SUFFIX), 'wb')
+        self.chunks.write(_FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, start_time, page_line_count))
+        self.keyframes = open(record_dir / (stem + KEYFRAMES_SUFFIX), 'wb')
+
+    def flush(self):
+        self.chunks.flush()
+        self.keyframes.flush()
+
+    def close(self):
+        self.chunks.close()
+        self.keyframes.close()
+
+
+class RecordWriter(Thread):
+    """
+    Appends the raw output of recorded sessions and their keyframes to disk on its own thread.
+
+    The append methods only enqueue, so the IoEngine and controller threads never wait for disk;
+    keyframes are also encoded here, from a copy that the caller no longer changes.
+    When the writer falls behind by more than max_pending_bytes, further chunks of that moment are
+    dropped and counted; the stream offsets in the file show the gap.
+    """
+    MAX_PENDING_BYTES: Final[int] = 64 * 1024 * 1024
+    FLUSH_INTERVAL_SECS: Final[float] = 1.0
+
+    def __init__(self, record_dir: Path, max_pending_bytes: int = MAX_PENDING_BYTES):
+        super().__init__(name='record-writer', daemon=True)
+        self.__record_dir = Path(record_dir)
+        self.__max_pending_bytes = max_pending_bytes
+        self.__queue = queue.SimpleQueue()
+        self.__pending_bytes = 0
+        self.__pending_bytes_lock = Lock()
+        self.__session_files: Dict[str, _SessionFiles] = {}
+
+        self.written_bytes = 0
+        self.dropped_bytes = 0
+
+    def open_session(self, session_id: str, page_line_count: int):
+        self.__queue.put((_OP_OPEN, session_id, time.time(), page_line_count))
+
+    def append_chunk(self, session_id: str, stream_offset: int, data: bytes):
+        with self.__pending_bytes_lock:
+            if self.__pending_bytes + len(data) > self.__max_pending_bytes:
+                self.dropped_bytes += len(data)
+                return
+            self.__pending_bytes += len(data)
+        self.__queue.put((_OP_CHUNK, session_id, time.time(), (stream_offset, data)))
+
+    def add_keyframe(self, session_id: str, stream_offset: int, document):
+        """document is a SessionDocument.keyframe_copy(), owned by the writer from now on."""
+        self.__queue.put((_OP_KEYFRAME, session_id, time.time(), (stream_offset, document)))
+
+    def close_session(self, session_id: str):
+        self.__queue.put((_OP_CLOSE, session_id, time.time(), None))
+
+    def stop(self):
+        self.__queue.put((_OP_STOP, None, time.time(), None))
+        self.join()
+
+    def run(self):
+        self.__record_dir.mkdir(parents=True, exist_ok=True)
+        last_flush_time = time.monotonic()
+        while True:
+            try:
+                op, session_id, timestamp, args = self.__queue.get(timeout=RecordWriter.FLUSH_INTERVAL_SECS)
+            except queue.Empty:
+                op = None
+
+            if op == _OP_STOP:
+                break
+            if op is not None:
+                try:
+                    self.__handle_op(op, session_id, timestamp, args)
+                except OSError as e:
+                    print(f'record writer error for session {session_id}: {e}')
+
+            if time.monotonic() - last_flush_time >= RecordWriter.FLUSH_INTERVAL_SECS:
+                for session_files in self.__session_files.values():
+                    session_files.flush()
+                last_flush_time = time.monotonic()
+
+        for session_files in self.__session_files.values():
+            session_files.close()
+        self.__session_files.clear()
+        print(f'record writer stopped, written {self.written_bytes} bytes, dropped {self.dropped_bytes} bytes')
+
+    def __handle_op(self, op: int, session_id: str, timestamp: float, args):
+        if op == _OP_OPEN:
+            if session_id not in self.__session_files:
+                self.__session_files[session_id] = _SessionFiles(self.__record_dir, session_id, timestamp, args)
+            return
+
+        if op == _OP_CLOSE:
+            if session_files := self.__session_files.pop(session_id, None):
+                session_files.close()
+            return
+
+        stream_offset, data = args
+        if op == _OP_CHUNK:
+            with self.__pending_bytes_lock:
+                self.__pending_bytes -= len(data)
+        session_files = self.__session_files.get(session_id)
+        if session_files is None:
+            return
+        if op == _OP_KEYFRAME:
+            data = encode_keyframe(data)
+
+        f = session_files.chunks if op == _OP_CHUNK else session_files.keyframes
+        f.write(_RECORD_HEADER.pack(timestamp, stream_offset, len(data)))
+        f.write(data)
+        self.written_bytes += _RECORD_HEADER.size + len(data)
+
+
+def find_recordings(record_dir: Path) -> List[Path]:
+    return sorted(Path(record_dir).glob('*' + CHUNKS_SUFFIX))
+
+
+def keyframes_path_of(chunks_path: Path) -> Path:
+    return Path(chunks_path).with_suffix(KEYFRAMES_SUFFIX)
+
+
+def latest_keyframe_before(keyframes: List[KeyframeIndex], timestamp: float) -> Optional[KeyframeIndex]:
+    candidates = [x for x in keyframes if x.timestamp <= timestamp]
+    return max(candidates, key=lambda x: x.timestamp) if candidates else None
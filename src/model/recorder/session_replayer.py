@@ -0,0 +1,167 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+# usage:
+#   python -m src.model.recorder.session_replayer --list
+#   python -m src.model.recorder.session_replayer <name>.chunks --at 120     # 打印第120秒时的屏幕
+#   python -m src.model.recorder.session_replayer <name>.chunks --play --speed 4
+
+import argparse
+import bisect
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from src.common.common_definition import RECORD_DIR
+from src.controller.session_document import SessionDocument
+from src.model.parser.buffer.session_bytes_buffer import SessionBytesBuffer
+from src.model.recorder.session_recorder import read_record_header, read_keyframe_index, load_keyframe, \
+    iter_records, keyframes_path_of, latest_keyframe_before, find_recordings
+
+
+class SessionReplayer:
+    """
+    Rebuilds the SessionDocument of a recording at any moment: load the nearest keyframe before it
+    and parse only the output recorded after that keyframe, without waiting between chunks.
+    """
+    # 小块合并后再解析，减少逐块解析的开销
+    PARSE_BATCH_BYTES = 65536
+
+    def __init__(self, chunks_path: Path):
+        self.__chunks_path = Path(chunks_path)
+        self.__keyframes_path = keyframes_path_of(self.__chunks_path)
+        with open(self.__chunks_path, 'rb') as f:
+            self.header = read_record_header(f)
+            # 只读取记录头建立索引，数据在回放时按需读取
+            self.__chunk_index = [(ts, offset, pos, length) for ts, offset, pos, length, _ in iter_records(f, False)]
+        self.__chunk_times = [x[0] for x in self.__chunk_index]
+        self.__chunk_offsets = [x[1] for x in self.__chunk_index]
+        self.__keyframes = read_keyframe_index(self.__keyframes_path)
+
+        self.replayed_bytes = 0
+        self.gap_count = 0
+
+    @property
+    def duration_secs(self) -> float:
+        return self.__chunk_times[-1] - self.header.start_time if self.__chunk_times else 0.0
+
+    @property
+    def keyframe_count(self) -> int:
+        return len(self.__keyframes)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(x[3] for x in self.__chunk_index)
+
+    def seek(self, at_secs: float) -> SessionDocument:
+        """Document as it was at_secs seconds after the recording started."""
+        target_time = self.header.start_time + at_secs
+        keyframe = latest_keyframe_before(self.__keyframes, target_time)
+        if keyframe:
+            document = SessionDocument.from_keyframe_state(load_keyframe(self.__keyframes_path, keyframe))
+            begin_offset = keyframe.stream_offset
+        else:
+            document = SessionDocument(self.header.page_line_count)
+            begin_offset = 0
+
+        parser = SessionBytesBuffer()
+        batch = []
+        batch_bytes = 0
+        for data in self.iter_chunk_data(begin_offset, target_time):
+            batch.append(data)
+            batch_bytes += len(data)
+            if batch_bytes >= SessionReplayer.PARSE_BATCH_BYTES:
+                document.handle_msgs(list(parser.parse(b''.join(batch), b'')))
+                batch = []
+                batch_bytes = 0
+        if batch:
+            document.handle_msgs(list(parser.parse(b''.join(batch), b'')))
+        return document
+
+    def iter_chunk_data(self, begin_offset: int, end_time: float) -> Iterator[bytes]:
+        # 关键帧之后的第一个块可能只需要后半部分
+        first_idx = 0
+        if begin_offset:
+            first_idx = max(0, bisect.bisect_right(self.__chunk_offsets, begin_offset) - 1)
+        expected_offset = None
+        with open(self.__chunks_path, 'rb') as f:
+            for ts, offset, pos, length in self.__chunk_index[first_idx:]:
+                if ts > end_time:
+                    break
+                if offset + length <= begin_offset:
+                    continue
+                if expected_offset is not None and offset != expected_offset:
+                    self.gap_count += 1
+                expected_offset = offset + length
+
+                f.seek(pos)
+                data = f.read(length)
+                if offset < begin_offset:
+                    data = data[begin_offset - offset:]
+                self.replayed_bytes += len(data)
+                yield data
+
+    def iter_timed_chunks(self, from_secs: float = 0) -> Iterator[Tuple[float, bytes]]:
+        """(seconds since start, raw output) from from_secs on, for real time playback."""
+        first_idx = bisect.bisect_left(self.__chunk_times, self.header.start_time + from_secs)
+        with open(self.__chunks_path, 'rb') as f:
+            for ts, offset, pos, length in self.__chunk_index[first_idx:]:
+                f.seek(pos)
+                yield ts - self.header.start_time, f.read(length)
+
+
+def screen_text(document: SessionDocument) -> List[str]:
+    return [''.join(segment[-1] for segment in line) for line in document.current_view_area_content([])]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Replay a recorded Icenberg session')
+    arg_parser.add_argument('recording', nargs='?', help='path of a .chunks file')
+    arg_parser.add_argument('--list', action='store_true', help=f'list recordings in {RECORD_DIR}')
+    arg_parser.add_argument('--at', type=float, default=None, help='print the screen at this second, default: end')
+    arg_parser.add_argument('--play', action='store_true', help='write the raw output to this terminal')
+    arg_parser.add_argument('--speed', type=float, default=1.0, help='playback speed for --play, 0 = no waiting')
+    args = arg_parser.parse_args()
+
+    if args.list or not args.recording:
+        for path in find_recordings(RECORD_DIR):
+            replayer = SessionReplayer(path)
+            print(f'{path.name}: {replayer.duration_secs:.1f}s, {replayer.total_bytes} bytes, '
+                  f'{replayer.keyframe_count} keyframes')
+        return
+
+    replayer = SessionReplayer(Path(args.recording))
+    if args.play:
+        begin = time.monotonic()
+        for secs, data in replayer.iter_timed_chunks(args.at or 0):
+            if args.speed > 0:
+                time.sleep(max(0.0, ((secs - (args.at or 0)) / args.speed) - (time.monotonic() - begin)))
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+        return
+
+    at_secs = replayer.duration_secs if args.at is None else args.at
+    begin = time.perf_counter()
+    document = replayer.seek(at_secs)
+    elapsed = time.perf_counter() - begin
+    print('\n'.join(screen_text(document)))
+    print(f'--- {at_secs:.1f}s of {replayer.duration_secs:.1f}s, replayed {replayer.replayed_bytes} bytes '
+          f'in {elapsed * 1000:.1f}ms' + (f', {replayer.gap_count} gaps' if replayer.gap_count else ''), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Lock
+from typing import Callable, Final, List, Optional
+
+import paramiko
+
+from src.common.common_definition import BATCH_STATUS_PENDING, BATCH_STATUS_RUNNING, BATCH_STATUS_DONE, \
+    BATCH_STATUS_FAILED, BATCH_STATUS_TIMEOUT, BATCH_STATUS_CANCELLED, BATCH_DEFAULT_MAX_CONCURRENCY
+from src.model.sync_ssh.ssh.ssh_client import XClient
+
+
+def host_label(connect_params: dict) -> str:
+    return f'{connect_params.get("username")}@{connect_params.get("hostname")}:{connect_params.get("port", 22)}'
+
+
+class BatchCommandRunner(Thread):
+    """
+    Runs one command on many hosts over SSH exec channels, at most max_concurrency hosts at a time.
+
+    client_provider(connect_params) may return a connected XClient of an open session; its transport
+    is reused and stays open. Otherwise a new connection is opened for the command and closed again.
+    on_result(row) is called from the worker threads whenever the row of a host changes, including
+    while output is still arriving. stdout and stderr keep their first max_output_bytes bytes, the
+    byte counts show how much was received in total.
+    """
+    DEFAULT_MAX_CONCURRENCY: Final[int] = BATCH_DEFAULT_MAX_CONCURRENCY
+    DEFAULT_TIMEOUT_SECS: Final[float] = 60.0
+    MAX_OUTPUT_BYTES: Final[int] = 4096
+    STREAM_INTERVAL_SECS: Final[float] = 0.2
+    READ_POLL_SECS: Final[float] = 0.02
+    READ_SIZE: Final[int] = 32768
+
+    def __init__(self, command: str, connect_params_list: List[dict],
+                 on_result: Optional[Callable[[dict], None]] = None,
+                 client_provider: Optional[Callable[[dict], Optional[XClient]]] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, timeout_secs: float = DEFAULT_TIMEOUT_SECS,
+                 max_output_bytes: int = MAX_OUTPUT_BYTES):
+        super().__init__(name='batch-runner', daemon=True)
+        self.__command = command
+        self.__connect_params_list = connect_params_list
+        self.__on_result = on_result
+        self.__client_provider = client_provider
+        self.__max_concurrency = max(1, max_concurrency)
+        self.__timeout_secs = timeout_secs
+        self.__max_output_bytes = max_output_bytes
+        self.__stop_event = Event()
+
+        self.__rows: List[dict] = [
+            {
+                'index': index,
+                'host': host_label(connect_params),
+                'status': BATCH_STATUS_PENDING,
+                'exit_code': None,
+                'duration_secs': None,
+                'stdout': '',
+                'stderr': '',
+                'stdout_bytes': 0,
+                'stderr_bytes': 0,
+                'error': '',
+            } for index, connect_params in enumerate(connect_params_list)
+        ]
+        self.__rows_lock = Lock()
+
+    @property
+    def command(self) -> str:
+        return self.__command
+
+    def cancel(self):
+        self.__stop_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.__stop_event.is_set()
+
+    def get_results(self) -> List[dict]:
+        with self.__rows_lock:
+            return [dict(row) for row in self.__rows]
+
+    def run(self):
+        if not self.__connect_params_list:
+            return
+        # 先上报所有主机，结果表格可以一次建好所有行
+        for index in range(len(self.__connect_params_list)):
+            self.update_row(index)
+        worker_count = min(self.__max_concurrency, len(self.__connect_params_list))
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='batch-worker') as pool:
+            list(pool.map(self.run_on_host, range(len(self.__connect_params_list))))
+
+    def run_on_host(self, index: int):
+        if self.is_cancelled():
+            self.update_row(index, status=BATCH_STATUS_CANCELLED)
+            return
+
+        begin = time.perf_counter()
+        self.update_row(index, status=BATCH_STATUS_RUNNING)
+        connect_params = self.__connect_params_list[index]
+        client = self.__client_provider(connect_params) if self.__client_provider else None
+        is_owned = client is None
+        try:
+            if is_owned:
+                client = XClient()
+                client.connect(**connect_params)
+                client.set_connect_params(connect_params)
+            channel = client.open_exec_channel(self.__command, timeout=XClient.CONNECT_TIMEOUT_SECS)
+            try:
+                self.read_channel(index, channel, begin)
+            finally:
+                channel.close()
+        except Exception as e:
+            self.update_row(
+                index, status=BATCH_STATUS_FAILED, error=str(e) or type(e).__name__,
+                duration_secs=time.perf_counter() - begin
+            )
+        finally:
+            if is_owned and client is not None:
+                client.close()
+
+    def read_channel(self, index: int, channel: paramiko.Channel, begin: float):
+        deadline = begin + self.__timeout_secs
+        stdout, stderr = bytearray(), bytearray()
+        stdout_bytes = stderr_bytes = 0
+        last_report_time = begin
+        while True:
+            has_data = False
+            while channel.recv_ready():
+                data = channel.recv(BatchCommandRunner.READ_SIZE)
+                stdout_bytes += len(data)
+                stdout += data[:max(0, self.__max_output_bytes - len(stdout))]
+                has_data = True
+            while channel.recv_stderr_ready():
+                data = channel.recv_stderr(BatchCommandRunner.READ_SIZE)
+                stderr_bytes += len(data)
+                stderr += data[:max(0, self.__max_output_bytes - len(stderr))]
+                has_data = True
+
+            # 退出状态可能早于剩余输出到达，收到EOF后才算读完
+            is_finished = channel.exit_status_ready() and (channel.eof_received or channel.closed) and \
+                not channel.recv_ready() and not channel.recv_stderr_ready()
+            now = time.perf_counter()
+            if is_finished or self.is_cancelled() or now >= deadline:
+                break
+
+            if has_data and now - last_report_time >= BatchCommandRunner.STREAM_INTERVAL_SECS:
+                last_report_time = now
+                self.update_row(
+                    index, stdout=stdout.decode(errors='replace'), stderr=stderr.decode(errors='replace'),
+                    stdout_bytes=stdout_bytes, stderr_bytes=stderr_bytes, duration_secs=now - begin
+                )
+            if not has_data:
+                self.__stop_event.wait(BatchCommandRunner.READ_POLL_SECS)
+
+        if is_finished:
+            status, exit_code = BATCH_STATUS_DONE, channel.recv_exit_status()
+        else:
+            status, exit_code = BATCH_STATUS_CANCELLED if self.is_cancelled() else BATCH_STATUS_TIMEOUT, None
+        self.update_row(
+            index, status=status, exit_code=exit_code, duration_secs=time.perf_counter() - begin,
+            stdout=stdout.decode(errors='replace'), stderr=stderr.decode(errors='replace'),
+            stdout_bytes=stdout_bytes, stderr_bytes=stderr_bytes
+        )
+
+    def update_row(self, index: int, **changes):
+        with self.__rows_lock:
+            row = self.__rows[index]
+            row.update(changes)
+            row = dict(row)
+        if self.__on_result:
+            try:
+                self.__on_result(row)
+            except Exception as e:
+                print(f'batch result callback error: {e}')
+
+
+def run_batch(command: str, connect_params_list: List[dict], **kwargs) -> List[dict]:
+    """Blocking helper: run command on all hosts and return one result row per host, in input order."""
+    runner = BatchCommandRunner(command, connect_params_list, **kwargs)
+    runner.start()
+    runner.join()
+    return runner.get_results()
+
@@ -0,0 +1,270 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import heapq
+import itertools
+import selectors
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, Event
+from typing import Callable, Final
+
+
+class TimerHandle:
+    def __init__(self, deadline: float, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+class CommandQueue:
+    """
+    Queue-like inbox of one RemoteAgent. put() may be called from any thread, the handler always
+    runs on the engine thread in put order.
+    """
+
+    def __init__(self, io_engine: 'IoEngine', handler: Callable[[dict], None]):
+        self.__io_engine = io_engine
+        self.__handler = handler
+
+    def put(self, msg: dict):
+        self.__io_engine.call_soon(self.__handler, msg)
+
+
+class SerialLane:
+    """
+    Runs submitted callables one at a time and in submit order on a shared thread pool, so that
+    different lanes run concurrently while each lane keeps its own order.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self.__executor = executor
+        self.__pending = deque()
+        self.__lock = Lock()
+        self.__is_running = False
+
+    def submit(self, func: Callable, *args):
+        with self.__lock:
+            self.__pending.append((func, args))
+            if self.__is_running:
+                return
+            self.__is_running = True
+        self.__executor.submit(self.__drain)
+
+    def __drain(self):
+        while True:
+            with self.__lock:
+                if not self.__pending:
+                    self.__is_running = False
+                    return
+                func, args = self.__pending.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                print(f'SerialLane callback error: {e}')
+
+
+class IoEngine(Thread):
+    """
+    One selector loop that multiplexes the channels and command queues of all RemoteAgents.
+
+    Channel callbacks, command handlers and executor completions all run on this thread, so the
+    agents need no locking of their own. Blocking work (connect, auth, opening channels) goes to a
+    small thread pool through run_in_executor(). Channel writes go through per-agent SerialLanes on a
+    separate pool: paramiko's send can block on a full socket or a rekey, which must not hold up the
+    other transports.
+
+    Reader callbacks parse output on this thread, so one loop round over many busy channels could hold
+    back the echo of a quiet one. Ready readers therefore run least recently served first, and once a
+    round has spent ROUND_TIME_BUDGET_SECS, expensive readers wait for the next round; the selector is
+    level-triggered, so they are reported again right away.
+    """
+    DEFAULT_EXECUTOR_WORKERS: Final[int] = 4
+    DEFAULT_SEND_WORKERS: Final[int] = 8
+    ROUND_TIME_BUDGET_SECS: Final[float] = 0.005
+    # 上次耗时低于此值的回调（按键回显、唤醒信号）不受每轮时间预算限制
+    CHEAP_CALLBACK_SECS: Final[float] = 0.0005
+
+    def __init__(self, executor_workers: int = DEFAULT_EXECUTOR_WORKERS, send_workers: int = DEFAULT_SEND_WORKERS):
+        super().__init__(name='io-engine', daemon=True)
+        self.__selector = selectors.DefaultSelector()
+        self.__executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix='io-engine-worker')
+        self.__send_executor = ThreadPoolExecutor(max_workers=send_workers, thread_name_prefix='io-engine-sender')
+
+        # wakeup self-pipe：用于打断阻塞的 select
+        self.__listener, self.__notifier = socket.socketpair()
+        self.__listener.setblocking(False)
+        self.__notifier.setblocking(False)
+        self.__selector.register(self.__listener, selectors.EVENT_READ, self.__confirm_wakeup_signal)
+
+        self.__reader_fds = {}  # fileobj: fd
+        self.__reader_stats = {}  # fd: [上次服务的轮次, 上次回调耗时]
+        self.__round_seq = 0
+        self.__timers = []  # heap of (deadline, seq, TimerHandle)，仅在engine线程中访问
+        self.__timer_seq = itertools.count()
+        self.__pending_calls = deque()
+        self.__pending_calls_lock = Lock()
+        self.__wakeup_sent = False
+        self.__stop_event = Event()
+
+        self.wakeup_count = 0
+        self.select_count = 0
+
+    def new_command_queue(self, handler: Callable[[dict], None]) -> CommandQueue:
+        return CommandQueue(self, handler)
+
+    def new_serial_lane(self) -> SerialLane:
+        return SerialLane(self.__send_executor)
+
+    def call_soon(self, callback: Callable, *args):
+        with self.__pending_calls_lock:
+            self.__pending_calls.append((callback, args))
+            # 同一轮循环内只需要一次唤醒
+            if self.__wakeup_sent:
+                return
+            self.__wakeup_sent = True
+
+        try:
+            self.__notifier.send(b'\x00')
+        except (BlockingIOError, OSError):
+            pass
+
+    def call_later(self, delay_secs: float, callback: Callable, *args) -> TimerHandle:
+        """Engine thread only. Run callback(*args) on the engine thread after delay_secs."""
+        timer = TimerHandle(time.monotonic() + delay_secs, callback, args)
+        heapq.heappush(self.__timers, (timer.deadline, next(self.__timer_seq), timer))
+        return timer
+
+    def run_in_executor(self, func: Callable, done_callback: Callable, *args):
+        """Run func(*args) in the worker pool, then done_callback(result, exception) on the engine thread."""
+
+        def work():
+            try:
+                result = func(*args)
+            except Exception as e:
+                self.call_soon(done_callback, None, e)
+                return
+            self.call_soon(done_callback, result, None)
+
+        self.__executor.submit(work)
+
+    def add_reader(self, fileobj, callback: Callable):
+        """Engine thread only. callback(fileobj) is called whenever fileobj is readable."""
+        # 记录注册时的fd：paramiko channel关闭后再调用fileno()会创建新的pipe
+        fd = fileobj.fileno()
+        self.__selector.register(fd, selectors.EVENT_READ, lambda: callback(fileobj))
+        self.__reader_fds[fileobj] = fd
+        self.__reader_stats[fd] = [0, 0.0]
+
+    def remove_reader(self, fileobj) -> bool:
+        """Engine thread only."""
+        fd = self.__reader_fds.pop(fileobj, None)
+        if fd is None:
+            return False
+        self.__reader_stats.pop(fd, None)
+        try:
+            self.__selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+        return True
+
+    def reader_count(self) -> int:
+        return len(self.__reader_fds)
+
+    def stop(self):
+        self.__stop_event.set()
+        self.call_soon(lambda: None)
+        self.join()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+        self.__send_executor.shutdown(wait=False, cancel_futures=True)
+        self.__selector.close()
+        self.__listener.close()
+        self.__notifier.close()
+
+    def run(self):
+        print('IoEngine start running.')
+        while not self.__stop_event.is_set():
+            events = self.__selector.select(self.__next_timer_timeout())
+            self.select_count += 1
+            self.__run_readers([key for key, _ in events])
+            self.__run_pending_calls()
+            self.__run_due_timers()
+        print('IoEngine stopped.')
+
+    def __run_readers(self, keys: list):
+        self.__round_seq += 1
+        # 最久未被服务的先执行：空闲session的回显排在持续输出的session前面
+        keys.sort(key=lambda x: self.__reader_stats.get(x.fd, (0, 0.0))[0])
+        round_begin = time.perf_counter()
+        for key in keys:
+            # 前面的回调可能已经取消了这个fd的监听
+            if key.fd not in self.__selector.get_map():
+                continue
+            stats = self.__reader_stats.setdefault(key.fd, [0, 0.0])
+            begin = time.perf_counter()
+            if stats[1] >= IoEngine.CHEAP_CALLBACK_SECS and begin - round_begin >= IoEngine.ROUND_TIME_BUDGET_SECS:
+                # 留到下一轮，fd仍然可读，select会立即返回
+                continue
+            try:
+                key.data()
+            except Exception as e:
+                print(f'IoEngine reader callback error: {e}')
+            stats[0] = self.__round_seq
+            stats[1] = time.perf_counter() - begin
+
+    def __next_timer_timeout(self):
+        while self.__timers and self.__timers[0][2].is_cancelled:
+            heapq.heappop(self.__timers)
+        if not self.__timers:
+            return None
+        return max(0.0, self.__timers[0][0] - time.monotonic())
+
+    def __run_due_timers(self):
+        now = time.monotonic()
+        while self.__timers and self.__timers[0][0] <= now:
+            _, _, timer = heapq.heappop(self.__timers)
+            if timer.is_cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f'IoEngine timer callback error: {e}')
+
+    def __confirm_wakeup_signal(self):
+        self.wakeup_count += 1
+        try:
+            while self.__listener.recv(1024):
+                continue
+        except (BlockingIOError, OSError):
+            pass
+        # 先读空再清除标记：否则清除后另一线程发出的唤醒可能被读掉，之后的call_soon不再唤醒
+        with self.__pending_calls_lock:
+            self.__wakeup_sent = False
+
+    def __run_pending_calls(self):
+        with self.__pending_calls_lock:
+            pending_calls, self.__pending_calls = self.__pending_calls, deque()
+
+        for callback, args in pending_calls:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f'IoEngine callback error: {e}')
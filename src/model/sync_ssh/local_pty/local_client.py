@@ -0,0 +1,232 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import copy
+import os
+import select
+import shutil
+import signal
+import struct
+import time
+from threading import Lock
+from typing import Optional, List, Final
+
+from src.common.common_definition import VIEW_WIDTH
+from src.common.decorate import exception_catch
+from src.model.sync_ssh.ssh.ssh_shell import XShell
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    # Windows 没有 pty，本地终端不可用
+    fcntl = None
+    termios = None
+
+
+class PtyChannel:
+    """
+    The part of paramiko.Channel that XShell uses, backed by a child process on a local pty.
+
+    Between fork and exec the child only starts a new session, takes the pty as its controlling terminal
+    and execs the command; everything it needs, including the error message, is prepared before forking.
+    The master fd is non-blocking: recv() and send() return what the pty takes right now, so the channel
+    can be served by the IoEngine like a remote one. close() only closes the fd and hangs up the child's
+    process group; wait_closed() blocks until the child is reaped and belongs on a worker thread.
+    """
+    # SIGHUP后等待子进程退出的时间，超时后发送SIGKILL
+    CLOSE_WAIT_SECS: Final[float] = 1.0
+    CLOSE_POLL_SECS: Final[float] = 0.01
+
+    def __init__(self, command: List[str], width: int, height: int):
+        executable = shutil.which(command[0])
+        if executable is None:
+            raise FileNotFoundError(f'local shell not found: {command[0]}')
+        env = dict(os.environ, TERM='xterm')
+        error_bytes = f'exec {executable} failed\r\n'.encode()
+
+        master_fd, slave_fd = os.openpty()
+        try:
+            fcntl.ioctl(slave_fd, termios.TIOCSWINSZ, struct.pack('HHHH', height, width, 0, 0))
+            pid = os.fork()
+            if pid == 0:
+                PtyChannel.exec_child(master_fd, slave_fd, executable, command, env, error_bytes)
+        except Exception:
+            os.close(master_fd)
+            raise
+        finally:
+            os.close(slave_fd)
+
+        os.set_blocking(master_fd, False)
+        self.__pid = pid
+        self.__exit_code: Optional[int] = None
+        self.__master_fd = master_fd
+        self.__poller = select.poll()
+        self.__poller.register(master_fd, select.POLLIN | select.POLLOUT)
+        self.closed = False
+
+    @staticmethod
+    def exec_child(master_fd: int, slave_fd: int, executable: str, command: List[str], env: dict,
+                   error_bytes: bytes):
+        # 在子进程中执行，参数都在fork前准备好，这里只做系统调用后exec
+        # 新session打开的pty成为控制终端，shell的job control和Ctrl-C才能正常工作
+        try:
+            os.close(master_fd)
+            os.setsid()
+            fcntl.ioctl(slave_fd, termios.TIOCSCTTY, 0)
+            for fd in (0, 1, 2):
+                os.dup2(slave_fd, fd)
+            os.execve(executable, command, env)
+        except BaseException:
+            os.write(2, error_bytes)
+        finally:
+            os._exit(127)
+
+    @property
+    def pid(self) -> int:
+        return self.__pid
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return self.__exit_code
+
+    def fileno(self) -> int:
+        return self.__master_fd
+
+    def __poll_events(self) -> int:
+        events = self.__poller.poll(0)
+        return events[0][1] if events else 0
+
+    def recv_ready(self) -> bool:
+        if self.closed:
+            return False
+        # 子进程退出后master报告POLLHUP，recv读到EIO后标记关闭
+        return bool(self.__poll_events() & (select.POLLIN | select.POLLHUP | select.POLLERR))
+
+    def recv(self, nbytes: int) -> bytes:
+        if self.closed:
+            return b''
+        try:
+            return os.read(self.__master_fd, nbytes)
+        except BlockingIOError:
+            return b''
+        except OSError:
+            # 子进程退出后读master返回EIO；fd保留到close()，IoEngine据此检测到关闭
+            self.closed = True
+            return b''
+
+    def send_ready(self) -> bool:
+        if self.closed:
+            return True
+        return bool(self.__poll_events() & select.POLLOUT)
+
+    def send(self, data: bytes) -> int:
+        if self.closed:
+            raise OSError('pty is closed')
+        try:
+            return os.write(self.__master_fd, data)
+        except BlockingIOError:
+            return 0
+
+    def close(self):
+        if self.__master_fd < 0:
+            return
+        self.closed = True
+        if not self.__reap_child():
+            self.__kill_child(signal.SIGHUP)
+        self.__poller.unregister(self.__master_fd)
+        os.close(self.__master_fd)
+        self.__master_fd = -1
+
+    def wait_closed(self) -> Optional[int]:
+        # 阻塞等待子进程退出，可能等待CLOSE_WAIT_SECS，不能在IoEngine线程调用
+        deadline = time.monotonic() + PtyChannel.CLOSE_WAIT_SECS
+        while not self.__reap_child():
+            if time.monotonic() >= deadline:
+                print(f'local shell {self.__pid} ignored SIGHUP, kill it')
+                self.__kill_child(signal.SIGKILL)
+                self.__reap_child(block=True)
+                break
+            time.sleep(PtyChannel.CLOSE_POLL_SECS)
+        return self.__exit_code
+
+    def __kill_child(self, sig: int):
+        try:
+            os.killpg(self.__pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def __reap_child(self, block: bool = False) -> bool:
+        if self.__exit_code is not None:
+            return True
+        try:
+            pid, status = os.waitpid(self.__pid, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            self.__exit_code = -1
+            return True
+        if pid == 0:
+            return False
+        self.__exit_code = os.waitstatus_to_exitcode(status)
+        return True
+
+
+class LocalClient:
+    """XClient counterpart whose shells are local processes, e.g. for local tabs and network-free benchmarks."""
+
+    def __init__(self):
+        self.__connect_params = None
+        self.__command = None
+        self.__channels: List[PtyChannel] = []
+        self.__channels_lock = Lock()
+
+    @staticmethod
+    def get_default_command() -> List[str]:
+        return [os.environ.get('SHELL') or '/bin/sh']
+
+    def set_connect_params(self, connect_params: dict):
+        self.__connect_params = connect_params
+
+    def get_connect_params(self) -> dict:
+        return copy.copy(self.__connect_params)
+
+    def connect(self, **kwargs):
+        if fcntl is None:
+            raise OSError('local shell is not supported on this platform')
+        command = kwargs.get('command') or LocalClient.get_default_command()
+        if shutil.which(command[0]) is None:
+            raise FileNotFoundError(f'local shell not found: {command[0]}')
+        self.__command = command
+
+    def is_active(self) -> bool:
+        # 没有可断开的连接：本地shell退出总是正常关闭
+        return self.__command is not None
+
+    @exception_catch(exception_result=False)
+    def close(self):
+        with self.__channels_lock:
+            channels, self.__channels = self.__channels, []
+        for channel in channels:
+            channel.close()
+        for channel in channels:
+            channel.wait_closed()
+
+    @exception_catch(exception_result=None)
+    def get_shell(self, page_line_count, **kwargs) -> Optional[XShell]:
+        channel = PtyChannel(self.__command, VIEW_WIDTH, page_line_count)
+        with self.__channels_lock:
+            self.__channels = [x for x in self.__channels if x.fileno() >= 0]
+            self.__channels.append(channel)
+        return XShell(channel, page_line_count)
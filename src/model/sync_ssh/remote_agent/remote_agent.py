@@ -14,46 +14,78 @@
 
 
 import queue
-import select
-import socket
-from threading import Thread, Event, Lock
-from typing import Dict, Optional
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+from typing import Dict, Optional, List
 
 from src.common.common_definition import RESPONSE_LOGIN_SUCCESS
 from src.common.msg_code import SESSION_STRING_CODE, LOGIN_CODE, USER_COMMAND_CODE, REMOVE_SESSION_CODE, \
-    REMOVE_AGENT_CODE, LOGIN_RSP_CODE, SESSION_INACTIVE_CODE, RECONNECT_SHELL_CODE, RECONNECT_SHELL_FAIL_CODE
+    REMOVE_AGENT_CODE, LOGIN_RSP_CODE, SESSION_INACTIVE_CODE, RECONNECT_SHELL_CODE, RECONNECT_SHELL_FAIL_CODE, \
+    RECONNECT_STATUS_CODE
+from src.model.recorder.session_recorder import RecordWriter
+from src.model.sync_ssh.io_engine.io_engine import IoEngine
+from src.model.sync_ssh.local_pty.local_client import LocalClient
 from src.model.sync_ssh.ssh.ssh_client import XClient
 from src.model.sync_ssh.ssh.ssh_shell import XShell
 
 
-class NoActiveSessionsError(Exception):
-    def __init__(self):
-        super().__init__("No active sessions in RemoteAgent")
-
-
-class RemoteAgent(Thread):
-    def __init__(self, xclient: XClient, recv_queue: queue.Queue, sink_queue: queue.Queue):
-        super().__init__()
+class RemoteAgent:
+    """
+    All sessions of one ssh connection. The agent has no thread of its own: its shells and command
+    queue are served by the shared IoEngine, and blocking calls run in the engine's executor.
+    """
+    # 每次唤醒的读取上限：所有session共用一个线程，解析大块数据会推迟其它session的回显
+    READ_BYTE_BUDGET = 16384
+    # 大块粘贴每次最多发送的字节数；paramiko没有可写事件，发送窗口用尽后定时重试
+    SEND_BYTE_BUDGET = 262144
+    SEND_PUMP_INTERVAL_SECS = 0.01
+
+    # 断线后自动重连：带抖动的指数退避
+    RECONNECT_BASE_DELAY_SECS = 1.0
+    RECONNECT_MAX_DELAY_SECS = 30.0
+    RECONNECT_MAX_ATTEMPTS = 8
+    # 连接断开时paramiko先关闭各channel，再把transport标记为失效
+    TRANSPORT_CHECK_DELAY_SECS = 0.2
+    SHELL_OPEN_WORKERS = 8
+
+    def __init__(self, xclient: XClient | LocalClient, sink_queue: queue.Queue, io_engine: IoEngine,
+                 record_writer: Optional[RecordWriter] = None):
         self.__xClient = xclient
-        self.__recv_queue = recv_queue
         self.__sink_queue = sink_queue
+        self.__io_engine = io_engine
+        self.__record_writer = record_writer
+        self.__recv_queue = io_engine.new_command_queue(self.handle_front_msg)
 
         self.__x_shell_dict: Dict[str, XShell] = dict()
         self.__x_shell_dict_lock = Lock()
         self.__stop_event = Event()
 
-        # wakeup self-pipe：用于打断阻塞的 select
-        self.listener, self.notifier = socket.socketpair()
-        self.listener.setblocking(False)
-        self.notifier.setblocking(False)
-        self.active_shell_count = 0
+        # 阻塞操作在executor中执行期间，后续的前端消息暂存，保证同一agent内消息顺序
+        self.__is_busy = False
+        self.__deferred_msgs = deque()
+
+        self.__reconnect_attempt = 0
+        self.__reconnect_timer = None
+        self.__send_pump_timer = None
+        # channel写操作在本agent的发送通道中串行执行，不阻塞IoEngine线程和其它agent
+        self.__send_lane = io_engine.new_serial_lane()
+        self.__broadcast_send_times: Dict[str, float] = {}  # session_id: 最早一次尚未发完的广播输入时间
+        self.__send_latency_stats: Dict[str, dict] = {}
+        self.__send_latency_stats_lock = Lock()
 
         self.__is_active = True
         self.__is_active_lock = Lock()
 
     @staticmethod
-    def get_client(connect_params: dict) -> tuple:
-        client = XClient()
+    def new_client(connect_params: dict) -> XClient | LocalClient:
+        return LocalClient() if connect_params.get('local') else XClient()
+
+    @staticmethod
+    def get_client(connect_params: dict, client: XClient | LocalClient = None) -> tuple:
+        client = client or RemoteAgent.new_client(connect_params)
         try:
             client.connect(**connect_params)
             client.set_connect_params(connect_params)
@@ -63,6 +95,16 @@ class RemoteAgent(Thread):
             del client
             return None, str(e)
 
+    def get_current_client(self) -> XClient | LocalClient:
+        # 重连后会替换为新的client
+        return self.__xClient
+
+    def start(self):
+        self.__io_engine.call_soon(self.watch_all_shells)
+
+    def join(self, timeout: float = None) -> bool:
+        return self.__stop_event.wait(timeout)
+
     def is_active(self) -> bool:
         with self.__is_active_lock:
             return self.__is_active
@@ -91,98 +133,122 @@ class RemoteAgent(Thread):
         with self.__x_shell_dict_lock:
             return list(self.__x_shell_dict.keys())
 
+    def get_shell_list(self):
+        with self.__x_shell_dict_lock:
+            return list(self.__x_shell_dict.values())
+
     def get_active_shell_list(self):
         with self.__x_shell_dict_lock:
             return [shell for shell in self.__x_shell_dict.values() if not shell.is_closed()]
 
-    def wakeup_listener(self):
-        try:
-            self.notifier.send(b'\x00')
-        except Exception:
-            pass
-
-    def confirm_wakeup_signal(self):
-        try:
-            while self.listener.recv(1024):
-                continue
-        except BlockingIOError:
-            pass
-        except Exception:
-            pass
+    def get_read_stats(self) -> Dict[str, dict]:
+        return {shell.session_id: shell.read_stats() for shell in self.get_shell_list()}
 
     def get_recv_queue(self):
         return self.__recv_queue
 
-    def run(self):
-        front_msg_handler_thread = Thread(target=self.handle_front_msg)
-        front_msg_handler_thread.start()
+    def watch_all_shells(self):
+        for shell in self.get_active_shell_list():
+            self.watch_shell(shell)
 
-        while not self.__stop_event.is_set():
-            self.deliver_all_session_rsp()
+    def watch_shell(self, shell: XShell):
+        self.__io_engine.add_reader(shell, self.on_shell_readable)
 
-        print("RemoteAgent stopping...")
-        front_msg_handler_thread.join()
-        self.__recv_queue = None
-        print("RemoteAgent thread exited")
+    def unwatch_shell(self, shell: XShell):
+        self.__io_engine.remove_reader(shell)
 
-    def deliver_all_session_rsp(self):
-        try:
-            if all_session_responses := self.recv_all_session_responses():
-                self.__sink_queue.put(all_session_responses)
-        except Exception as e:
-            print(e)
-            if isinstance(e, NoActiveSessionsError):
-                self.set_active(False)
-                self.notify_all_session_inactive()
+    def on_shell_readable(self, shell: XShell):
+        if shell.recv_ready():
+            inner_msgs = shell.drain_and_parser_bytes(RemoteAgent.READ_BYTE_BUDGET)
+            session_msg = {'session_id': shell.session_id, 'inner_msgs': inner_msgs}
+            if shell.is_recording:
+                # 控制器按此位置保存文档关键帧
+                session_msg['record_offset'] = shell.resume_offset()
+            self.__sink_queue.put({'msg_code': SESSION_STRING_CODE, 'payload': [session_msg]})
+            return
 
-    def notify_all_session_inactive(self):
-        for session_id in self.get_session_id_list():
-            self.__sink_queue.put(
-                {
-                    'msg_code': SESSION_INACTIVE_CODE,
-                    'payload': {
-                        'session_id': session_id
-                    }
-                }
+        if not shell.is_closed():
+            return
+
+        # channel关闭后其fileno一直可读，需要取消监听
+        self.unwatch_shell(shell)
+        if self.is_active() and not self.get_active_shell_list():
+            print('No active sessions in RemoteAgent')
+            self.set_active(False)
+            self.notify_all_session_inactive()
+            self.cancel_reconnect_timer()
+            self.__reconnect_timer = self.__io_engine.call_later(
+                RemoteAgent.TRANSPORT_CHECK_DELAY_SECS, self.reconnect_if_transport_lost
             )
 
-    def handle_front_msg(self):
-        while True:
-            msg = self.__recv_queue.get()
-            msg_code = msg.get('msg_code')
-            session_id = msg.get('payload', {}).get('session_id')
-            if msg_code == LOGIN_CODE:
-                page_line_count = msg.get('payload', {}).get('content', {}).get('page_line_count', 0)
-                self.add_session(session_id, page_line_count)
-                continue
+    def reconnect_if_transport_lost(self):
+        self.__reconnect_timer = None
+        # 只有连接断开才自动重连；用户exit或远端正常关闭channel时session保持断开，按'r'重连
+        if not self.__xClient.is_active():
+            self.schedule_reconnect()
 
-            if msg_code == USER_COMMAND_CODE:
-                command_str = msg.get('payload', {}).get('content', {}).get('command')
-                if not self.is_active():
-                    self.handle_user_command_inactive(session_id, command_str)
-                else:
-                    self.handle_user_command_active(session_id, command_str)
-                continue
+    def notify_all_session_inactive(self):
+        self.notify_all_session(SESSION_INACTIVE_CODE)
 
-            if msg_code == REMOVE_SESSION_CODE:
-                self.remove_session(msg.get('payload', {}).get('session_id'))
-                self.wakeup_listener()
-                continue
+    def handle_front_msg(self, msg: dict):
+        if self.__is_busy:
+            self.__deferred_msgs.append(msg)
+            return
 
-            if msg_code == REMOVE_AGENT_CODE:
-                self.agent_release()
-                self.__stop_event.set()
-                self.wakeup_listener()
-                print("Front message handler thread exited")
-                return
+        msg_code = msg.get('msg_code')
+        session_id = msg.get('payload', {}).get('session_id')
+        if msg_code == LOGIN_CODE:
+            page_line_count = msg.get('payload', {}).get('content', {}).get('page_line_count', 0)
+            self.add_session(session_id, page_line_count)
+            return
 
-            if msg_code == RECONNECT_SHELL_CODE:
-                self.reconnect(session_id)
-                continue
+        if msg_code == USER_COMMAND_CODE:
+            content = msg.get('payload', {}).get('content', {})
+            command_str = content.get('command')
+            if not self.is_active():
+                self.handle_user_command_inactive(session_id, command_str)
+            else:
+                self.handle_user_command_active(
+                    session_id, command_str, content.get('paste', False), content.get('broadcast_time')
+                )
+            return
+
+        if msg_code == REMOVE_SESSION_CODE:
+            self.remove_session(msg.get('payload', {}).get('session_id'))
+            return
+
+        if msg_code == REMOVE_AGENT_CODE:
+            self.cancel_reconnect_timer()
+            self.cancel_send_pump_timer()
+            for shell in self.get_shell_list():
+                self.unwatch_shell(shell)
+            self.run_blocking(self.agent_release, self.on_agent_released)
+            return
+
+        if msg_code == RECONNECT_SHELL_CODE:
+            self.reconnect_now()
+            return
+
+    def run_blocking(self, func, done_callback, *args):
+        self.__is_busy = True
+
+        def on_done(result, exception):
+            try:
+                done_callback(result, exception)
+            finally:
+                self.__is_busy = False
+                while self.__deferred_msgs and not self.__is_busy:
+                    self.handle_front_msg(self.__deferred_msgs.popleft())
+
+        self.__io_engine.run_in_executor(func, on_done, *args)
+
+    def on_agent_released(self, result, exception):
+        self.__stop_event.set()
+        print("RemoteAgent released")
 
     def handle_user_command_inactive(self, session_id, command_str):
         if command_str == 'r':
-            self.reconnect(session_id)
+            self.reconnect_now()
             return
         self.__sink_queue.put(
             {
@@ -193,112 +259,229 @@ class RemoteAgent(Thread):
             }
         )
 
-    def handle_user_command_active(self, session_id, command_str):
-        self.execute_command(session_id, command_str)
+    def handle_user_command_active(self, session_id, command_str, is_paste: bool = False, broadcast_time=None):
+        self.execute_command(session_id, command_str, is_paste, broadcast_time)
+
+    @staticmethod
+    def get_reconnect_delay(attempt: int) -> float:
+        # 退避上限的一半固定，另一半随机，避免多个agent同时重连
+        backoff = min(RemoteAgent.RECONNECT_MAX_DELAY_SECS, RemoteAgent.RECONNECT_BASE_DELAY_SECS * 2 ** (attempt - 1))
+        return random.uniform(backoff / 2, backoff)
+
+    def cancel_reconnect_timer(self):
+        if self.__reconnect_timer:
+            self.__reconnect_timer.cancel()
+            self.__reconnect_timer = None
+
+    def schedule_reconnect(self):
+        self.cancel_reconnect_timer()
+        self.__reconnect_attempt += 1
+        if self.__reconnect_attempt > RemoteAgent.RECONNECT_MAX_ATTEMPTS:
+            # 自动重连次数用尽，等待用户按'r'
+            self.__reconnect_attempt = 0
+            self.notify_all_session(RECONNECT_SHELL_FAIL_CODE)
+            return
+
+        delay_secs = RemoteAgent.get_reconnect_delay(self.__reconnect_attempt)
+        self.notify_all_session(
+            RECONNECT_STATUS_CODE, {'attempt': self.__reconnect_attempt, 'delay_secs': round(delay_secs, 1)}
+        )
+        self.__reconnect_timer = self.__io_engine.call_later(delay_secs, self.reconnect)
+
+    def reconnect_now(self):
+        self.cancel_reconnect_timer()
+        self.__reconnect_attempt = max(self.__reconnect_attempt, 1)
+        self.notify_all_session(RECONNECT_STATUS_CODE, {'attempt': self.__reconnect_attempt, 'delay_secs': 0})
+        self.reconnect()
 
-    def reconnect(self, session_id):
-        connect_params = self.__xClient.get_connect_params()
+    def notify_all_session(self, msg_code: int, content: dict = None):
+        for session_id in self.get_session_id_list():
+            payload = {'session_id': session_id}
+            if content is not None:
+                payload['content'] = content
+            self.__sink_queue.put({'msg_code': msg_code, 'payload': payload})
+
+    def reconnect(self):
+        self.__reconnect_timer = None
+        if self.__is_busy:
+            self.__reconnect_timer = self.__io_engine.call_later(RemoteAgent.RECONNECT_BASE_DELAY_SECS, self.reconnect)
+            return
+
+        with self.__x_shell_dict_lock:
+            shell_heights = {sid: shell.height for sid, shell in self.__x_shell_dict.items()}
+        self.run_blocking(
+            RemoteAgent.open_new_client_shells, self.on_reconnected, self.__xClient.get_connect_params(), shell_heights
+        )
+
+    @staticmethod
+    def open_new_client_shells(connect_params: dict, shell_heights: Dict[str, int]):
         client, result = RemoteAgent.get_client(connect_params)
         if not client:
-            self.__sink_queue.put(
-                {
-                    'msg_code': RECONNECT_SHELL_FAIL_CODE,
-                    'payload': {
-                        'session_id': session_id
-                    }
-                }
-            )
-            return
+            return None
+
+        # 新transport上的channel并发打开，每个channel都需要等待服务端往返
+        session_ids = list(shell_heights)
+        worker_count = max(1, min(len(session_ids), RemoteAgent.SHELL_OPEN_WORKERS))
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='shell-open') as pool:
+            x_shells = list(pool.map(client.get_shell, shell_heights.values()))
+
+        if any(x_shell is None for x_shell in x_shells):
+            client.close()
+            return None
 
-        self.__xClient = client
         new_x_shell_dict = {}
-        old_x_shell_dict = self.__x_shell_dict
-        for session_id, inactive_shell in old_x_shell_dict.items():
-            x_shell = self.__xClient.get_shell(inactive_shell.height)
+        for session_id, x_shell in zip(session_ids, x_shells):
             x_shell.session_id = session_id
             new_x_shell_dict[session_id] = x_shell
+        return client, new_x_shell_dict
+
+    def on_reconnected(self, result, exception):
+        if not result:
+            self.schedule_reconnect()
+            return
 
-        del old_x_shell_dict
+        self.__reconnect_attempt = 0
+        client, new_x_shell_dict = result
+        for shell in self.get_shell_list():
+            self.unwatch_shell(shell)
+
+        old_client, self.__xClient = self.__xClient, client
+        self.__io_engine.run_in_executor(old_client.close, lambda r, e: None)
+
+        # 重连期间被关闭的session不再恢复
+        for session_id in set(new_x_shell_dict) - set(self.get_session_id_list()):
+            self.close_shell(new_x_shell_dict.pop(session_id))
+        if self.__record_writer:
+            for session_id, x_shell in new_x_shell_dict.items():
+                if old_shell := self.get_shell(session_id):
+                    x_shell.set_record_writer(self.__record_writer, old_shell.stream_offset)
         self.replace_shell_dict(new_x_shell_dict)
         self.set_active(True)
-        self.wakeup_listener()
+        self.watch_all_shells()
 
     def add_session(self, session_id, page_line_count):
-        try:
-            if x_shell := self.__xClient.get_shell(page_line_count):
-                x_shell.session_id = session_id
-                self.add_shell(session_id, x_shell)
+        self.run_blocking(
+            self.__xClient.get_shell, lambda x_shell, e: self.on_session_added(session_id, page_line_count, x_shell, e),
+            page_line_count
+        )
+
+    def on_session_added(self, session_id, page_line_count, x_shell: Optional[XShell], exception):
+        if exception:
             self.__sink_queue.put(
                 {
                     'msg_code': LOGIN_RSP_CODE,
                     'payload': {
                         'session_id': session_id,
                         'content': {
-                            'result': RESPONSE_LOGIN_SUCCESS,
-                            'page_line_count': page_line_count
+                            'result': str(exception),
                         }
                     }
                 }
             )
-        except Exception as e:
-            self.__sink_queue.put(
-                {
-                    'msg_code': LOGIN_RSP_CODE,
-                    'payload': {
-                        'session_id': session_id,
-                        'content': {
-                            'result': str(e),
-                        }
+            return
+
+        if x_shell:
+            x_shell.session_id = session_id
+            if self.__record_writer:
+                self.__record_writer.open_session(session_id, page_line_count)
+                x_shell.set_record_writer(self.__record_writer)
+            self.add_shell(session_id, x_shell)
+            self.watch_shell(x_shell)
+        self.__sink_queue.put(
+            {
+                'msg_code': LOGIN_RSP_CODE,
+                'payload': {
+                    'session_id': session_id,
+                    'content': {
+                        'result': RESPONSE_LOGIN_SUCCESS,
+                        'page_line_count': page_line_count
                     }
                 }
-            )
-        finally:
-            self.wakeup_listener()
+            }
+        )
 
-    def execute_command(self, session_id, command):
+    def execute_command(self, session_id, command, is_paste: bool = False, broadcast_time: float = None):
         if shell := self.get_shell(session_id):
-            shell.send(command)
-
-    def recv_all_session_responses(self, buffer_size=10485760) -> Optional[Dict]:
-        active_shell_list = self.get_active_shell_list()
-        rlist = active_shell_list + [self.listener]
-
-        current_active_shell_count = len(active_shell_list)
-        last_active_shell_count = self.active_shell_count
-        self.active_shell_count = current_active_shell_count
-
-        if current_active_shell_count == 0 and last_active_shell_count > 0:
-            raise NoActiveSessionsError()
-
-        self.active_shell_count = current_active_shell_count
-        ready_list = select.select(rlist, [], [], None)[0]
-        payload = []
-
-        for r in ready_list:
-            if r is self.listener:
-                self.confirm_wakeup_signal()
+            self.__send_lane.submit(self.send_to_shell, shell, command, is_paste, broadcast_time)
+
+    def send_to_shell(self, shell: XShell, command: str, is_paste: bool, broadcast_time: Optional[float]):
+        # 在发送通道线程中执行
+        if broadcast_time is not None:
+            self.__broadcast_send_times.setdefault(shell.session_id, broadcast_time)
+        if shell.send(command, is_paste):
+            self.__io_engine.call_soon(self.schedule_send_pump)
+        else:
+            self.record_broadcast_sent(shell.session_id)
+
+    def record_broadcast_sent(self, session_id: str):
+        if (broadcast_time := self.__broadcast_send_times.pop(session_id, None)) is None:
+            return
+        latency_secs = time.perf_counter() - broadcast_time
+        with self.__send_latency_stats_lock:
+            stats = self.__send_latency_stats.setdefault(
+                session_id, {'count': 0, 'total_secs': 0.0, 'max_secs': 0.0, 'last_secs': 0.0}
+            )
+            stats['count'] += 1
+            stats['total_secs'] += latency_secs
+            stats['max_secs'] = max(stats['max_secs'], latency_secs)
+            stats['last_secs'] = latency_secs
+
+    def get_send_latency_stats(self) -> Dict[str, dict]:
+        """Broadcast input latency per session: from fan-out in the controller until the channel took all bytes."""
+        with self.__send_latency_stats_lock:
+            return {session_id: dict(stats) for session_id, stats in self.__send_latency_stats.items()}
+
+    def schedule_send_pump(self):
+        if self.__send_pump_timer is None:
+            self.__send_pump_timer = self.__io_engine.call_later(RemoteAgent.SEND_PUMP_INTERVAL_SECS,
+                                                                 self.pump_pending_sends)
+
+    def cancel_send_pump_timer(self):
+        if self.__send_pump_timer:
+            self.__send_pump_timer.cancel()
+            self.__send_pump_timer = None
+
+    def pump_pending_sends(self):
+        self.__send_pump_timer = None
+        self.__send_lane.submit(self.pump_shells, self.get_active_shell_list())
+
+    def pump_shells(self, shells: List[XShell]):
+        # 在发送通道线程中执行
+        has_pending_send = False
+        for shell in shells:
+            if not shell.has_pending_send():
                 continue
-
-            shell = r
-            if shell.recv_ready():
-                inner_msgs = shell.recv_and_parser_bytes(buffer_size)
-                payload.append({'session_id': shell.session_id, 'inner_msgs': inner_msgs})
-
-        if payload:
-            # print(f'\x1b[01;34mpayload\x1b[0m: {payload}')
-            return {
-                'msg_code': SESSION_STRING_CODE,
-                'payload': payload
-            }
-        return None
+            if shell.pump_send(RemoteAgent.SEND_BYTE_BUDGET):
+                has_pending_send = True
+            else:
+                self.record_broadcast_sent(shell.session_id)
+        if has_pending_send:
+            self.__io_engine.call_soon(self.schedule_send_pump)
 
     def remove_session(self, session_id):
         if shell := self.remove_shell(session_id):
-            shell.close()
+            self.unwatch_shell(shell)
+            self.close_shell(shell)
+            self.close_recording(shell)
+        with self.__send_latency_stats_lock:
+            self.__send_latency_stats.pop(session_id, None)
+
+    def close_shell(self, shell: XShell):
+        # 在engine线程只关闭channel，等待本地子进程退出交给工作线程
+        shell.close()
+        self.__io_engine.run_in_executor(shell.wait_closed, lambda r, e: None)
 
     def remove_all_session(self):
+        # agent_release在工作线程执行，可以直接等待
         for session_id in self.get_session_id_list():
-            self.remove_session(session_id)
+            if shell := self.remove_shell(session_id):
+                shell.close()
+                shell.wait_closed()
+                self.close_recording(shell)
+
+    def close_recording(self, shell: XShell):
+        if shell.is_recording:
+            self.__record_writer.close_session(shell.session_id)
 
     def agent_release(self):
         self.remove_all_session()
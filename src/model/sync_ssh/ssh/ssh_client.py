@@ -24,6 +24,8 @@ from src.model.sync_ssh.ssh.ssh_shell import XShell
 
 
 class XClient:
+    CONNECT_TIMEOUT_SECS = 10
+
     def __init__(self):
         self.__ssh_client = paramiko.SSHClient()
         self.__ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -36,7 +38,11 @@ class XClient:
         return copy.copy(self.__connect_params)
 
     def connect(self, **kwargs):
-        self.__ssh_client.connect(timeout=10, **kwargs)
+        # TCP连接、banner和认证各阶段分别超时，避免不可达主机长时间占用登录线程
+        kwargs.setdefault('timeout', XClient.CONNECT_TIMEOUT_SECS)
+        kwargs.setdefault('banner_timeout', XClient.CONNECT_TIMEOUT_SECS)
+        kwargs.setdefault('auth_timeout', XClient.CONNECT_TIMEOUT_SECS)
+        self.__ssh_client.connect(**kwargs)
         # 设置 keepalive，每个client只有一个transport
         self.__ssh_client.get_transport().set_keepalive(3)
 
@@ -44,6 +50,16 @@ class XClient:
     def close(self):
         self.__ssh_client.close()
 
+    def is_active(self) -> bool:
+        transport = self.__ssh_client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def open_exec_channel(self, command: str, timeout: float = None) -> paramiko.Channel:
+        # exec channel与交互shell共用同一个transport
+        channel = self.__ssh_client.get_transport().open_session(timeout=timeout)
+        channel.exec_command(command)
+        return channel
+
     @exception_catch(exception_result=None)
     def get_shell(self, page_line_count, **kwargs) -> Optional[XShell]:
         return XShell(
@@ -13,17 +13,47 @@
 # limitations under the License.
 
 
+from collections import deque
+from typing import Optional
+
 from src.common.decorate import exception_catch
+from src.common.msg_code import InnerMsgCode
 from src.model.parser.buffer.session_bytes_buffer import SessionBytesBuffer
+from src.model.recorder.session_recorder import RecordWriter
 
 
 class XShell:
+    MIN_REQUEST_SIZE = 4096
+    DEFAULT_BYTE_BUDGET = 65536
+
+    # 输入发送：大块粘贴按窗口分块发送，channel发送窗口用尽时留到下次继续
+    SEND_CHUNK_SIZE = 32768
+    DEFAULT_SEND_BUDGET = 262144
+    SEND_RECORD_SIZE = 16
+    BRACKETED_PASTE_BEGIN = b'\x1b[200~'
+    BRACKETED_PASTE_END = b'\x1b[201~'
+
     def __init__(self, shell, height: int):
         self.__session_id = None
         self.__shell = shell
         self.__height = height
         self.__session_bytes_buffer = SessionBytesBuffer()
-        self.__send_record = []
+        # 只用于回显判断，最近几次发送即可
+        self.__send_record = deque(maxlen=XShell.SEND_RECORD_SIZE)
+        self.__pending_sends = deque()  # [memoryview of unsent bytes, is_bracketed_paste, is_started]
+        self.__pending_send_bytes = 0
+        self.__bracketed_paste_on = False
+
+        # 已读取的输出字节数，即录像中的位置
+        self.__stream_offset = 0
+        self.__record_writer: Optional[RecordWriter] = None
+
+        # 单次recv请求大小，根据每次唤醒实际读到的数据量自适应调整
+        self.__request_size = XShell.MIN_REQUEST_SIZE
+        self.__wakeup_count = 0
+        self.__recv_call_count = 0
+        self.__recv_bytes = 0
+        self.__max_wakeup_bytes = 0
 
     @property
     def height(self):
@@ -37,24 +67,178 @@ class XShell:
     def session_id(self, session_id: str):
         self.__session_id = session_id
 
+    @property
+    def bracketed_paste_on(self) -> bool:
+        return self.__bracketed_paste_on
+
+    @property
+    def pending_send_bytes(self) -> int:
+        return self.__pending_send_bytes
+
+    @property
+    def stream_offset(self) -> int:
+        return self.__stream_offset
+
+    @property
+    def is_recording(self) -> bool:
+        return self.__record_writer is not None
+
+    def set_record_writer(self, record_writer: Optional[RecordWriter], stream_offset: int = 0):
+        # 重连后的新shell接着旧shell的位置继续录制
+        self.__record_writer = record_writer
+        self.__stream_offset = stream_offset
+
+    def resume_offset(self) -> int:
+        """Stream offset from which a fresh parser reproduces the messages parsed so far."""
+        return self.__stream_offset - self.__session_bytes_buffer.pending_byte_count()
+
+    def __record_output(self, recv_bytes: bytes):
+        if not recv_bytes:
+            return
+        if self.__record_writer:
+            self.__record_writer.append_chunk(self.__session_id, self.__stream_offset, recv_bytes)
+        self.__stream_offset += len(recv_bytes)
+
     @exception_catch(exception_result=None)
     def close(self):
         print("Closing XShell...!!!")
+        self.__pending_sends.clear()
+        self.__pending_send_bytes = 0
         self.__shell.close()
 
     @exception_catch(exception_result=None)
-    def send(self, command: str):
+    def wait_closed(self):
+        # 本地pty关闭后还需回收子进程，会阻塞，需在工作线程调用；ssh channel关闭即完成
+        if wait_closed := getattr(self.__shell, 'wait_closed', None):
+            wait_closed()
+
+    @exception_catch(exception_result=False)
+    def send(self, command: str, is_paste: bool = False) -> bool:
+        """Queue the input and send as much as the channel takes now. Return True when input is still pending."""
+        if not is_paste and '\x03' in command:
+            self.__abort_pending_sends()
+
         send_bytes = command.encode('utf-8')
-        self.__send_record.append(send_bytes)
-        self.__shell.send(command.encode('utf-8'))
+        is_bracketed_paste = is_paste and self.__bracketed_paste_on
+        if is_bracketed_paste:
+            # 粘贴内容中的结束标记会让远端提前退出粘贴模式，把后面的内容当作按键执行
+            send_bytes = XShell.BRACKETED_PASTE_BEGIN + send_bytes.replace(XShell.BRACKETED_PASTE_END, b'') + \
+                XShell.BRACKETED_PASTE_END
+        if not send_bytes:
+            return self.has_pending_send()
+
+        self.__pending_sends.append([memoryview(send_bytes), is_bracketed_paste, False])
+        self.__pending_send_bytes += len(send_bytes)
+        return self.pump_send()
+
+    @exception_catch(exception_result=False)
+    def pump_send(self, byte_budget: int = DEFAULT_SEND_BUDGET) -> bool:
+        """Send queued input while the channel's send window is open. Return True when input is still pending."""
+        sent_bytes = 0
+        while self.__pending_sends and sent_bytes < byte_budget and self.__shell.send_ready():
+            pending_send = self.__pending_sends[0]
+            view = pending_send[0]
+            chunk = bytes(view[:min(XShell.SEND_CHUNK_SIZE, byte_budget - sent_bytes)])
+            # send_ready时发送窗口非空，send不会阻塞，返回实际写入的字节数
+            send_count = self.__shell.send(chunk)
+            if send_count <= 0:
+                break
+
+            self.__send_record.append(chunk[:send_count])
+            sent_bytes += send_count
+            self.__pending_send_bytes -= send_count
+            pending_send[0] = view[send_count:]
+            pending_send[2] = True
+            if not len(pending_send[0]):
+                self.__pending_sends.popleft()
+
+        return bool(self.__pending_sends)
+
+    def has_pending_send(self) -> bool:
+        return bool(self.__pending_sends)
+
+    def __abort_pending_sends(self):
+        """Ctrl-C drops the input not sent yet, e.g. the rest of a large paste."""
+        if not self.__pending_sends:
+            return
+
+        view, is_bracketed_paste, is_started = self.__pending_sends[0]
+        self.__pending_sends.clear()
+        self.__pending_send_bytes = 0
+        if is_bracketed_paste and is_started:
+            # 已发出开始标记，补上结束标记，否则远端一直停留在粘贴模式
+            end_marker = XShell.BRACKETED_PASTE_END
+            rest = bytes(view) if len(view) <= len(end_marker) else end_marker
+            self.__pending_sends.append([memoryview(rest), False, False])
+            self.__pending_send_bytes = len(rest)
+
+    def __track_terminal_modes(self, inner_msgs: list):
+        for inner_msg in inner_msgs:
+            inner_msg_code = inner_msg.get('inner_msg_code')
+            if inner_msg_code != InnerMsgCode.DEC_SET_CODE and inner_msg_code != InnerMsgCode.DEC_RST_CODE:
+                continue
+            payload = inner_msg.get('inner_payload', '')
+            if payload.startswith('?') and '2004' in payload[1:].split(';'):
+                self.__bracketed_paste_on = inner_msg_code == InnerMsgCode.DEC_SET_CODE
 
     @exception_catch(exception_result=[])
     def recv_and_parser_bytes(self, buffer_size=2048) -> list:
         recv_bytes = self.__shell.recv(buffer_size)
+        self.__record_output(recv_bytes)
         # print(f"\x1b[01;34mrecv_bytes\x1b[0m: {recv_bytes}")
         last_send_bytes = self.__send_record[-1] if self.__send_record else b''
 
-        return [x for x in self.__session_bytes_buffer.parse(recv_bytes, last_send_bytes)]
+        inner_msgs = [x for x in self.__session_bytes_buffer.parse(recv_bytes, last_send_bytes)]
+        self.__track_terminal_modes(inner_msgs)
+        return inner_msgs
+
+    @exception_catch(exception_result=[])
+    def drain_and_parser_bytes(self, byte_budget: int = DEFAULT_BYTE_BUDGET) -> list:
+        """Read while data is buffered, up to byte_budget, and parse everything as one chunk."""
+        chunks = []
+        wakeup_bytes = 0
+        recv_call_count = 0
+        while wakeup_bytes < byte_budget and self.__shell.recv_ready():
+            recv_bytes = self.__shell.recv(min(self.__request_size, byte_budget - wakeup_bytes))
+            recv_call_count += 1
+            if not recv_bytes:
+                break
+            chunks.append(recv_bytes)
+            wakeup_bytes += len(recv_bytes)
+
+        self.__record_wakeup(wakeup_bytes, recv_call_count, byte_budget)
+        if not chunks:
+            return []
+
+        last_send_bytes = self.__send_record[-1] if self.__send_record else b''
+        recv_bytes = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        self.__record_output(recv_bytes)
+        inner_msgs = [x for x in self.__session_bytes_buffer.parse(recv_bytes, last_send_bytes)]
+        self.__track_terminal_modes(inner_msgs)
+        return inner_msgs
+
+    def __record_wakeup(self, wakeup_bytes: int, recv_call_count: int, byte_budget: int):
+        self.__wakeup_count += 1
+        self.__recv_call_count += recv_call_count
+        self.__recv_bytes += wakeup_bytes
+        self.__max_wakeup_bytes = max(self.__max_wakeup_bytes, wakeup_bytes)
+
+        # 一次唤醒需要多次recv时放大请求，数据量明显变小时缩小请求
+        if recv_call_count > 1:
+            self.__request_size = min(self.__request_size * 2, byte_budget)
+        elif wakeup_bytes < self.__request_size // 4:
+            self.__request_size = max(self.__request_size // 2, XShell.MIN_REQUEST_SIZE)
+
+    def read_stats(self) -> dict:
+        return {
+            'wakeup_count': self.__wakeup_count,
+            'recv_call_count': self.__recv_call_count,
+            'recv_bytes': self.__recv_bytes,
+            'recv_calls_per_wakeup': self.__recv_call_count / self.__wakeup_count if self.__wakeup_count else 0.0,
+            'bytes_per_wakeup': self.__recv_bytes / self.__wakeup_count if self.__wakeup_count else 0.0,
+            'max_wakeup_bytes': self.__max_wakeup_bytes,
+            'request_size': self.__request_size,
+        }
 
     def recv_ready(self) -> bool:
         return self.__shell.recv_ready()
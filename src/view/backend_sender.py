@@ -0,0 +1,153 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+from collections import deque
+from multiprocessing.connection import Connection
+from threading import Thread, Condition
+from typing import Final
+
+from src.common.msg_codec import send_msg
+from src.common.msg_code import USER_COMMAND_CODE, SCROLL_WINDOW_CODE
+
+
+class BackendSender(Thread):
+    """
+    Sends GUI-originated messages to the controller on its own thread.
+
+    put() never blocks: keystrokes of the same session queued back to back are merged into one
+    USER_COMMAND_CODE message, and no message overtakes an earlier one. Once max_pending_count messages
+    are pending, keystrokes and scrolls that cannot be merged are rejected and put() returns False;
+    other messages such as login, close and cancel are always queued. After the pipe breaks the sender
+    stops and every put() returns False.
+    """
+    MAX_PENDING_COUNT: Final[int] = 1024
+    # 队列满时可以拒绝的高频消息，其余控制消息总是入队
+    REJECTABLE_MSG_CODES: Final[frozenset] = frozenset([USER_COMMAND_CODE, SCROLL_WINDOW_CODE])
+    SLOW_SEND_SECS: Final[float] = 0.1
+    STOP_TIMEOUT_SECS: Final[float] = 1.0
+
+    def __init__(self, conn: Connection, max_pending_count: int = MAX_PENDING_COUNT):
+        super().__init__(daemon=True)
+        self.__conn = conn
+        self.__max_pending_count = max_pending_count
+        self.__pending = deque()  # [msg, enqueue perf_counter]
+        self.__condition = Condition()
+        self.__is_stopped = False
+
+        self.__sent_count = 0
+        self.__coalesced_count = 0
+        self.__rejected_count = 0
+        self.__total_latency_secs = 0.0
+        self.__max_latency_secs = 0.0
+        self.__last_latency_secs = 0.0
+
+    @staticmethod
+    def get_keystroke(msg: dict):
+        if msg.get('msg_code') != USER_COMMAND_CODE:
+            return None
+        content = msg.get('payload', {}).get('content', {})
+        if len(content) != 1 or not isinstance(content.get('command'), str):
+            return None
+        return content['command']
+
+    def put(self, msg: dict) -> bool:
+        with self.__condition:
+            if self.__is_stopped:
+                return False
+
+            # 只合并到队尾，合并后的按键不会越过之后入队的消息
+            if self.__pending and self.__merge_keystroke(self.__pending[-1][0], msg):
+                self.__coalesced_count += 1
+                return True
+
+            # 控制器长时间不读管道时GUI线程也不等待：拒绝高频消息，登录、关闭、取消等消息超出上限也入队
+            if len(self.__pending) >= self.__max_pending_count and \
+                    msg.get('msg_code') in BackendSender.REJECTABLE_MSG_CODES:
+                self.__rejected_count += 1
+                return False
+
+            self.__pending.append([msg, time.perf_counter()])
+            self.__condition.notify()
+            return True
+
+    def __merge_keystroke(self, last_msg: dict, msg: dict) -> bool:
+        command = BackendSender.get_keystroke(msg)
+        if command is None or BackendSender.get_keystroke(last_msg) is None:
+            return False
+
+        last_payload = last_msg['payload']
+        if last_payload.get('session_id') != msg['payload'].get('session_id'):
+            return False
+
+        # 尚未发送的消息由本线程独占，可以直接修改
+        last_payload['content'] = {'command': last_payload['content']['command'] + command}
+        return True
+
+    def stop(self):
+        with self.__condition:
+            self.__is_stopped = True
+            self.__pending.clear()
+            self.__condition.notify_all()
+        # 管道写满时send可能一直阻塞，daemon线程不影响进程退出
+        self.join(BackendSender.STOP_TIMEOUT_SECS)
+
+    def stats(self) -> dict:
+        with self.__condition:
+            return {
+                'pending_count': len(self.__pending),
+                'sent_count': self.__sent_count,
+                'coalesced_count': self.__coalesced_count,
+                'rejected_count': self.__rejected_count,
+                'avg_latency_secs': self.__total_latency_secs / self.__sent_count if self.__sent_count else 0.0,
+                'max_latency_secs': self.__max_latency_secs,
+                'last_latency_secs': self.__last_latency_secs,
+            }
+
+    def run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__is_stopped:
+                    self.__condition.wait()
+                if self.__is_stopped:
+                    break
+                msg, enqueue_time = self.__pending.popleft()
+
+            try:
+                if self.__conn.closed:
+                    break
+                send_msg(self.__conn, msg)
+            except (OSError, ValueError) as e:
+                print(f'backend sender stopped: {e}')
+                break
+
+            self.__record_latency(time.perf_counter() - enqueue_time, msg)
+
+        # 管道断开后不再有线程发送，之后的put()直接返回False，不再积累消息
+        with self.__condition:
+            self.__is_stopped = True
+            self.__pending.clear()
+            self.__condition.notify_all()
+        print('backend sender stopped')
+
+    def __record_latency(self, latency_secs: float, msg: dict):
+        with self.__condition:
+            self.__sent_count += 1
+            self.__total_latency_secs += latency_secs
+            self.__max_latency_secs = max(self.__max_latency_secs, latency_secs)
+            self.__last_latency_secs = latency_secs
+
+        if latency_secs >= BackendSender.SLOW_SEND_SECS:
+            print(f'slow backend send: msg_code={msg.get("msg_code")}, latency={latency_secs * 1000:.1f}ms')
@@ -13,12 +13,13 @@
 # limitations under the License.
 
 
-from PySide6.QtCore import Qt, Signal, QTimer
+from PySide6.QtCore import Qt, Signal, QTimer, QEvent
 from PySide6.QtGui import QShowEvent
 from PySide6.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QApplication
 
 from src.common.msg_code import LOGIN_RSP_CODE, LLM_ANSWER_CODE, LLM_MODEL_LIST_CODE, \
-    SESSION_VIEW_CONTENT_CODE, LLM_CHAT_HISTORY_RSP_CODE, LLM_INLINE_MODEL_LIST_CODE, LLM_RSP_CHAT_BY_CHAT_ID
+    SESSION_VIEW_CONTENT_CODE, LLM_CHAT_HISTORY_RSP_CODE, LLM_INLINE_MODEL_LIST_CODE, LLM_RSP_CHAT_BY_CHAT_ID, \
+    WINDOW_VISIBILITY_CODE, BROADCAST_STATS_CODE, BATCH_RESULT_CODE
 from src.view.tab_wdget.session_tab_widget import SessionTabWidget
 
 
@@ -27,6 +28,7 @@ class MainWindow(QMainWindow):
 
     def __init__(self):
         super().__init__()
+        self.is_minimized = False
         self.setWindowTitle('MainWindow')
         self.setWindowState(Qt.WindowState.WindowMaximized)
 
@@ -50,6 +52,20 @@ class MainWindow(QMainWindow):
 
         QTimer.singleShot(2000, self.tab_widget.init_session_widget_height)
 
+    def changeEvent(self, event: QEvent) -> None:
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange and self.isMinimized() != self.is_minimized:
+            # 最小化时后台停止生成画面帧，恢复时重新推送完整画面
+            self.is_minimized = self.isMinimized()
+            self.SIG_2_BACKEND.emit(
+                {
+                    'msg_code': WINDOW_VISIBILITY_CODE,
+                    'payload': {
+                        'content': {'visible': not self.is_minimized}
+                    }
+                }
+            )
+
     def update_view(self, msg: dict):
         msg_code = msg.get('msg_code')
         msg_payload = msg.get('payload')
@@ -58,6 +74,14 @@ class MainWindow(QMainWindow):
             self.tab_widget.handle_login_rsp_msg(msg_payload)
             return
 
+        if msg_code == BROADCAST_STATS_CODE:
+            self.tab_widget.update_broadcast_stats(msg_payload)
+            return
+
+        if msg_code == BATCH_RESULT_CODE:
+            self.tab_widget.update_batch_result(msg_payload)
+            return
+
         self.setUpdatesEnabled(False)
         if msg_code == SESSION_VIEW_CONTENT_CODE:
             self.tab_widget.update_session_text_browser(msg_payload)
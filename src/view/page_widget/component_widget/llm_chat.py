@@ -46,9 +46,13 @@ class LlmChat(QWidget):
 
     def update_model_list(self, llm_models: list):
         # print('llm models: ', llm_models)
-        self.buttom_widget.pill_llm_widget.combo.clear()
-        self.buttom_widget.pill_llm_widget.combo.addItems(
-            [x['name'] for x in llm_models] if llm_models else ["No LLM Model"])
+        combo = self.buttom_widget.pill_llm_widget.combo
+        # 模型列表可能在后台刷新后推送，保留用户当前选择的模型
+        current_model_name = combo.currentText()
+        combo.clear()
+        combo.addItems([x['name'] for x in llm_models] if llm_models else ["No LLM Model"])
+        if (idx := combo.findText(current_model_name)) >= 0:
+            combo.setCurrentIndex(idx)
 
     def add_ai_message(self, llm_msg_payload: dict):
         self.main_widget.add_llm_message(llm_msg_payload)
@@ -59,8 +63,8 @@ class LlmChat(QWidget):
         self.main_widget.clear()
         self.buttom_widget.input_line.clear()
 
-    def list_chat_history(self, chat_history: list):
-        self.top_widget.show_chat_history(chat_history)
+    def list_chat_history(self, chat_history: list, next_offset=None):
+        self.top_widget.show_chat_history(chat_history, next_offset)
 
     def load_chat(self, payload: dict):
         content = payload.get('content', {})
@@ -53,11 +53,23 @@ class PillLlmWidget(QFrame):
         self.link_screen_label.setObjectName("ScrCtx")
         self.link_screen_label.setToolTip("设置大模型回答时是否结合当前屏幕内容")
 
+        self.cache_check = QCheckBox(self)
+        self.cache_check.setChecked(True)
+        self.cache_check.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.cache_check.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        self.cache_check.clicked.connect(self.set_label_color)
+
+        self.cache_label = QLabel("Cache")
+        self.cache_label.setObjectName("ScrCtx")
+        self.cache_label.setToolTip("相同的问题直接使用缓存的回答，取消勾选时总是重新生成")
+
         lay = QHBoxLayout(self)
         lay.setContentsMargins(10, 3, 10, 3)
         lay.setSpacing(5)
         lay.addWidget(self.enable_check, 0, Qt.AlignmentFlag.AlignVCenter)
         lay.addWidget(self.link_screen_label, 0, Qt.AlignmentFlag.AlignVCenter)
+        lay.addWidget(self.cache_check, 0, Qt.AlignmentFlag.AlignVCenter)
+        lay.addWidget(self.cache_label, 0, Qt.AlignmentFlag.AlignVCenter)
 
         lay.addStretch(1)
 
@@ -118,12 +130,14 @@ class PillLlmWidget(QFrame):
         QToolTip {
             font-size: 13px;
         }""")
+        self.set_label_color()
 
     def set_label_color(self):
-        if self.enable_check.isChecked():
-            self.link_screen_label.setStyleSheet("color: #378CE6; font-weight: bold;")
-        else:
-            self.link_screen_label.setStyleSheet("color: #999999; font-weight: normal;")
+        for check, label in ((self.enable_check, self.link_screen_label), (self.cache_check, self.cache_label)):
+            if check.isChecked():
+                label.setStyleSheet("color: #378CE6; font-weight: bold;")
+            else:
+                label.setStyleSheet("color: #999999; font-weight: normal;")
 
 
 class LlmChatBottomWidget(QWidget):
@@ -98,7 +98,7 @@ class LlmChatTopWidget(QWidget):
                     QMenu::item:selected { font-size: 13px; background: #3B85D5; color: white; padding: 5px 20px; }
                 """)
 
-    def show_chat_history(self, chat_history: list):
+    def show_chat_history(self, chat_history: list, next_offset=None):
         if not chat_history:
             return
 
@@ -110,6 +110,13 @@ class LlmChatTopWidget(QWidget):
             action.setData(item.get('history_idx'))
             self.history_menu.addAction(action)
 
+        # 历史记录分页加载，选择More时请求下一页
+        if next_offset is not None:
+            self.history_menu.addSeparator()
+            action = QAction('More...', self.history_menu)
+            action.setData({'next_offset': next_offset})
+            self.history_menu.addAction(action)
+
         btn = self.history_chat_button
         global_pos = btn.mapToGlobal(btn.rect().bottomLeft())
         self.history_menu.popup(global_pos)
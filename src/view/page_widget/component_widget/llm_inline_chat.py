@@ -318,5 +318,8 @@ class LlmInlineChat(QWidget):
         self.hide()
 
     def update_llm_inline_model_list(self, llm_models: list):
+        current_model_name = self.input_edit.combo.currentText()
         self.input_edit.combo.clear()
         self.input_edit.combo.addItems([x['name'] for x in llm_models] if llm_models else ["None"])
+        if (idx := self.input_edit.combo.findText(current_model_name)) >= 0:
+            self.input_edit.combo.setCurrentIndex(idx)
@@ -21,14 +21,15 @@ from PySide6.QtGui import QFont, QTextCharFormat, QColor, QKeyEvent, QPainter, Q
 from PySide6.QtWidgets import QTextBrowser, QToolButton
 
 from src.common.common_definition import INLINE_CHAT_ID, get_shell_font_setting, OS_TYPE
-from src.common.font_style import StyleTuple, FontStyle
-from src.common.msg_code import LLM_INLINE_MODEL_CHECK, LLM_INLINE_ASK_CODE
+from src.common.font_style import FontStyle
+from src.common.msg_code import LLM_INLINE_MODEL_CHECK, LLM_INLINE_ASK_CODE, LLM_CANCEL_CODE
 from src.view.page_widget.component_object.input_handler import InputHandler
 from src.view.page_widget.component_widget.llm_inline_chat import LlmInlineChat
 
 
 class SessionTextWindow(QTextBrowser):
     SIG_SESSION_TEXT_BROWSER_COMMAND = Signal(str)
+    SIG_SESSION_TEXT_BROWSER_PASTE = Signal(str)
     SIG_LLM_INLINE = Signal(dict)
     SIG_WINDOW_SCROLL = Signal(dict)
 
@@ -108,6 +109,7 @@ class SessionTextWindow(QTextBrowser):
         self.float_btn.clicked.connect(self.on_float_btn_clicked)
         self.inline_chat = LlmInlineChat(self.viewport())
         self.inline_chat.input_edit.send_btn.clicked.connect(self.inline_chat_query)
+        self.inline_chat.close_btn.clicked.connect(self.cancel_inline_chat)
         self.update_datetime = None
         self.inline_shell_content_time_mark = None
         self.llm_shell_content_time_mark = None
@@ -142,6 +144,18 @@ class SessionTextWindow(QTextBrowser):
             }
         )
 
+    def cancel_inline_chat(self):
+        # 关闭临时对话时停止还在生成的回答
+        self.inline_chat.input_edit.send_btn.setEnabled(True)
+        self.SIG_LLM_INLINE.emit(
+            {
+                'msg_code': LLM_CANCEL_CODE,
+                'payload': {
+                    'content': {'chat_session_id': INLINE_CHAT_ID}
+                }
+            }
+        )
+
     def inline_chat_query(self):
         inline_ask_text = self.inline_chat.input_text()
         self.inline_chat.input_clear()
@@ -166,6 +180,8 @@ class SessionTextWindow(QTextBrowser):
                         'chat_session_id': INLINE_CHAT_ID,
                         'llm_model_name': self.inline_chat.current_model_name(),
                         'shell_content_text': shell_content,
+                        # inline对话总是结合屏幕内容
+                        'use_screen_context': True,
                         'shell_focus_text': shell_focus_text or None,
                         'inline_ask': inline_ask_text
                     }
@@ -243,15 +259,12 @@ class SessionTextWindow(QTextBrowser):
         self.insert_cursor.setBlockFormat(self.block_format)
 
         for i in range(line_count):
-            line = [{'text': f'Test line {i + 1}', 'style': None}]
+            line = [(None, f'Test line {i + 1}')]
             self.paint_line(line, is_last_line=(i == line_count - 1))
         return self.document().documentLayout().documentSize().height()
 
     def paint_line(self, line: list, is_last_line: bool = False):
-        for segment in line:
-            style: StyleTuple | None = segment.get('style')
-            text = segment.get('text', '')
-
+        for style, text in line:
             qformat = QTextCharFormat()
             qformat.setForeground(QColor(FontStyle.DEFAULT_FOREGROUND_COLOR))
             qformat.setBackground(QColor(FontStyle.DEFAULT_BACKGROUND_COLOR))
@@ -377,7 +390,7 @@ class SessionTextWindow(QTextBrowser):
         if event.button() == Qt.MouseButton.RightButton:
             clipboard = QGuiApplication.clipboard()
             if text := clipboard.text():
-                self.SIG_SESSION_TEXT_BROWSER_COMMAND.emit(text)
+                self.SIG_SESSION_TEXT_BROWSER_PASTE.emit(text)
                 self.clipboard_text_pasted = True
                 clipboard.clear()
             event.accept()
@@ -81,6 +81,10 @@ class LoginPage(QWidget):
         form_layout.addWidget(self.password_label, 3, 0)
         form_layout.addWidget(self.password_input, 3, 1)
 
+        self.local_btn = LoginButton("Local")
+        self.local_btn.setToolTip("Open a shell on this machine")
+        form_layout.addWidget(self.local_btn, 4, 1, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
+
         self.login_btn = LoginButton("Login")
         form_layout.addWidget(self.login_btn, 4, 1, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
 
@@ -94,6 +98,7 @@ class LoginPage(QWidget):
         self.loading_timer.setInterval(150)
         self.loading_timer.timeout.connect(self.on_loading_timeout)
         self.spinner_frames = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
+        self.login_stage = ''
 
         form_layout.addWidget(self.loading_label, 5, 1, 1, 2)
 
@@ -126,8 +131,13 @@ class LoginPage(QWidget):
         self.loading_timer.stop()
         self.loading_label.hide()
         self.login_btn.setEnabled(True)
+        self.local_btn.setEnabled(True)
+        self.login_stage = ''
+
+    def set_login_stage(self, stage: str):
+        self.login_stage = stage
 
     def on_loading_timeout(self):
         test = self.spinner_frames[self.dot_count % len(self.spinner_frames)]
-        self.loading_label.setText(test)
+        self.loading_label.setText(f'{test} {self.login_stage}' if self.login_stage else test)
         self.dot_count += 1
@@ -20,7 +20,8 @@ from PySide6.QtWidgets import QWidget, QHBoxLayout, QSplitter
 from src.common.common_definition import INLINE_CHAT_ID, OS_TYPE, get_session_widget_height, SIDE_CHAT_ID
 from src.common.msg_code import LLM_ANSWER_CODE, LLM_MODEL_LIST_CODE, LLM_CHAT_HISTORY_RSP_CODE, \
     USER_COMMAND_CODE, SCROLL_WINDOW_CODE, LLM_ASK_CODE, LLM_CHAT_HISTORY_REQ_CODE, LLM_MODEL_CHECK, \
-    LLM_INLINE_MODEL_LIST_CODE, LLM_LOAD_CHAT_BY_HISTORY_IDX, LLM_RSP_CHAT_BY_CHAT_ID, LLM_NEW_CHAT_CODE
+    LLM_INLINE_MODEL_LIST_CODE, LLM_LOAD_CHAT_BY_HISTORY_IDX, LLM_RSP_CHAT_BY_CHAT_ID, LLM_NEW_CHAT_CODE, \
+    LLM_INLINE_ASK_CODE
 from src.view.page_widget.component_widget.llm_chat import LlmChat
 from src.view.page_widget.component_widget.session_browser import SessionBrowser
 
@@ -64,10 +65,11 @@ class SessionPage(QWidget):
         """)
 
         self.text_browser.session_text_window.SIG_SESSION_TEXT_BROWSER_COMMAND.connect(self.emit_session_command)
+        self.text_browser.session_text_window.SIG_SESSION_TEXT_BROWSER_PASTE.connect(self.emit_session_paste)
         self.text_browser.session_text_window.SIG_LLM_INLINE.connect(self.llm_inline_chat)
         self.text_browser.session_text_window.SIG_WINDOW_SCROLL.connect(self.emit_session_scroll)
         self.text_browser.v_scrollbar.SESSION_START_LINE_NUM.connect(self.emit_value_changed)
-        self.llm_chat_widget.top_widget.history_chat_button.clicked.connect(self.emit_llm_chat_history_req)
+        self.llm_chat_widget.top_widget.history_chat_button.clicked.connect(lambda: self.emit_llm_chat_history_req())
         self.llm_chat_widget.top_widget.new_chat_button.clicked.connect(self.emit_llm_new_chat_req)
         self.llm_chat_widget.top_widget.history_menu.triggered.connect(self.emit_llm_load_chat_by_chat_id)
         self.llm_chat_widget.buttom_widget.pill_llm_widget.send_btn.clicked.connect(self.emit_user_question)
@@ -97,8 +99,14 @@ class SessionPage(QWidget):
     def llm_inline_chat(self, req: dict):
         payload = req.get('payload', {})
         payload['session_id'] = self.__session_id
+        if req.get('msg_code') == LLM_INLINE_ASK_CODE:
+            # 回答缓存开关对侧边栏对话和inline对话都生效
+            payload.setdefault('content', {})['use_answer_cache'] = self.is_answer_cache_enabled()
         self.SIG_SESSION_PAGE.emit(req)
 
+    def is_answer_cache_enabled(self) -> bool:
+        return self.llm_chat_widget.buttom_widget.pill_llm_widget.cache_check.isChecked()
+
     def emit_user_question(self):
         question = self.llm_chat_widget.buttom_widget.input_line.toPlainText().strip()
         self.llm_chat_widget.buttom_widget.input_line.clear()
@@ -109,7 +117,8 @@ class SessionPage(QWidget):
         self.llm_chat_widget.buttom_widget.pill_llm_widget.send_btn.setEnabled(False)
         current_llm_model = self.llm_chat_widget.buttom_widget.get_current_model_name()
         shell_content = ''
-        if self.llm_chat_widget.buttom_widget.pill_llm_widget.enable_check.isChecked():
+        use_screen_context = self.llm_chat_widget.buttom_widget.pill_llm_widget.enable_check.isChecked()
+        if use_screen_context:
             if self.text_browser.session_text_window.llm_shell_content_time_mark != \
                     self.text_browser.session_text_window.update_datetime:
                 self.text_browser.session_text_window.llm_shell_content_time_mark = \
@@ -126,6 +135,9 @@ class SessionPage(QWidget):
                         'llm_ask': question,
                         'llm_model_name': current_llm_model,
                         'shell_content_text': shell_content,
+                        # 屏幕没有变化时shell_content为空，由控制器使用最近一次的屏幕内容
+                        'use_screen_context': use_screen_context,
+                        'use_answer_cache': self.is_answer_cache_enabled(),
                     }
                 }
             }
@@ -143,6 +155,18 @@ class SessionPage(QWidget):
             }
         )
 
+    def emit_session_paste(self, text: str):
+        # 粘贴内容由后端分块发送，远端开启bracketed paste时加上粘贴标记
+        self.SIG_SESSION_PAGE.emit(
+            {
+                'msg_code': USER_COMMAND_CODE,
+                'payload': {
+                    'session_id': self.__session_id,
+                    'content': {'command': text, 'paste': True}
+                }
+            }
+        )
+
     def emit_session_scroll(self, scroll_info: dict):
         self.SIG_SESSION_PAGE.emit(
             {
@@ -167,12 +191,13 @@ class SessionPage(QWidget):
             }
         )
 
-    def emit_llm_chat_history_req(self):
+    def emit_llm_chat_history_req(self, offset: int = 0):
         self.SIG_SESSION_PAGE.emit(
             {
                 'msg_code': LLM_CHAT_HISTORY_REQ_CODE,
                 'payload': {
                     'session_id': self.__session_id,
+                    'content': {'offset': offset}
                 }
             }
         )
@@ -191,6 +216,9 @@ class SessionPage(QWidget):
     def emit_llm_load_chat_by_chat_id(self, action: QAction):
         history_idx = action.data()
         # print('history_idx', history_idx)
+        if isinstance(history_idx, dict):
+            self.emit_llm_chat_history_req(history_idx.get('next_offset', 0))
+            return
         self.SIG_SESSION_PAGE.emit(
             {
                 'msg_code': LLM_LOAD_CHAT_BY_HISTORY_IDX,
@@ -241,7 +269,7 @@ class SessionPage(QWidget):
             return
 
         if msg_code == LLM_CHAT_HISTORY_RSP_CODE:
-            self.llm_chat_widget.list_chat_history(payload.get('content', []))
+            self.llm_chat_widget.list_chat_history(payload.get('content', []), payload.get('next_offset'))
             return
 
         if msg_code == LLM_INLINE_MODEL_LIST_CODE:
@@ -16,6 +16,7 @@
 from PySide6.QtCore import Signal, Qt
 from PySide6.QtWidgets import QStackedWidget
 
+from src.common.common_definition import LOCAL_SHELL_HOSTNAME
 from src.common.msg_code import LOGIN_CODE
 from src.view.page_widget.login_page import LoginPage
 from src.view.page_widget.session_page import SessionPage
@@ -34,6 +35,7 @@ class SessionPageStack(QStackedWidget):
         self.setCurrentWidget(self.login_page)
 
         self.login_page.login_btn.clicked.connect(self.on_login)
+        self.login_page.local_btn.clicked.connect(self.on_local_login)
         self.login_page.password_input.returnPressed.connect(self.on_login)
         self.session_page.SIG_SESSION_PAGE.connect(self.SIG_COMMAND, type=Qt.ConnectionType.DirectConnection)
 
@@ -48,8 +50,16 @@ class SessionPageStack(QStackedWidget):
         self.login_page.password_input.clear()
         self.login_page.ip_input.setFocus()
 
+        self.emit_login(login_params)
+
+    def on_local_login(self):
+        self.login_page.loading_label.show()
+        self.login_page.loading_timer.start()
+        self.emit_login({'hostname': LOCAL_SHELL_HOSTNAME, 'local': True})
+
+    def emit_login(self, login_params: dict):
         self.login_page.login_btn.setEnabled(False)
-        self.session_page.calc_line_count()
+        self.login_page.local_btn.setEnabled(False)
         login_params['page_line_count'] = self.session_page.calc_line_count()
         self.SIG_COMMAND.emit(
             {
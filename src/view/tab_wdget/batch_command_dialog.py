@@ -0,0 +1,234 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import uuid
+from typing import Optional
+
+from PySide6.QtCore import SignalInstance
+from PySide6.QtWidgets import QDialog, QLabel, QPlainTextEdit, QCheckBox, QLineEdit, QSpinBox, QPushButton, \
+    QTableWidget, QTableWidgetItem, QHeaderView, QVBoxLayout, QHBoxLayout, QMessageBox, QAbstractItemView
+
+from src.common.common_definition import BATCH_STATUS_PENDING, BATCH_STATUS_RUNNING, BATCH_DEFAULT_MAX_CONCURRENCY
+from src.common.msg_code import BATCH_COMMAND_CODE, BATCH_CANCEL_CODE
+
+
+def parse_host_line(line: str, password: str) -> dict:
+    """'user@host[:port]' -> connect params."""
+    username, sep, address = line.strip().rpartition('@')
+    if not sep or not username or not address:
+        raise ValueError(f'invalid host "{line.strip()}", expected user@host[:port]')
+    hostname, _, port = address.partition(':')
+    return {'hostname': hostname, 'port': int(port) if port else 22, 'username': username, 'password': password}
+
+
+class BatchCommandDialog(QDialog):
+    COLUMNS = ['Host', 'Status', 'Exit', 'Duration', 'Stdout', 'Stderr']
+    CELL_TEXT_LENGTH = 80
+
+    def __init__(self, to_backend_sig: SignalInstance, parent=None):
+        super().__init__(parent)
+        self.to_backend_sig = to_backend_sig
+        self.setWindowTitle('Batch Command')
+        self.resize(900, 600)
+        self.batch_id: Optional[str] = None
+        self.host_count = 0
+        self.finished_indexes = set()
+
+        self.hosts_label = QLabel('Hosts, one per line (user@host[:port]):', self)
+        self.hosts_input = QPlainTextEdit(self)
+        self.hosts_input.setFixedHeight(90)
+        self.connected_hosts_checkbox = QCheckBox('Include connected hosts (reuse their connections)', self)
+        self.connected_hosts_checkbox.setChecked(True)
+        self.password_input = QLineEdit(self)
+        self.password_input.setPlaceholderText('Password for the hosts above')
+        self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
+
+        self.command_input = QLineEdit(self)
+        self.command_input.setPlaceholderText('Command, e.g. uptime')
+        self.command_input.returnPressed.connect(self.run_batch)
+        self.concurrency_label = QLabel('Concurrency:', self)
+        self.concurrency_spinbox = QSpinBox(self)
+        self.concurrency_spinbox.setRange(1, 64)
+        self.concurrency_spinbox.setValue(BATCH_DEFAULT_MAX_CONCURRENCY)
+        self.run_button = QPushButton('Run', self)
+        self.run_button.clicked.connect(self.run_batch)
+        self.cancel_button = QPushButton('Cancel', self)
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_batch)
+
+        command_layout = QHBoxLayout()
+        command_layout.addWidget(self.command_input, 1)
+        command_layout.addWidget(self.concurrency_label)
+        command_layout.addWidget(self.concurrency_spinbox)
+        command_layout.addWidget(self.run_button)
+        command_layout.addWidget(self.cancel_button)
+
+        self.status_label = QLabel('', self)
+        self.result_table = QTableWidget(0, len(BatchCommandDialog.COLUMNS), self)
+        self.result_table.setHorizontalHeaderLabels(BatchCommandDialog.COLUMNS)
+        self.result_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.result_table.verticalHeader().setVisible(False)
+        header = self.result_table.horizontalHeader()
+        for column in range(4):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
+        header.setSectionResizeMode(5, QHeaderView.ResizeMode.Stretch)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.hosts_label)
+        layout.addWidget(self.hosts_input)
+        layout.addWidget(self.connected_hosts_checkbox)
+        layout.addWidget(self.password_input)
+        layout.addLayout(command_layout)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.result_table, 1)
+        self.setLayout(layout)
+
+        self.setStyleSheet('''
+            QDialog {
+                background-color: #ffffff;
+            }
+            QLabel, QCheckBox {
+                font-size: 13px;
+            }
+            QLineEdit {
+                border: none;
+                height: 30px;
+                border-radius: 15px;
+                background-color: #EAEAEA;
+                font-family: Arial;
+                font-size: 13px;
+                padding-left: 10px;
+            }
+            QPushButton {
+                color: #105315;
+                background: #EAEAEA;
+                border: none;
+                width: 60px;
+                height: 30px;
+                border-radius: 15px;
+            }
+            QPushButton:hover {
+                background: #96E858;
+            }
+        ''')
+
+    def is_running(self) -> bool:
+        return self.batch_id is not None
+
+    def run_batch(self):
+        command = self.command_input.text().strip()
+        if not command or self.is_running():
+            return
+
+        try:
+            hosts = [
+                parse_host_line(line, self.password_input.text())
+                for line in self.hosts_input.toPlainText().splitlines() if line.strip()
+            ]
+        except ValueError as e:
+            QMessageBox.warning(self, 'error', str(e))
+            return
+
+        self.batch_id = str(uuid.uuid4())
+        self.host_count = 0
+        self.finished_indexes.clear()
+        self.result_table.setRowCount(0)
+        self.status_label.setText('starting...')
+        self.run_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.to_backend_sig.emit(
+            {
+                'msg_code': BATCH_COMMAND_CODE,
+                'payload': {
+                    'content': {
+                        'batch_id': self.batch_id,
+                        'command': command,
+                        'hosts': hosts,
+                        'connected_hosts': self.connected_hosts_checkbox.isChecked(),
+                        'max_concurrency': self.concurrency_spinbox.value(),
+                    }
+                }
+            }
+        )
+
+    def cancel_batch(self):
+        if self.batch_id is None:
+            return
+        self.to_backend_sig.emit(
+            {
+                'msg_code': BATCH_CANCEL_CODE,
+                'payload': {
+                    'content': {'batch_id': self.batch_id}
+                }
+            }
+        )
+        self.set_finished('cancelled')
+
+    def set_finished(self, status_text: str):
+        self.batch_id = None
+        self.status_label.setText(status_text)
+        self.run_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def update_result(self, msg_payload: dict):
+        content = msg_payload.get('content', {})
+        if content.get('batch_id') != self.batch_id:
+            return
+
+        row = content.get('row')
+        if row is None:
+            self.set_finished('no hosts to run on')
+            return
+
+        self.host_count = content.get('host_count', 0)
+        if self.result_table.rowCount() != self.host_count:
+            self.result_table.setRowCount(self.host_count)
+
+        index = row['index']
+        duration_secs = row.get('duration_secs')
+        exit_code = row.get('exit_code')
+        stdout = row.get('stdout', '')
+        stderr = row.get('stderr', '') or row.get('error', '')
+        if row.get('stdout_bytes', 0) > len(stdout.encode()):
+            stdout += f'\n... ({row["stdout_bytes"]} bytes in total)'
+        if row.get('stderr_bytes', 0) > len(row.get('stderr', '').encode()):
+            stderr += f'\n... ({row["stderr_bytes"]} bytes in total)'
+        cells = [
+            row.get('host', ''),
+            row.get('status', ''),
+            '' if exit_code is None else str(exit_code),
+            '' if duration_secs is None else f'{duration_secs:.2f}s',
+            stdout,
+            stderr,
+        ]
+        for column, text in enumerate(cells):
+            item = QTableWidgetItem(' '.join(text.split())[:BatchCommandDialog.CELL_TEXT_LENGTH])
+            if column >= 4:
+                item.setToolTip(text)
+            self.result_table.setItem(index, column, item)
+
+        if row.get('status') not in (BATCH_STATUS_PENDING, BATCH_STATUS_RUNNING):
+            self.finished_indexes.add(index)
+        if len(self.finished_indexes) == self.host_count:
+            self.set_finished(f'finished on {self.host_count} hosts')
+        else:
+            self.status_label.setText(f'{len(self.finished_indexes)}/{self.host_count} hosts finished')
+
+    def closeEvent(self, event):
+        if self.is_running():
+            self.cancel_batch()
+        super().closeEvent(event)
@@ -17,15 +17,18 @@ import json
 import random
 import uuid
 
-from PySide6.QtCore import Qt, SignalInstance, QSize
+from PySide6.QtCore import Qt, SignalInstance, QSize, QPoint
+from PySide6.QtGui import QColor
 from PySide6.QtWidgets import QTabWidget, QPushButton, QWidget, QHBoxLayout, QMessageBox, QDialog, QDialogButtonBox, \
-    QLineEdit, QLabel, QVBoxLayout, QComboBox
+    QLineEdit, QLabel, QVBoxLayout, QComboBox, QMenu
 
-from src.common.common_definition import RESPONSE_LOGIN_SUCCESS, FONT_SIZE_RANGE, set_session_widget_height, FONT_LIST, \
-    BASE_DIR
-from src.common.msg_code import LOGIN_CODE, REMOVE_SESSION_CODE, LLM_SERVER_URL_UPDATE_CODE
+from src.common.common_definition import RESPONSE_LOGIN_SUCCESS, RESPONSE_LOGIN_IN_PROGRESS, FONT_SIZE_RANGE, \
+    set_session_widget_height, FONT_LIST, BASE_DIR
+from src.common.msg_code import LOGIN_CODE, REMOVE_SESSION_CODE, LLM_SERVER_URL_UPDATE_CODE, SESSION_VISIBILITY_CODE, \
+    BROADCAST_GROUP_CODE
 from src.view.page_widget.component_object.svg_icon import get_icon_from_svg
 from src.view.page_widget.session_page_stack import SessionPageStack
+from src.view.tab_wdget.batch_command_dialog import BatchCommandDialog
 
 
 class SettingDialog(QDialog):
@@ -144,7 +147,9 @@ class SettingDialog(QDialog):
         return settings
 
     def save_settings(self):
+        # 保留对话框中没有的设置项，例如 record_sessions
         settings = {
+            **self.load_settings(),
             "llm_server": self.llm_server_address_input.text().strip(),
             "llm_port": int(self.llm_server_port_input.text().strip()),
             "font": self.shell_font_combobox.currentText().strip(),
@@ -204,6 +209,7 @@ class SettingDialog(QDialog):
 
 class SessionTabWidget(QTabWidget):
     HOME_TAB_TITLE = '*new session*'
+    BROADCAST_TAB_COLOR = QColor('#D2691E')
     TAB_ICONS = [
         0x1f603,  # 😃
         0x1f609,  # 😉
@@ -309,6 +315,8 @@ class SessionTabWidget(QTabWidget):
         self.setElideMode(Qt.TextElideMode.ElideRight)
         self.tabCloseRequested.connect(self.on_tab_close_requested)
         self.currentChanged.connect(self.on_tab_changed)
+        self.tabBar().setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.tabBar().customContextMenuRequested.connect(self.show_tab_context_menu)
 
         corner_widget = QWidget()
         corner_layout = QHBoxLayout()
@@ -386,6 +394,40 @@ class SessionTabWidget(QTabWidget):
           <!-- 横线 -->
           <rect x="22" y="38" width="20" height="2" fill="#6c6f73" />
         </svg>'''
+        batch_svg_icon = '''<svg width="64" height="64" viewBox="0 0 64 64" xmlns="http://www.w3.org/2000/svg">
+          <!-- 后面两层终端窗口 -->
+          <rect x="16" y="6" width="42" height="30" rx="4" ry="4"
+                fill="#ffffff" stroke="#6c6f73" stroke-width="1.5"/>
+          <rect x="11" y="13" width="42" height="30" rx="4" ry="4"
+                fill="#ffffff" stroke="#6c6f73" stroke-width="1.5"/>
+          <!-- 最前面的终端窗口 -->
+          <rect x="6" y="20" width="42" height="34" rx="4" ry="4"
+                fill="#C8E8FF" stroke="#6c6f73" stroke-width="1.5"/>
+          <!-- 提示符 -->
+          <path d="M14 31 L20 36 L14 41" fill="none" stroke="#6c6f73" stroke-width="2"
+                stroke-linecap="round" stroke-linejoin="round"/>
+          <rect x="23" y="40" width="12" height="2" fill="#6c6f73" />
+        </svg>'''
+        self.batch_button = QPushButton()
+        self.batch_button.setIcon(get_icon_from_svg(batch_svg_icon))
+        self.batch_button.setToolTip('Run a command on many hosts')
+        self.batch_button.setStyleSheet("""
+            QPushButton{
+                border: none;
+                width: 30px;
+                height: 30px;
+                border-radius: 5px;
+                margin-right: 1px;
+                margin-left: 1px;
+                margin-top: 6px;
+                margin-bottom: 2px;
+            }
+            QPushButton:hover{
+                background: #d0d0d0;
+            }""")
+        self.batch_button.setIconSize(QSize(23, 23))
+        self.batch_button.clicked.connect(self.open_batch_command_dialog)
+
         self.add_button = QPushButton()
         self.add_button.setIcon(get_icon_from_svg(add_svg_icon))
         self.add_button.setStyleSheet("""
@@ -533,6 +575,7 @@ class SessionTabWidget(QTabWidget):
         self.llm_chat_button.clicked.connect(self.toggle_current_tab_chat)
 
         corner_layout.addWidget(self.setting_button)
+        corner_layout.addWidget(self.batch_button)
         corner_layout.addWidget(self.add_button)
         corner_layout.addWidget(self.llm_chat_button)
 
@@ -540,6 +583,10 @@ class SessionTabWidget(QTabWidget):
         self.setCornerWidget(corner_widget)
 
         self.session_page_map = {}
+        self.visible_session_id = None
+        # 广播组：在组内任一标签页的输入会同时发送到组内所有标签页
+        self.broadcast_session_ids = set()
+        self.batch_dialog = None
         self.add_new_tab()
 
     def init_session_widget_height(self):
@@ -556,6 +603,18 @@ class SessionTabWidget(QTabWidget):
             QMessageBox.information(self, "Settings Saved", "Settings have been saved successfully.",
                                     QMessageBox.StandardButton.Ok)
 
+    def open_batch_command_dialog(self):
+        # 非模态窗口，命令执行期间仍可操作各个标签页
+        if self.batch_dialog is None:
+            self.batch_dialog = BatchCommandDialog(self.to_backend_signal, self)
+        self.batch_dialog.show()
+        self.batch_dialog.raise_()
+        self.batch_dialog.activateWindow()
+
+    def update_batch_result(self, msg_payload: dict):
+        if self.batch_dialog is not None:
+            self.batch_dialog.update_result(msg_payload)
+
     def add_new_tab(self):
         session_id = str(uuid.uuid4())
         page_stack = SessionPageStack(session_id)
@@ -574,6 +633,9 @@ class SessionTabWidget(QTabWidget):
             session_id = page_stack.session_id
             if session_id in self.session_page_map:
                 del self.session_page_map[session_id]
+            if session_id in self.broadcast_session_ids:
+                self.broadcast_session_ids.discard(session_id)
+                self.emit_broadcast_group()
             page_stack.deleteLater()
             remove_msg = {
                 'msg_code': REMOVE_SESSION_CODE,
@@ -588,15 +650,86 @@ class SessionTabWidget(QTabWidget):
 
     def on_tab_changed(self, index):
         # print(f'on_tab_changed: index={index}')
-        if index == -1:
-            return
+        widget = self.widget(index) if index != -1 else None
+        self.update_visible_session(widget.session_id if isinstance(widget, SessionPageStack) else None)
 
-        widget = self.widget(index)
         if isinstance(widget, SessionPageStack):
             widget.set_focus()
             # title = self.tabText(index)
             # print(title, widget.session_id)
 
+    def update_visible_session(self, session_id: str | None):
+        # 通知后台: 切到后台的会话暂停生成画面帧，切到前台的会话推送一帧完整画面
+        if session_id == self.visible_session_id:
+            return
+
+        if self.visible_session_id in self.session_page_map:
+            self.emit_session_visibility(self.visible_session_id, False)
+        self.visible_session_id = session_id
+        if session_id is not None:
+            self.emit_session_visibility(session_id, True)
+
+    def emit_session_visibility(self, session_id: str, is_visible: bool):
+        self.to_backend_signal.emit(
+            {
+                'msg_code': SESSION_VISIBILITY_CODE,
+                'payload': {
+                    'session_id': session_id,
+                    'content': {'visible': is_visible}
+                }
+            }
+        )
+
+    def show_tab_context_menu(self, pos: QPoint):
+        index = self.tabBar().tabAt(pos)
+        page_stack = self.widget(index) if index != -1 else None
+        if not isinstance(page_stack, SessionPageStack):
+            return
+
+        menu = QMenu(self)
+        broadcast_action = menu.addAction('Broadcast input')
+        broadcast_action.setCheckable(True)
+        broadcast_action.setChecked(page_stack.session_id in self.broadcast_session_ids)
+        broadcast_action.toggled.connect(lambda checked: self.set_tab_broadcast(index, checked))
+        menu.exec(self.tabBar().mapToGlobal(pos))
+
+    def set_tab_broadcast(self, index: int, is_broadcast: bool):
+        page_stack = self.widget(index)
+        if not isinstance(page_stack, SessionPageStack):
+            return
+
+        if is_broadcast:
+            self.broadcast_session_ids.add(page_stack.session_id)
+            self.tabBar().setTabTextColor(index, SessionTabWidget.BROADCAST_TAB_COLOR)
+        else:
+            self.broadcast_session_ids.discard(page_stack.session_id)
+            self.tabBar().setTabTextColor(index, QColor())
+            self.setTabToolTip(index, '')
+        self.emit_broadcast_group()
+
+    def emit_broadcast_group(self):
+        self.to_backend_signal.emit(
+            {
+                'msg_code': BROADCAST_GROUP_CODE,
+                'payload': {
+                    'content': {'session_ids': sorted(self.broadcast_session_ids)}
+                }
+            }
+        )
+
+    def update_broadcast_stats(self, msg_payload: dict):
+        targets = msg_payload.get('content', {}).get('targets', {})
+        for index in range(self.count()):
+            page_stack = self.widget(index)
+            if not isinstance(page_stack, SessionPageStack) or page_stack.session_id not in self.broadcast_session_ids:
+                continue
+            if stats := targets.get(page_stack.session_id):
+                self.setTabToolTip(
+                    index,
+                    f'broadcast send latency: last {stats["last_ms"]:.1f}ms, avg {stats["avg_ms"]:.1f}ms, '
+                    f'max {stats["max_ms"]:.1f}ms ({stats["count"]} sends)'
+                )
+
     def handle_login_rsp_msg(self, msg_payload: dict):
         session_id = msg_payload.get('session_id')
         page_stack: SessionPageStack = self.session_page_map.get(session_id)
@@ -605,6 +738,10 @@ class SessionTabWidget(QTabWidget):
 
         content = msg_payload.get('content', {})
         login_result = content.get('result')
+        if login_result == RESPONSE_LOGIN_IN_PROGRESS:
+            page_stack.login_page.set_login_stage(content.get('stage', ''))
+            return
+
         if login_result != RESPONSE_LOGIN_SUCCESS:
             QMessageBox.warning(self, "Login Failed", f"login result: {login_result}")
             page_stack.login_page.reset_login_state()
@@ -628,7 +765,8 @@ class SessionTabWidget(QTabWidget):
         for msg in msg_list:
             if session_id := msg.get('session_id'):
                 page_stack: SessionPageStack = self.session_page_map.get(session_id)
-                if page_stack is None:
+                # 后台标签页不重绘，切回前台时后台会重新推送完整画面
+                if page_stack is None or session_id != self.visible_session_id:
                     continue
                 page_stack.update_text_browser(msg)
 
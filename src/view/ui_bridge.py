@@ -18,11 +18,15 @@ from multiprocessing.connection import Connection
 
 from PySide6.QtCore import Qt, Signal, QThread
 
+from src.common.msg_codec import recv_msg
+from src.view.backend_sender import BackendSender
 from src.view.main_window import MainWindow
+from src.view.view_msg_coalescer import ViewMsgCoalescer
 
 
 class UiBridge(QThread):
     SIG_2_FRONT = Signal(dict)
+    SIG_DRAIN = Signal()
 
     SLEEP_MS = 30
     TO_FRONT_SHM_SIZE = 10 * 1024 * 1024  # 10MB
@@ -31,14 +35,22 @@ class UiBridge(QThread):
     def __init__(self, fr_side: Connection):
         super().__init__()
         self.fr_side = fr_side
+        self.__coalescer = ViewMsgCoalescer()
+        self.__backend_sender = BackendSender(fr_side)
+        self.__backend_sender.start()
+        self.__is_send_rejected = False
         logging.info('ui bridge init')
 
     def connect_ui_signals(self, main_window: MainWindow):
         main_window.SIG_2_BACKEND.connect(
             self.send_msg_to_backend, type=Qt.ConnectionType.DirectConnection
         )
+        # SIG_2_FRONT 只在GUI线程的drain_to_front中发出，因此直接调用
         self.SIG_2_FRONT.connect(
-            main_window.update_view, type=Qt.ConnectionType.QueuedConnection
+            main_window.update_view, type=Qt.ConnectionType.DirectConnection
+        )
+        self.SIG_DRAIN.connect(
+            self.drain_to_front, type=Qt.ConnectionType.QueuedConnection
         )
 
     def run(self):
@@ -47,6 +59,8 @@ class UiBridge(QThread):
         print('ui bridge stopped')
 
     def stop(self):
+        self.__backend_sender.stop()
+        print(f'backend sender stats: {self.__backend_sender.stats()}')
         try:
             if self.fr_side and not self.fr_side.closed:
                 self.fr_side.close()
@@ -57,12 +71,27 @@ class UiBridge(QThread):
     def __loop_trigger_view_update(self):
         while True:
             try:
-                msg = self.fr_side.recv()
-                self.SIG_2_FRONT.emit(msg)
+                msg = recv_msg(self.fr_side)
             except (EOFError, OSError, ValueError):
                 break
 
+            # GUI线程尚未取走的旧画面帧被新帧替换，只在队列由空变为非空时唤醒GUI线程
+            if self.__coalescer.put(msg):
+                self.SIG_DRAIN.emit()
+
+    def drain_to_front(self):
+        for msg in self.__coalescer.take_all():
+            self.SIG_2_FRONT.emit(msg)
+
     def send_msg_to_backend(self, data: dict):
         # print('\x1b[1:31msend_msg_to_backend\x1b[m', data)
-        if not self.fr_side.closed:
-            self.fr_side.send(data)
+        # 在GUI线程中调用，只入队不阻塞，由BackendSender线程写管道
+        is_queued = self.__backend_sender.put(data)
+        # 只在开始拒绝时报告一次，避免控制器卡住时每次按键都输出
+        if not is_queued and not self.__is_send_rejected:
+            print(f'backend is not reading, msg rejected: {data.get("msg_code")}, '
+                  f'stats: {self.__backend_sender.stats()}')
+        self.__is_send_rejected = not is_queued
+
+    def get_send_stats(self) -> dict:
+        return self.__backend_sender.stats()
@@ -0,0 +1,82 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from collections import deque
+from threading import Lock
+from typing import Dict, List
+
+from src.common.msg_code import SESSION_VIEW_CONTENT_CODE
+
+
+class ViewMsgCoalescer:
+    """
+    Holds messages received from the controller until the GUI thread takes them.
+
+    View frames are full frames, so an undelivered frame of a session is replaced by a newer one and
+    keeps its original position. All other messages (LLM tokens, login responses, ...) are kept in
+    arrival order.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__pending = deque()  # (session_id, None) for view frames, (None, msg) for other messages
+        self.__latest_frames: Dict[str, dict] = {}  # session_id: newest undelivered frame
+        self.__dropped_frame_count = 0
+
+    @property
+    def dropped_frame_count(self) -> int:
+        return self.__dropped_frame_count
+
+    def put(self, msg: dict) -> bool:
+        """Return True when the consumer has to be woken up, i.e. nothing was pending before."""
+        with self.__lock:
+            need_wakeup = not self.__pending
+
+            if msg.get('msg_code') != SESSION_VIEW_CONTENT_CODE:
+                self.__pending.append((None, msg))
+                return need_wakeup
+
+            for frame in msg.get('payload', []):
+                session_id = frame.get('session_id')
+                if session_id in self.__latest_frames:
+                    self.__dropped_frame_count += 1
+                else:
+                    self.__pending.append((session_id, None))
+                self.__latest_frames[session_id] = frame
+
+            return need_wakeup
+
+    def take_all(self) -> List[dict]:
+        with self.__lock:
+            pending, self.__pending = self.__pending, deque()
+            latest_frames, self.__latest_frames = self.__latest_frames, {}
+
+        # 连续的画面帧合并为一条消息，与原有的批量格式保持一致
+        msgs = []
+        frames = []
+        for session_id, msg in pending:
+            if msg is None:
+                frames.append(latest_frames[session_id])
+                continue
+
+            if frames:
+                msgs.append({'msg_code': SESSION_VIEW_CONTENT_CODE, 'payload': frames})
+                frames = []
+            msgs.append(msg)
+
+        if frames:
+            msgs.append({'msg_code': SESSION_VIEW_CONTENT_CODE, 'payload': frames})
+
+        return msgs
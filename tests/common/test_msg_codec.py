@@ -0,0 +1,101 @@
+from unittest import TestCase
+
+from src.common.font_style import FontStyle, StyleTuple
+from src.common.msg_code import SESSION_VIEW_CONTENT_CODE, LLM_ANSWER_CODE, SCROLL_WINDOW_CODE, USER_COMMAND_CODE, \
+    LOGIN_RSP_CODE
+from src.common.msg_codec import encode_msg, decode_msg, PICKLE_FALLBACK_TAG
+
+
+class TestMsgCodec(TestCase):
+    def assert_round_trip(self, msg: dict, binary: bool = True):
+        data = encode_msg(msg)
+        self.assertEqual(data[0] != PICKLE_FALLBACK_TAG, binary)
+        return decode_msg(data)
+
+    def test_view_content(self):
+        red = StyleTuple(
+            bold=True, italic=False, opacity=0.5, visible=True, underline=True,
+            background_color='#FFFFFF', foreground_color='#800000'
+        )
+        msg = {
+            'msg_code': SESSION_VIEW_CONTENT_CODE,
+            'payload': [
+                {
+                    'session_id': 'session-1',
+                    'view_area': {
+                        'view_area_content': [
+                            [(FontStyle.DEFAULT_STYLE_TUPLE, 'ls -l'), (red, '错误 error')],
+                            [],
+                            [(None, ''), (red, 'tail')],
+                        ],
+                        'cursor_pos': (3, 5)
+                    },
+                    'scroll_info': {
+                        'total_lines': 120, 'visible_lines': 40, 'first_visible_line': 81, 'hide_scrollbar': False
+                    }
+                },
+                {
+                    'session_id': 'session-2',
+                    'view_area': {'view_area_content': [[(red, 'a\x00b')]], 'cursor_pos': None},
+                    'scroll_info': {
+                        'total_lines': 1, 'visible_lines': 1, 'first_visible_line': 1, 'hide_scrollbar': True
+                    }
+                }
+            ]
+        }
+
+        result = self.assert_round_trip(msg)
+        self.assertEqual(result['msg_code'], SESSION_VIEW_CONTENT_CODE)
+        self.assertEqual(len(result['payload']), 2)
+
+        for frame, expected_frame in zip(result['payload'], msg['payload']):
+            self.assertEqual(frame['session_id'], expected_frame['session_id'])
+            self.assertEqual(frame['scroll_info'], expected_frame['scroll_info'])
+            self.assertEqual(frame['view_area']['cursor_pos'], expected_frame['view_area']['cursor_pos'])
+
+            lines = frame['view_area']['view_area_content']
+            expected_lines = expected_frame['view_area']['view_area_content']
+            self.assertEqual(len(lines), len(expected_lines))
+            for line, expected_line in zip(lines, expected_lines):
+                self.assertEqual([text for _, text in line], [text for _, text in expected_line])
+                for (style, _), (expected_style, _) in zip(line, expected_line):
+                    if expected_style is None:
+                        self.assertIsNone(style)
+                    else:
+                        self.assertTrue(style.is_equal(expected_style))
+
+    def test_llm_answer(self):
+        msg = {
+            'msg_code': LLM_ANSWER_CODE,
+            'payload': {
+                'session_id': 'session-1',
+                'chat_session_id': 'side_chat_id',
+                'is_think': True,
+                'content': '<think>\n\n思考',
+                'is_done': False
+            }
+        }
+        self.assertEqual(self.assert_round_trip(msg), msg)
+
+    def test_scroll_window(self):
+        for content in [{'move': -3}, {'start_line_num': 42}, {}]:
+            msg = {'msg_code': SCROLL_WINDOW_CODE, 'payload': {'session_id': 'session-1', 'content': content}}
+            self.assertEqual(self.assert_round_trip(msg), msg)
+
+    def test_user_command(self):
+        msg = {'msg_code': USER_COMMAND_CODE, 'payload': {'session_id': 'session-1', 'content': {'command': '\x1b[A'}}}
+        self.assertEqual(self.assert_round_trip(msg), msg)
+
+    def test_pickle_fallback(self):
+        control_msg = {
+            'msg_code': LOGIN_RSP_CODE,
+            'payload': {'session_id': 'session-1', 'content': {'result': 'success', 'page_line_count': 40}}
+        }
+        self.assertEqual(self.assert_round_trip(control_msg, binary=False), control_msg)
+
+        # 未知字段不能被紧凑格式静默丢弃
+        extended_msg = {
+            'msg_code': USER_COMMAND_CODE,
+            'payload': {'session_id': 'session-1', 'content': {'command': 'x', 'paste': True}}
+        }
+        self.assertEqual(self.assert_round_trip(extended_msg, binary=False), extended_msg)
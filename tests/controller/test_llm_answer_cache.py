@@ -0,0 +1,51 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase, mock
+
+from src.controller.llm_answer_cache import LlmAnswerCache
+
+
+class TestLlmAnswerCache(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.cache_dir.name)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_key_normalizes_whitespace(self):
+        messages = [{'role': 'user', 'content': 'what does this mean?\n\n\n\nerror 42   \n'}]
+        same_messages = [{'role': 'user', 'content': '  what does this mean?\n\nerror 42'}]
+        self.assertEqual(LlmAnswerCache.make_key('m', messages), LlmAnswerCache.make_key('m', same_messages))
+        self.assertNotEqual(LlmAnswerCache.make_key('m', messages), LlmAnswerCache.make_key('n', messages))
+
+    def test_memory_lru_and_disk_tier(self):
+        cache = LlmAnswerCache(self.path, max_memory_entries=2)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, 'm', [[False, f'answer {key}']])
+        self.assertEqual(2, cache.stats()['memory_entry_count'])
+
+        # 被LRU淘汰的条目从磁盘读取，重启后仍然可用
+        self.assertEqual([[False, 'answer a']], cache.get('a'))
+        reopened = LlmAnswerCache(self.path)
+        self.assertEqual([[False, 'answer c']], reopened.get('c'))
+        self.assertEqual(3, reopened.stats()['disk_entry_count'])
+        self.assertIsNone(reopened.get('missing'))
+
+    def test_size_eviction_keeps_recently_used(self):
+        cache = LlmAnswerCache(self.path, max_memory_entries=1, max_disk_bytes=400)
+        cache.put('a', 'm', [[False, 'x' * 100]])
+        cache.put('b', 'm', [[False, 'y' * 100]])
+        cache.get('a')
+        cache.put('c', 'm', [[False, 'z' * 100]])
+
+        self.assertLessEqual(cache.stats()['disk_bytes'], 400)
+        self.assertEqual({'a.json', 'c.json'}, {path.name for path in self.path.iterdir()})
+
+    def test_ttl(self):
+        cache = LlmAnswerCache(self.path, ttl_secs=60)
+        cache.put('a', 'm', [[False, 'answer']])
+        with mock.patch('src.controller.llm_answer_cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get('a'))
+        self.assertFalse((self.path / 'a.json').exists())
@@ -0,0 +1,67 @@
+import queue
+import time
+from unittest import TestCase
+
+from src.common.msg_code import LLM_ANSWER_CODE
+from src.controller.llm_answer_coalescer import LlmAnswerCoalescer
+
+
+def answer(session_id: str, content: str, is_think: bool = False, is_done: bool = False) -> dict:
+    return {
+        'msg_code': LLM_ANSWER_CODE,
+        'payload': {
+            'session_id': session_id, 'chat_session_id': 'chat', 'is_think': is_think, 'content': content,
+            'is_done': is_done
+        }
+    }
+
+
+class TestLlmAnswerCoalescer(TestCase):
+    def setUp(self):
+        self.response_queue = queue.Queue()
+        self.coalescer = LlmAnswerCoalescer(self.response_queue, flush_interval_secs=0.05)
+        self.coalescer.start()
+
+    def tearDown(self):
+        self.coalescer.stop()
+        self.coalescer.join(1)
+
+    def take(self) -> list:
+        msgs = []
+        while not self.response_queue.empty():
+            msg = self.response_queue.get()
+            msgs.append((msg['payload']['session_id'], msg['payload']['is_think'], msg['payload']['content'],
+                         msg['payload']['is_done']))
+        return msgs
+
+    def test_batches_by_state_and_done(self):
+        self.coalescer.put(answer('s1', '<think>', is_think=True))
+        self.coalescer.put(answer('s1', 'hmm', is_think=True))
+        self.coalescer.put(answer('s2', 'other'))
+        self.coalescer.put(answer('s1', 'the'))
+        self.coalescer.put(answer('s1', ' answer'))
+        self.coalescer.put(answer('s1', '\n\n', is_done=True))
+
+        # think和回答的切换、回答结束时立即发送，不需要等待定时器
+        self.assertEqual(
+            [('s1', True, '<think>hmm', False), ('s1', False, 'the answer\n\n', True)], self.take()
+        )
+        time.sleep(0.15)
+        self.assertEqual([('s2', False, 'other', False)], self.take())
+        self.assertEqual({'chunk_count': 6, 'flush_count': 3}, self.coalescer.stats())
+
+    def test_timer_flush_keeps_streaming(self):
+        for idx in range(10):
+            self.coalescer.put(answer('s1', f'{idx} '))
+            time.sleep(0.02)
+        time.sleep(0.1)
+
+        msgs = self.take()
+        self.assertEqual('0 1 2 3 4 5 6 7 8 9 ', ''.join(msg[2] for msg in msgs))
+        # 慢速输出期间仍然按定时器分批发送
+        self.assertTrue(2 <= len(msgs) <= 6, msgs)
+
+    def test_stop_flushes_pending(self):
+        self.coalescer.put(answer('s1', 'partial'))
+        self.coalescer.stop()
+        self.assertEqual([('s1', False, 'partial', False)], self.take())
@@ -0,0 +1,67 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from src.controller.llm_chat_store import LlmChatStore
+
+
+class TestLlmChatStore(TestCase):
+    def setUp(self):
+        self.record_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.record_dir.name)
+
+    def tearDown(self):
+        self.record_dir.cleanup()
+
+    def test_append_list_and_load(self):
+        store = LlmChatStore(self.path / 'chat_records.db')
+        chat_ids = []
+        for idx in range(5):
+            message_list = [{'role': 'user', 'content': f'q{idx}', 'org_user_msg': f'question {idx}'}]
+            chat_ids.append(store.create_chat(f'2025-01-0{idx + 1}', message_list))
+            store.append_messages(chat_ids[-1], message_list)
+        store.append_messages(chat_ids[0], [{'role': 'assistant', 'content': 'a0'}])
+        store.close()
+
+        store = LlmChatStore(self.path / 'chat_records.db')
+        rows, has_more = store.list_chats(0, 2, exclude_ids=[chat_ids[4]])
+        self.assertEqual([(chat_ids[3], '2025-01-04', 'question 3'), (chat_ids[2], '2025-01-03', 'question 2')], rows)
+        self.assertTrue(has_more)
+        rows, has_more = store.list_chats(2, 2, exclude_ids=[chat_ids[4]])
+        self.assertEqual([chat_ids[1], chat_ids[0]], [row[0] for row in rows])
+        self.assertFalse(has_more)
+
+        self.assertEqual(
+            {
+                'start_time': '2025-01-01',
+                'message_list': [
+                    {'role': 'user', 'content': 'q0', 'org_user_msg': 'question 0', 'shell_context': None},
+                    {'role': 'assistant', 'content': 'a0'}
+                ]
+            },
+            store.load_chat(chat_ids[0])
+        )
+        self.assertIsNone(store.load_chat(1000))
+        store.close()
+
+    def test_migrate_json(self):
+        json_path = self.path / 'chat_records.json'
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([
+                {'start_time': 't1', 'chat_id': 'side', 'message_list': [
+                    {'role': 'user', 'content': 'c', 'org_user_msg': 'old question'},
+                    {'role': 'assistant', 'content': 'old answer'}
+                ]},
+                {'start_time': 't2', 'chat_id': 'side', 'message_list': []},
+            ], f)
+
+        store = LlmChatStore(self.path / 'chat_records.db')
+        self.assertEqual(1, store.migrate_json(json_path))
+        self.assertFalse(json_path.exists())
+        rows, _ = store.list_chats(0, 10)
+        self.assertEqual('old question', rows[0][2])
+        self.assertEqual('old answer', store.load_chat(rows[0][0])['message_list'][1]['content'])
+        # 只导入一次
+        self.assertEqual(0, store.migrate_json(json_path))
+        store.close()
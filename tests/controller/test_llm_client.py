@@ -0,0 +1,349 @@
+import json
+import queue
+import select
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import TestCase, mock
+
+from src.common.common_definition import SIDE_CHAT_ID
+from src.common.msg_code import LLM_SERVER_URL_UPDATE_CODE, LLM_ASK_CODE, LLM_ANSWER_CODE, LLM_MODEL_CHECK, LLM_MODEL_LIST_CODE, \
+    LLM_THREAD_STOP, LLM_CANCEL_CODE, LLM_CHAT_HISTORY_REQ_CODE, LLM_CHAT_HISTORY_RSP_CODE, LLM_NEW_CHAT_CODE, \
+    LLM_LOAD_CHAT_BY_HISTORY_IDX, LLM_RSP_CHAT_BY_CHAT_ID, REMOVE_SESSION_CODE
+from src.controller.llm_chat_store import LlmChatStore
+from src.controller.llm_client import LlmClient, LlmGeneration
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    # 模型名为slow时逐行慢速输出，hang时输出一行后长时间不输出
+    SLOW_LINE_SECS = 0.2
+    disconnected = threading.Event()
+    ps_failures_left = 0
+    ps_request_count = 0
+    ps_models = ['fast', 'slow']
+    requests = []
+    # 与ollama一样使用chunked编码逐行输出
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        FakeOllamaHandler.ps_request_count += 1
+        if FakeOllamaHandler.ps_failures_left > 0:
+            FakeOllamaHandler.ps_failures_left -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        models = [{'name': name, 'expires_at': time.time()} for name in FakeOllamaHandler.ps_models]
+        self.send_json_lines([{'models': models}])
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        FakeOllamaHandler.requests.append(request)
+        # 第一行是问题的标题，第二行是问题
+        question = request['messages'][-1]['content'].split('\n')[1]
+        words = [f'{question}-{idx}' for idx in range(3)]
+        lines = [{'message': {'content': word}, 'done': idx == len(words) - 1} for idx, word in enumerate(words)]
+        if request['model'] == 'hang':
+            self.send_json_lines(lines[:1] + [None] * 50 + lines[1:], FakeOllamaHandler.SLOW_LINE_SECS)
+        else:
+            self.send_json_lines(lines, FakeOllamaHandler.SLOW_LINE_SECS if request['model'] == 'slow' else 0)
+
+    def send_json_lines(self, lines: list, delay_secs: float = 0):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for line in lines:
+                if line is not None:
+                    data = json.dumps(line).encode() + b'\n'
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                    self.wfile.flush()
+                elif select.select([self.connection], [], [], 0)[0] and \
+                        self.connection.recv(1, socket.MSG_PEEK) == b'':
+                    # 客户端断开连接
+                    raise ConnectionResetError()
+                time.sleep(delay_secs)
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            FakeOllamaHandler.disconnected.set()
+
+
+class TestLlmClient(TestCase):
+    def setUp(self):
+        FakeOllamaHandler.ps_models = ['fast', 'slow']
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllamaHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        # 回答缓存在最后一条回答之后写入，stop时流式线程可能还在写
+        self.record_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.base_dir_patch = mock.patch('src.controller.llm_client.BASE_DIR', Path(self.record_dir.name))
+        self.base_dir_patch.start()
+
+        self.query_queue = queue.Queue()
+        self.response_queue = queue.Queue()
+        self.client = LlmClient(
+            f'http://127.0.0.1:{self.server.server_port}', self.query_queue, self.response_queue, max_concurrency=2,
+            answer_flush_interval_secs=0
+        )
+        self.client.start()
+
+    def tearDown(self):
+        self.query_queue.put({'msg_code': LLM_THREAD_STOP, 'payload': {}})
+        self.client.join(5)
+        self.base_dir_patch.stop()
+        self.record_dir.cleanup()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def ask(self, session_id: str, question: str, model: str, chat_id: str = SIDE_CHAT_ID, shell_content: str = '',
+            use_answer_cache: bool = True):
+        self.query_queue.put(
+            {
+                'msg_code': LLM_ASK_CODE,
+                'payload': {
+                    'session_id': session_id,
+                    'content': {
+                        'chat_session_id': chat_id, 'llm_ask': question, 'llm_model_name': model,
+                        'shell_content_text': shell_content, 'use_screen_context': True,
+                        'use_answer_cache': use_answer_cache
+                    }
+                }
+            }
+        )
+
+    def collect(self, predicate, timeout: float = 10) -> list:
+        msgs = []
+        deadline = time.monotonic() + timeout
+        while not predicate(msgs):
+            msgs.append(self.response_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+        return msgs
+
+    def test_sessions_stream_concurrently_and_keep_order(self):
+        self.ask('s1', 'first', 'slow')
+        # 不同对话的问题互不取消
+        self.ask('s1', 'second', 'fast', chat_id='another')
+        self.ask('s2', 'other', 'fast')
+        self.query_queue.put({'msg_code': LLM_MODEL_CHECK, 'payload': {'session_id': 's3'}})
+
+        def answers(msgs, session_id):
+            return [msg['payload']['content'].strip() for msg in msgs
+                    if msg['msg_code'] == LLM_ANSWER_CODE and msg['payload']['session_id'] == session_id]
+
+        msgs = self.collect(lambda x: len(answers(x, 's1')) == 6)
+        s1_done_idx = len(msgs) - 1
+        # s2 的回答和模型列表不需要等待 s1 的慢速回答
+        s2_done_idx = [idx for idx, msg in enumerate(msgs) if msg['payload']['session_id'] == 's2'][-1]
+        model_idx = [idx for idx, msg in enumerate(msgs) if msg['msg_code'] == LLM_MODEL_LIST_CODE][0]
+        self.assertLess(s2_done_idx, s1_done_idx)
+        self.assertLess(model_idx, s1_done_idx)
+        self.assertEqual(['other-0', 'other-1', 'other-2'], answers(msgs, 's2'))
+        # 同一session的问题按顺序回答
+        self.assertEqual(
+            ['first-0', 'first-1', 'first-2', 'second-0', 'second-1', 'second-2'], answers(msgs, 's1')
+        )
+
+    def test_cancel_stops_generation(self):
+        FakeOllamaHandler.disconnected.clear()
+        self.ask('s1', 'long', 'hang')
+        self.collect(lambda x: len(x) == 1)
+        self.query_queue.put(
+            {'msg_code': LLM_CANCEL_CODE, 'payload': {'session_id': 's1', 'content': {'chat_session_id': SIDE_CHAT_ID}}}
+        )
+        # 服务端感知到断开，不再有后续输出
+        self.assertTrue(FakeOllamaHandler.disconnected.wait(5))
+        self.assertTrue(self.response_queue.empty())
+
+    def test_remove_session_drops_its_state(self):
+        FakeOllamaHandler.disconnected.clear()
+        self.ask('s2', 'kept', 'fast')
+        self.ask('s1', 'done', 'fast', shell_content='$ ls')
+        self.query_queue.put({'msg_code': LLM_MODEL_CHECK, 'payload': {'session_id': 's1'}})
+        self.ask('s1', 'long', 'hang')
+        self.collect(lambda x: x and str(x[-1]['payload'].get('content')).strip() == 'long-0')
+        self.assertEqual(self.client.get_session_state_stats()['model_list_subscribers'], 1)
+
+        self.query_queue.put({'msg_code': REMOVE_SESSION_CODE, 'payload': {'session_id': 's1'}})
+        # 正在输出的回答被取消，session的状态全部清理，其它session不受影响
+        self.assertTrue(FakeOllamaHandler.disconnected.wait(5))
+        expected_stats = {'lanes': 1, 'chat_records': 1, 'model_list_subscribers': 0, 'generations': 0}
+        deadline = time.monotonic() + 5
+        while self.client.get_session_state_stats() != expected_stats and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.client.get_session_state_stats(), expected_stats)
+
+        store = LlmChatStore(Path(self.record_dir.name) / 'chat_records.db')
+        self.assertEqual({'kept', 'done'}, {brief[2] for brief in store.list_chats(0, 10)[0]})
+        store.close()
+
+    def test_ask_cancelled_in_queue_not_recorded(self):
+        generation = LlmGeneration()
+        generation.cancel()
+        FakeOllamaHandler.requests.clear()
+        self.client.ask_chat('s1', {
+            'chat_session_id': SIDE_CHAT_ID, 'llm_ask': 'dropped', 'llm_model_name': 'fast',
+            'shell_content_text': '$ make', 'use_screen_context': True
+        }, generation)
+        self.assertEqual([], self.client.get_chat_record('s1', SIDE_CHAT_ID)['message_list'])
+
+        # 下一次提问只有一条用户消息，屏幕内容仍然来自被取消的问题
+        self.ask('s1', 'next', 'fast')
+        self.collect(lambda x: len(x) == 3)
+        messages = FakeOllamaHandler.requests[-1]['messages']
+        self.assertEqual(['system', 'user'], [message['role'] for message in messages])
+        self.assertIn('$ make', messages[-1]['content'])
+        self.assertNotIn('dropped', messages[-1]['content'])
+
+    def test_follow_up_cancels_previous_answer(self):
+        self.ask('s1', 'long', 'hang')
+        self.collect(lambda x: len(x) == 1)
+        self.ask('s1', 'next', 'fast')
+
+        msgs = self.collect(lambda x: len(x) == 4)
+        # 上一个回答先以is_done结束，随后是新问题的回答
+        self.assertEqual([True, False, False, True], [msg['payload']['is_done'] for msg in msgs])
+        self.assertEqual(['', 'next-0', 'next-1', 'next-2'], [msg['payload']['content'].strip() for msg in msgs])
+
+    def test_keep_alive_stats_and_retry(self):
+        def wait_for_request_count(count: int):
+            # 统计在连接放回连接池之后记录
+            deadline = time.monotonic() + 5
+            while self.client.get_http_stats().get('fast', {}).get('request_count') != count and \
+                    time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.ask('s1', 'a', 'fast')
+        self.collect(lambda x: len(x) == 3)
+        wait_for_request_count(1)
+        self.ask('s2', 'b', 'fast')
+        self.collect(lambda x: len(x) == 3)
+        wait_for_request_count(2)
+        stats = self.client.get_http_stats()['fast']
+        # 第二个请求复用了第一个请求的连接
+        self.assertEqual(1, stats['new_connection_count'])
+        self.assertEqual(6, stats['token_count'])
+        self.assertGreater(stats['tokens_per_sec'], 0)
+
+        FakeOllamaHandler.ps_failures_left = 2
+        self.query_queue.put({'msg_code': LLM_MODEL_CHECK, 'payload': {'session_id': 's3'}})
+        msg = self.collect(lambda x: len(x) == 1)[0]
+        self.assertEqual(['fast', 'slow'], [model['name'] for model in msg['payload']['content']['models']])
+
+    def test_follow_up_keeps_stable_prefix(self):
+        FakeOllamaHandler.requests.clear()
+        screen = '\n'.join(f'$ make target_{idx}' for idx in range(20))
+        self.ask('s1', 'a', 'fast', shell_content=screen)
+        self.collect(lambda x: len(x) == 3)
+        self.ask('s1', 'b', 'fast', shell_content=screen + '\nerror: build failed')
+        self.collect(lambda x: len(x) == 3)
+
+        first, second = [request['messages'] for request in FakeOllamaHandler.requests]
+        # 系统提示词和第一轮对话原样发送，变化的屏幕内容只出现在最后一条消息中
+        self.assertEqual('system', first[0]['role'])
+        self.assertEqual(first, second[:2])
+        self.assertEqual({'role': 'assistant', 'content': 'a-0a-1a-2\n\n'}, second[2])
+        self.assertIn('error: build failed', second[3]['content'])
+        self.assertNotIn('make target_0', second[3]['content'])
+        self.assertEqual(LlmClient.KEEP_ALIVE, FakeOllamaHandler.requests[-1]['keep_alive'])
+
+    def test_repeated_question_answered_from_cache(self):
+        FakeOllamaHandler.requests.clear()
+        self.ask('s1', 'why', 'fast')
+        first = self.collect(lambda x: len(x) == 3)
+        deadline = time.monotonic() + 5
+        while self.client.get_answer_cache_stats()['disk_entry_count'] != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # 另一个session的相同问题直接由缓存回答
+        self.ask('s2', 'why', 'fast')
+        cached = self.collect(lambda x: x and x[-1]['payload']['is_done'])
+        self.assertEqual(1, len(FakeOllamaHandler.requests))
+        self.assertEqual(
+            ''.join(msg['payload']['content'] for msg in first), ''.join(msg['payload']['content'] for msg in cached)
+        )
+
+        self.ask('s3', 'why', 'fast', use_answer_cache=False)
+        self.collect(lambda x: len(x) == 3)
+        self.assertEqual(2, len(FakeOllamaHandler.requests))
+        # 重新生成的回答写入缓存后再结束测试
+        while self.client.get_http_stats()['fast']['request_count'] != 2 and time.monotonic() < deadline + 5:
+            time.sleep(0.01)
+
+    def test_turns_stored_as_they_finish(self):
+        self.ask('s1', 'stored', 'fast')
+        self.collect(lambda x: len(x) == 3)
+
+        # 不需要等到退出，回答结束后即可从数据库中读到
+        store = LlmChatStore(Path(self.record_dir.name) / 'chat_records.db')
+        deadline = time.monotonic() + 5
+        while not store.list_chats(0, 10)[0] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        (record_id, _, first_message), = store.list_chats(0, 10)[0]
+        self.assertEqual('stored', first_message)
+        self.assertEqual(2, len(store.load_chat(record_id)['message_list']))
+        store.close()
+
+        # 当前打开的对话不在历史列表中
+        self.query_queue.put({'msg_code': LLM_CHAT_HISTORY_REQ_CODE, 'payload': {'session_id': 's1'}})
+        self.query_queue.put({'msg_code': LLM_NEW_CHAT_CODE, 'payload': {'session_id': 's1'}})
+        # 新对话在s1的队列中处理，历史列表请求直接回答，没有结果时不回复
+        for _ in range(20):
+            self.query_queue.put({'msg_code': LLM_CHAT_HISTORY_REQ_CODE, 'payload': {'session_id': 's2'}})
+            try:
+                msg = self.collect(lambda x: len(x) == 1, timeout=0.2)[0]
+                break
+            except queue.Empty:
+                continue
+        self.assertEqual(LLM_CHAT_HISTORY_RSP_CODE, msg['msg_code'])
+        self.assertEqual('s2', msg['payload']['session_id'])
+        self.assertEqual([record_id], [brief['history_idx'] for brief in msg['payload']['content']])
+        self.assertIsNone(msg['payload']['next_offset'])
+
+        self.query_queue.put(
+            {
+                'msg_code': LLM_LOAD_CHAT_BY_HISTORY_IDX,
+                'payload': {'session_id': 's2', 'content': {'history_idx': record_id}}
+            }
+        )
+        msg = self.collect(lambda x: len(x) == 1)[0]
+        self.assertEqual(LLM_RSP_CHAT_BY_CHAT_ID, msg['msg_code'])
+        self.assertEqual(['stored', None], [x.get('org_user_msg') for x in msg['payload']['content']['message_list']])
+
+    def test_model_list_cached_and_refreshed(self):
+        def check():
+            self.query_queue.put({'msg_code': LLM_MODEL_CHECK, 'payload': {'session_id': 's1'}})
+
+        def model_names(msg):
+            return [model['name'] for model in msg['payload']['content']['models']]
+
+        check()
+        self.assertEqual(['fast', 'slow'], model_names(self.collect(lambda x: len(x) == 1)[0]))
+        request_count = FakeOllamaHandler.ps_request_count
+
+        # 缓存有效时立即回复，不请求服务端
+        check()
+        self.assertEqual(['fast', 'slow'], model_names(self.collect(lambda x: len(x) == 1)[0]))
+        self.assertEqual(request_count, FakeOllamaHandler.ps_request_count)
+
+        # 过期后先回复旧列表，后台刷新发现变化后再推送新列表
+        FakeOllamaHandler.ps_models = ['fast', 'slow', 'new']
+        with mock.patch.object(LlmClient, 'MODEL_LIST_TTL_SECS', 0):
+            time.sleep(0.01)
+            check()
+            msgs = self.collect(lambda x: len(x) == 2)
+        self.assertEqual([['fast', 'slow'], ['fast', 'slow', 'new']], [model_names(msg) for msg in msgs])
+
+        # 更换服务器后丢弃缓存并推送新服务器的模型列表
+        FakeOllamaHandler.ps_models = ['other']
+        self.query_queue.put(
+            {
+                'msg_code': LLM_SERVER_URL_UPDATE_CODE,
+                'payload': {'llm_server': '127.0.0.1', 'llm_port': self.server.server_port}
+            }
+        )
+        self.assertEqual(['other'], model_names(self.collect(lambda x: len(x) == 1)[0]))
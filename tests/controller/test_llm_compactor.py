@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from src.controller.llm_compactor import compact_shell_text, strip_control_residue, truncate_line, MAX_LINE_CHARS
+from src.controller.llm_context import estimate_tokens
+
+
+class TestLlmCompactor(TestCase):
+    def test_strip_control_residue(self):
+        self.assertEqual(strip_control_residue('\x1b[01;32mok\x1b[0m done  '), 'ok done')
+        self.assertEqual(strip_control_residue(' 10%\r 50%\r100%'), '100%')
+        self.assertEqual(strip_control_residue('abx\bc\x07'), 'abc')
+
+    def test_truncate_line(self):
+        line = 'x' * 1000
+        truncated = truncate_line(line)
+        self.assertLess(len(truncated), MAX_LINE_CHARS + 30)
+        self.assertTrue(truncated.startswith('x' * 100) and truncated.endswith('x' * 100))
+
+    def test_collapse_identical_and_template_lines(self):
+        lines = ['$ ping host'] + \
+            [f'64 bytes from 10.0.0.1: icmp_seq={idx} ttl=64 time=0.{idx} ms' for idx in range(100)] + \
+            ['retrying...'] * 5 + ['', '', '', '$ ']
+        compacted = compact_shell_text('\n'.join(lines)).split('\n')
+        self.assertEqual(compacted, [
+            '$ ping host',
+            '64 bytes from 10.0.0.1: icmp_seq=0 ttl=64 time=0.0 ms',
+            '[… 相似的1行重复 ×98 …]',
+            '64 bytes from 10.0.0.1: icmp_seq=99 ttl=64 time=0.99 ms',
+            'retrying...',
+            '[以上1行重复 ×5]',
+            '',
+            '$',
+        ])
+
+    def test_collapse_repeated_blocks(self):
+        frames = ['  File "app.py", line 10, in recurse', '    return recurse(n - 1)'] * 50
+        lines = ['Traceback (most recent call last):'] + frames + ['RecursionError: maximum recursion depth exceeded']
+        compacted = compact_shell_text('\n'.join(lines)).split('\n')
+        self.assertEqual(compacted, [lines[0]] + frames[:2] + ['[以上2行重复 ×50]', lines[-1]])
+
+    def test_token_budget_keeps_newest_lines(self):
+        text = '\n'.join(f'{chr(97 + idx % 26)}{chr(97 + idx // 26)} entry' for idx in range(600))
+        compacted = compact_shell_text(text, token_budget=100)
+        self.assertLessEqual(estimate_tokens(compacted), 110)
+        self.assertTrue(compacted.startswith('[前面的'))
+        self.assertTrue(compacted.endswith('bx entry'))
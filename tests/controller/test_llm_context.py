@@ -0,0 +1,91 @@
+from unittest import TestCase
+
+from src.controller.llm_context import ShellContextManager, SHELL_CONTEXT_FULL, SHELL_CONTEXT_NEW_LINES, \
+    SHELL_CONTEXT_DIFF, SHELL_CONTEXT_OMITTED, find_scroll_overlap
+
+
+def screen(start: int, end: int) -> str:
+    return '\n'.join(f'line {idx} of the build output' for idx in range(start, end))
+
+
+class TestShellContextManager(TestCase):
+    def ask(self, manager: ShellContextManager, message_list: list, screen_text: str, chat_id: str = 'chat',
+            use_screen_context: bool = True):
+        shell_context = manager.next_shell_context('s1', chat_id, screen_text, message_list, use_screen_context)
+        message_list.append({
+            'role': 'user',
+            'content': 'question' + ShellContextManager.format_shell_context(shell_context),
+            'shell_context': shell_context
+        })
+        message_list.append({'role': 'assistant', 'content': 'answer'})
+        return shell_context
+
+    def test_find_scroll_overlap(self):
+        self.assertEqual(find_scroll_overlap(['a', 'b', 'c'], ['b', 'c', 'd']), 2)
+        self.assertEqual(find_scroll_overlap(['a', 'b', 'a'], ['a', 'b', 'a', 'x']), 3)
+        self.assertEqual(find_scroll_overlap(['a', 'b'], ['x', 'y']), 0)
+
+    def test_later_turns_send_only_changes(self):
+        manager = ShellContextManager()
+        message_list = []
+
+        self.assertEqual(self.ask(manager, message_list, screen(0, 40))['kind'], SHELL_CONTEXT_FULL)
+
+        shell_context = self.ask(manager, message_list, screen(5, 45))
+        self.assertEqual(shell_context, {'kind': SHELL_CONTEXT_NEW_LINES, 'text': screen(40, 45)})
+
+        # 界面在屏幕没有变化时不发送内容
+        self.assertIsNone(self.ask(manager, message_list, ''))
+
+        lines = screen(5, 45).splitlines()
+        lines[20] = 'error: something went wrong'
+        shell_context = self.ask(manager, message_list, '\n'.join(lines))
+        self.assertEqual(shell_context['kind'], SHELL_CONTEXT_DIFF)
+        self.assertIn('+error: something went wrong', shell_context['text'])
+
+        # 完全不同的屏幕内容直接发送完整内容
+        self.assertEqual(self.ask(manager, message_list, 'top - 12:00:00')['kind'], SHELL_CONTEXT_FULL)
+
+    def test_new_chat_gets_latest_screen(self):
+        manager = ShellContextManager()
+        self.ask(manager, [], screen(0, 10))
+        manager.reset('s1', 'chat')
+        self.assertEqual(self.ask(manager, [], ''), {'kind': SHELL_CONTEXT_FULL, 'text': screen(0, 10)})
+
+    def test_disabled_screen_context_sends_nothing(self):
+        manager = ShellContextManager()
+        self.ask(manager, [], screen(0, 10))
+        manager.reset('s1', 'chat')
+        self.assertIsNone(self.ask(manager, [], '', use_screen_context=False))
+        self.assertIsNone(self.ask(manager, [], screen(0, 10), use_screen_context=False))
+
+    def test_latest_screen_kept_per_chat(self):
+        manager = ShellContextManager()
+        self.ask(manager, [], screen(0, 10), chat_id='side')
+        self.ask(manager, [], screen(20, 30), chat_id='inline')
+        manager.reset('s1')
+        self.assertEqual(self.ask(manager, [], '', chat_id='side'), {'kind': SHELL_CONTEXT_FULL, 'text': screen(0, 10)})
+        self.assertEqual(self.ask(manager, [], '', chat_id='inline'), {'kind': SHELL_CONTEXT_FULL, 'text': screen(20, 30)})
+
+    def test_trim_over_budget(self):
+        manager = ShellContextManager(token_budget=600)
+        message_list = []
+        for idx in range(4):
+            self.ask(manager, message_list, screen(idx * 30, idx * 30 + 30))
+
+        omitted = [message for message in message_list if SHELL_CONTEXT_OMITTED in message['content']]
+        self.assertTrue(omitted)
+        # 最新的完整屏幕内容始终保留
+        self.assertEqual(message_list[-2]['shell_context']['kind'], SHELL_CONTEXT_FULL)
+        self.assertLessEqual(sum(len(message['content']) for message in message_list) // 4, 600)
+
+    def test_trim_breaking_diff_chain_resends_full_screen(self):
+        manager = ShellContextManager(token_budget=250)
+        message_list = []
+        self.ask(manager, message_list, screen(0, 30))
+        shell_context = self.ask(manager, message_list, screen(2, 32))
+        self.assertEqual(shell_context['kind'], SHELL_CONTEXT_NEW_LINES)
+
+        shell_context = self.ask(manager, message_list, screen(4, 34))
+        self.assertEqual(shell_context, {'kind': SHELL_CONTEXT_FULL, 'text': screen(4, 34)})
+        self.assertTrue(all(message.get('shell_context') is None for message in message_list[:-2]))
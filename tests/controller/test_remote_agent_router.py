@@ -0,0 +1,48 @@
+import queue
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.common.msg_code import REMOVE_AGENT_CODE
+from src.controller.main_controller import RemoteAgentRouter
+
+
+class StuckAgent:
+    """Stands in for a RemoteAgent whose current blocking call does not return."""
+
+    def __init__(self):
+        self.stop_event = threading.Event()
+
+    def join(self, timeout: float = None) -> bool:
+        return self.stop_event.wait(timeout)
+
+
+class TestRemoteAgentRouter(TestCase):
+    def test_remove_last_session_returns_agent(self):
+        router = RemoteAgentRouter()
+        agent_queue = queue.Queue()
+        agent = StuckAgent()
+        router.add_agent(('host', 22), 's1', agent_queue, agent)
+        router.map_session_id_2_agent_queue(('host', 22), 's2')
+
+        # 移除映射时不关闭agent，也不等待
+        self.assertIsNone(router.remove_session_mapping('s1'))
+        self.assertEqual(router.remove_session_mapping('s2'), (agent_queue, agent))
+        self.assertTrue(agent_queue.empty())
+        self.assertIsNone(router.get_remote_agent(('host', 22)))
+
+    def test_close_agent_waits_bounded_time(self):
+        router = RemoteAgentRouter()
+        agent_queues = [queue.Queue() for _ in range(3)]
+        for idx, agent_queue in enumerate(agent_queues):
+            router.add_agent(('host', idx), f's{idx}', agent_queue, StuckAgent())
+
+        with patch.object(RemoteAgentRouter, 'AGENT_JOIN_TIMEOUT_SECS', 0.1):
+            begin = time.monotonic()
+            router.close_all_agent()
+            self.assertLess(time.monotonic() - begin, 1.0)
+
+        for agent_queue in agent_queues:
+            self.assertEqual(agent_queue.get_nowait()['msg_code'], REMOVE_AGENT_CODE)
+        self.assertEqual(router.get_agent_list(), [])
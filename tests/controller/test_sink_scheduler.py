@@ -0,0 +1,94 @@
+import queue
+import time
+from unittest import TestCase
+
+from src.common.msg_code import SESSION_STRING_CODE, LLM_ANSWER_CODE, LOGIN_RSP_CODE
+from src.controller.sink_scheduler import SinkScheduler
+
+
+def session_string_msg(*session_ids: str) -> dict:
+    return {
+        'msg_code': SESSION_STRING_CODE,
+        'payload': [{'session_id': session_id, 'inner_msgs': []} for session_id in session_ids]
+    }
+
+
+class TestSinkScheduler(TestCase):
+    def setUp(self):
+        self.sink_queue = queue.Queue()
+        self.handled = []
+        self.scheduler = SinkScheduler(self.sink_queue, self.handled.append, time_budget_secs=10)
+
+    def handled_session_ids(self):
+        return [msg['payload'][0]['session_id'] for msg in self.handled if msg['msg_code'] == SESSION_STRING_CODE]
+
+    def test_split_and_round_robin(self):
+        for _ in range(3):
+            self.sink_queue.put(session_string_msg('noisy'))
+        self.sink_queue.put(session_string_msg('noisy', 'quiet'))
+
+        self.assertEqual(self.scheduler.run_tick(), 5)
+        # quiet 不需要等待 noisy 的全部积压处理完
+        self.assertLess(self.handled_session_ids().index('quiet'), 3)
+
+    def test_priority_lanes_first(self):
+        for _ in range(10):
+            self.sink_queue.put(session_string_msg('noisy'))
+            self.sink_queue.put(session_string_msg('typing'))
+        self.sink_queue.put({'msg_code': LLM_ANSWER_CODE, 'payload': {'content': 'token'}})
+        self.scheduler.mark_interactive('typing')
+
+        self.scheduler.run_tick()
+        self.assertEqual(self.handled[0]['msg_code'], LLM_ANSWER_CODE)
+        self.assertEqual(self.handled_session_ids()[:10], ['typing'] * 10)
+
+    def test_share_processing_time(self):
+        # bulk的每条消息耗时远超一轮的时间额度，small的大量小消息不必排在它后面
+        def handle(msg: dict):
+            self.handled.append(msg)
+            if msg['payload'][0]['session_id'] == 'bulk':
+                time.sleep(SinkScheduler.QUANTUM_SECS * 3)
+
+        scheduler = SinkScheduler(self.sink_queue, handle, time_budget_secs=10)
+        for _ in range(3):
+            self.sink_queue.put(session_string_msg('bulk'))
+        for _ in range(20):
+            self.sink_queue.put(session_string_msg('small'))
+
+        scheduler.run_tick()
+        session_ids = self.handled_session_ids()
+        self.assertEqual(len(session_ids), 23)
+        last_small_index = len(session_ids) - 1 - session_ids[::-1].index('small')
+        self.assertLessEqual(session_ids[:last_small_index].count('bulk'), 1)
+
+    def test_session_order_and_budget(self):
+        scheduler = SinkScheduler(self.sink_queue, self.handled.append, time_budget_secs=0)
+        self.sink_queue.put({'msg_code': LOGIN_RSP_CODE, 'payload': {'session_id': 's1', 'content': {}}})
+        self.sink_queue.put(session_string_msg('s1'))
+
+        self.assertEqual(scheduler.run_tick(), 1)
+        self.assertEqual(self.handled[0]['msg_code'], LOGIN_RSP_CODE)
+        self.assertEqual(scheduler.stats()['s1']['queue_depth'], 1)
+
+        self.assertEqual(scheduler.run_tick(), 1)
+        self.assertEqual(scheduler.stats()['s1']['processed_count'], 2)
+
+        scheduler.remove_session('s1')
+        scheduler.run_tick()
+        self.assertNotIn('s1', scheduler.stats())
+
+    def test_drop_late_msgs_of_removed_session(self):
+        scheduler = SinkScheduler(self.sink_queue, self.handled.append)
+        self.sink_queue.put(session_string_msg('s1', 's2'))
+        scheduler.run_tick()
+        scheduler.remove_session('s1')
+        scheduler.run_tick()
+
+        # agent关闭前仍可能送来已移除session的输出和状态消息
+        self.sink_queue.put(session_string_msg('s1', 's2'))
+        self.sink_queue.put({'msg_code': LOGIN_RSP_CODE, 'payload': {'session_id': 's1', 'content': {}}})
+        self.handled.clear()
+        scheduler.run_tick()
+        self.assertEqual(self.handled_session_ids(), ['s2'])
+        self.assertNotIn('s1', scheduler.stats())
+        self.assertEqual(scheduler.dropped_late_count(), 2)
@@ -0,0 +1,92 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from src.controller.session_document import SessionDocument
+from src.model.recorder.session_recorder import RecordWriter, find_recordings
+from src.model.recorder.session_replayer import SessionReplayer, screen_text
+from src.model.sync_ssh.ssh.ssh_shell import XShell
+from tests.model.sync_ssh.ssh.test_ssh_shell import FakeChannel
+
+
+def screen_lines(view_area_content: list) -> list:
+    return [''.join(text for _, text in line) for line in view_area_content]
+
+
+class TestSessionRecorder(TestCase):
+    def test_record_and_seek(self):
+        output = b''.join(b'\x1b[01;32mline %d\x1b[0m \xe4\xbd\xa0\xe5\xa5\xbd\r\n' % i for i in range(300))
+        with tempfile.TemporaryDirectory() as record_dir:
+            writer = RecordWriter(Path(record_dir))
+            writer.start()
+            writer.open_session('host/1', 10)
+
+            channel = FakeChannel(b'')
+            shell = XShell(channel, 10)
+            shell.session_id = 'host/1'
+            shell.set_record_writer(writer)
+            document = SessionDocument(10)
+
+            # 按奇数大小切块，关键帧可能落在控制序列或多字节字符中间
+            for idx, begin in enumerate(range(0, len(output), 997)):
+                channel.data = output[begin:begin + 997]
+                document.handle_msgs(shell.drain_and_parser_bytes())
+                if idx == 5:
+                    writer.add_keyframe('host/1', shell.resume_offset(), document.keyframe_copy(20))
+            writer.stop()
+
+            recordings = find_recordings(Path(record_dir))
+            self.assertEqual(len(recordings), 1)
+            replayer = SessionReplayer(recordings[0])
+            self.assertEqual(replayer.keyframe_count, 1)
+            self.assertEqual(replayer.total_bytes, len(output))
+
+            replayed = replayer.seek(replayer.duration_secs)
+            self.assertEqual(screen_text(replayed), screen_text(document))
+            # 从关键帧开始，只解析之后的输出
+            self.assertLess(replayer.replayed_bytes, len(output))
+            self.assertEqual(replayer.gap_count, 0)
+
+    def test_keyframe_round_trip(self):
+        channel = FakeChannel(b'')
+        shell = XShell(channel, 5)
+        document = SessionDocument(5)
+        channel.data = b''.join(b'\x1b[1;31mred %d\x1b[0m plain\r\n' % i for i in range(8)) + b'\x1b[4mtail'
+        document.handle_msgs(shell.drain_and_parser_bytes())
+
+        keyframe_document = document.keyframe_copy(2)
+        state = keyframe_document.keyframe_state()
+        # 复制后原文档继续变化，不影响在其它线程中编码的关键帧
+        channel.data = b'\x1b[2J\x1b[Hchanged\r\n'
+        document.handle_msgs(shell.drain_and_parser_bytes())
+        self.assertEqual(keyframe_document.keyframe_state(), state)
+
+        restored = SessionDocument.from_keyframe_state(json.loads(json.dumps(state)))
+        self.assertEqual(restored.keyframe_state(), state)
+        def styled_lines(lines: list) -> list:
+            return [[(style.tuple_key(), text) for style, text in line] for line in lines]
+        self.assertEqual(
+            styled_lines(restored.view_area_content), styled_lines(keyframe_document.current_view_area_content([]))
+        )
+        self.assertEqual(restored.total_lines, 7)
+
+    def test_keyframe_keeps_scrolled_view(self):
+        channel = FakeChannel(b''.join(b'line %d\r\n' % i for i in range(100)))
+        shell = XShell(channel, 5)
+        document = SessionDocument(5)
+        document.handle_msgs(shell.drain_and_parser_bytes())
+        # 视图向上滚动到第80行，仍在关键帧保留的历史行范围内
+        document.update_window_bottom_line_number_by_scroll_bar(80, document.total_lines)
+        self.assertFalse(document.stick_to_bottom)
+
+        keyframe_document = document.keyframe_copy(30)
+        restored = SessionDocument.from_keyframe_state(json.loads(json.dumps(keyframe_document.keyframe_state())))
+        expected = screen_lines(document.current_view_area_content([]))
+        self.assertEqual(expected, ['line 75', 'line 76', 'line 77', 'line 78', 'line 79'])
+        self.assertEqual(screen_lines(restored.view_area_content), expected)
+
+        # 滚动位置在省略的历史行中时显示保留的最早几行
+        document.update_window_bottom_line_number_by_scroll_bar(10, document.total_lines)
+        restored = document.keyframe_copy(30)
+        self.assertEqual(screen_lines(restored.current_view_area_content([]))[0], 'line 66')
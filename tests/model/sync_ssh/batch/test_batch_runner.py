@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from src.common.common_definition import BATCH_STATUS_DONE, BATCH_STATUS_FAILED, BATCH_STATUS_TIMEOUT, \
+    BATCH_STATUS_RUNNING, BATCH_STATUS_PENDING
+from src.model.sync_ssh.batch.batch_runner import BatchCommandRunner, run_batch
+from src.model.sync_ssh.ssh.ssh_client import XClient
+from tests.model.sync_ssh.ssh_stand_in_server import StandInServer, FLOOD_LINE
+
+
+class TestBatchCommandRunner(TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_exit_code_and_output(self):
+        unreachable = dict(self.server.connect_params, port=1)
+        rows = run_batch('fail 3 disk full', [self.server.connect_params, unreachable], max_concurrency=2)
+
+        self.assertEqual(BATCH_STATUS_DONE, rows[0]['status'])
+        self.assertEqual(3, rows[0]['exit_code'])
+        self.assertEqual('disk full\n', rows[0]['stderr'])
+        self.assertEqual('', rows[0]['stdout'])
+        self.assertEqual(BATCH_STATUS_FAILED, rows[1]['status'])
+        self.assertTrue(rows[1]['error'])
+
+    def test_output_is_truncated_and_streamed(self):
+        streamed = []
+        rows = run_batch(
+            'flood 500', [self.server.connect_params], on_result=streamed.append, max_output_bytes=1000
+        )
+        self.assertEqual(0, rows[0]['exit_code'])
+        self.assertEqual(1000, len(rows[0]['stdout']))
+        self.assertEqual(500 * len(FLOOD_LINE), rows[0]['stdout_bytes'])
+        self.assertEqual([BATCH_STATUS_PENDING, BATCH_STATUS_RUNNING], [row['status'] for row in streamed[:2]])
+        self.assertEqual(BATCH_STATUS_DONE, streamed[-1]['status'])
+
+    def test_reuses_pooled_client_and_times_out(self):
+        client = XClient()
+        client.connect(**self.server.connect_params)
+        try:
+            runner = BatchCommandRunner(
+                'sleep 5', [self.server.connect_params] * 3, client_provider=lambda params: client,
+                timeout_secs=0.3
+            )
+            runner.start()
+            runner.join(5)
+            rows = runner.get_results()
+            self.assertEqual([BATCH_STATUS_TIMEOUT] * 3, [row['status'] for row in rows])
+            # 共用的连接不能被关闭
+            self.assertTrue(client.is_active())
+            self.assertEqual('ok\n', run_batch('echo ok', [{}], client_provider=lambda params: client)[0]['stdout'])
+        finally:
+            client.close()
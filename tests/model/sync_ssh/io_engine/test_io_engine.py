@@ -0,0 +1,94 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from src.model.sync_ssh.io_engine.io_engine import SerialLane, IoEngine
+
+
+class TestSerialLane(TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def test_keeps_submit_order(self):
+        lane = SerialLane(self.executor)
+        done = threading.Event()
+        results = []
+        for i in range(200):
+            lane.submit(results.append, i)
+        lane.submit(done.set)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(list(range(200)), results)
+
+    def test_lanes_run_concurrently(self):
+        # 一个lane阻塞时，其它lane不受影响
+        blocked_lane = SerialLane(self.executor)
+        other_lane = SerialLane(self.executor)
+        release = threading.Event()
+        other_done = threading.Event()
+        blocked_lane.submit(release.wait, 5)
+        other_lane.submit(other_done.set)
+        self.assertTrue(other_done.wait(1))
+        release.set()
+
+    def test_error_does_not_stop_lane(self):
+        lane = SerialLane(self.executor)
+        done = threading.Event()
+        lane.submit(lambda: 1 / 0)
+        lane.submit(done.set)
+        self.assertTrue(done.wait(5))
+
+
+class TestIoEngineReaders(TestCase):
+    def setUp(self):
+        self.io_engine = IoEngine()
+        self.io_engine.start()
+        self.socket_pairs = []
+
+    def tearDown(self):
+        self.io_engine.stop()
+        for reader, writer in self.socket_pairs:
+            reader.close()
+            writer.close()
+
+    def new_socket_pair(self):
+        reader, writer = socket.socketpair()
+        self.socket_pairs.append((reader, writer))
+        return reader, writer
+
+    def test_quiet_reader_not_behind_busy_readers(self):
+        calls = []
+        lock = threading.Lock()
+        quiet_done = threading.Event()
+
+        def on_busy(reader):
+            # 从不读空，一直可读；每次回调都超过一轮的时间预算
+            time.sleep(0.01)
+            with lock:
+                calls.append('busy')
+
+        def on_quiet(reader):
+            reader.recv(1024)
+            with lock:
+                calls.append('quiet')
+            quiet_done.set()
+
+        for _ in range(8):
+            busy_reader, busy_writer = self.new_socket_pair()
+            busy_writer.send(b'x')
+            self.io_engine.call_soon(self.io_engine.add_reader, busy_reader, on_busy)
+        quiet_reader, quiet_writer = self.new_socket_pair()
+        self.io_engine.call_soon(self.io_engine.add_reader, quiet_reader, on_quiet)
+        time.sleep(0.2)
+
+        with lock:
+            busy_count_before = len(calls)
+        quiet_writer.send(b'x')
+        self.assertTrue(quiet_done.wait(5))
+        with lock:
+            # 每轮超出预算后其余busy回调留到下一轮，quiet最多等待正在执行的一轮
+            self.assertLessEqual(calls.index('quiet') - busy_count_before, 3)
@@ -0,0 +1,91 @@
+import os
+import time
+from unittest import TestCase, skipIf
+
+from src.common.msg_code import InnerMsgCode
+from src.model.sync_ssh.local_pty import local_client
+from src.model.sync_ssh.local_pty.local_client import LocalClient, PtyChannel
+
+
+@skipIf(local_client.fcntl is None, 'pty is not available')
+class TestLocalClient(TestCase):
+    def read_until_closed(self, shell, timeout: float = 5) -> str:
+        text = ''
+        deadline = time.monotonic() + timeout
+        while not shell.is_closed() and time.monotonic() < deadline:
+            if not shell.recv_ready():
+                time.sleep(0.01)
+                continue
+            for inner_msg in shell.drain_and_parser_bytes():
+                if inner_msg['inner_msg_code'] == InnerMsgCode.INSERT_PLAIN_STRING_CODE:
+                    text += inner_msg['inner_payload']
+        return text
+
+    def test_shell_on_pty(self):
+        client = LocalClient()
+        client.connect(command=['/bin/sh'])
+        shell = client.get_shell(24)
+        self.assertIsNotNone(shell)
+        self.assertGreaterEqual(shell.fileno(), 0)
+
+        # stty size 证明子进程运行在设置了窗口大小的终端上
+        shell.send('stty size; exit\r')
+        text = self.read_until_closed(shell)
+        self.assertIn('24 210', text)
+        self.assertTrue(shell.is_closed())
+        self.assertFalse(shell.recv_ready())
+
+        shell.close()
+        client.close()
+
+    def read_channel_until(self, channel: PtyChannel, text: str, timeout: float = 5) -> str:
+        received = ''
+        deadline = time.monotonic() + timeout
+        while text not in received and not channel.closed and time.monotonic() < deadline:
+            if channel.recv_ready():
+                received += channel.recv(4096).decode(errors='replace')
+            else:
+                time.sleep(0.01)
+        return received
+
+    def test_ctrl_c_reaches_foreground_job(self):
+        channel = PtyChannel(['/bin/sh'], 80, 24)
+        channel.send(b'sleep 30\r')
+        time.sleep(0.3)
+        # 只有pty是shell的控制终端时，Ctrl-C才会中断前台的sleep
+        channel.send(b'\x03')
+        channel.send(b'echo interrupted-$((6*7))\r')
+        self.assertIn('interrupted-42', self.read_channel_until(channel, 'interrupted-42'))
+        channel.close()
+
+    def test_close_reaps_child(self):
+        channel = PtyChannel(['/bin/sh'], 80, 24)
+        channel.close()
+        self.assertIsNotNone(channel.wait_closed())
+        with self.assertRaises(ChildProcessError):
+            os.waitpid(channel.pid, os.WNOHANG)
+
+        channel = PtyChannel(['/bin/sh'], 80, 24)
+        channel.send(b'exit 3\r')
+        self.read_channel_until(channel, 'never printed')
+        self.assertTrue(channel.closed)
+        channel.close()
+        self.assertEqual(channel.wait_closed(), 3)
+
+    def test_close_does_not_wait_for_child(self):
+        channel = PtyChannel(['/bin/sh', '-c', 'trap "" HUP; echo ready; sleep 30'], 80, 24)
+        self.assertIn('ready', self.read_channel_until(channel, 'ready'))
+
+        # close()在IoEngine线程调用，忽略SIGHUP的子进程不能让它阻塞
+        begin = time.monotonic()
+        channel.close()
+        self.assertLess(time.monotonic() - begin, PtyChannel.CLOSE_WAIT_SECS / 2)
+        self.assertIsNone(channel.exit_code)
+
+        self.assertEqual(channel.wait_closed(), -9)
+        with self.assertRaises(ChildProcessError):
+            os.waitpid(channel.pid, os.WNOHANG)
+
+    def test_missing_shell(self):
+        with self.assertRaises(FileNotFoundError):
+            LocalClient().connect(command=['/no/such/shell'])
@@ -0,0 +1,94 @@
+import queue
+import time
+from unittest import TestCase
+
+from src.common.common_definition import RESPONSE_LOGIN_SUCCESS
+from src.common.msg_code import LOGIN_CODE, LOGIN_RSP_CODE, SESSION_STRING_CODE, USER_COMMAND_CODE, \
+    REMOVE_AGENT_CODE, SESSION_INACTIVE_CODE, RECONNECT_STATUS_CODE, InnerMsgCode
+from src.model.sync_ssh.io_engine.io_engine import IoEngine
+from src.model.sync_ssh.remote_agent.remote_agent import RemoteAgent
+from tests.model.sync_ssh.ssh_stand_in_server import StandInServer, PROFILE_DONE
+
+
+class TestRemoteAgent(TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.server.start()
+        self.io_engine = IoEngine()
+        self.io_engine.start()
+        self.sink_queue = queue.Queue()
+
+        client, result = RemoteAgent.get_client(self.server.connect_params)
+        self.assertIsNotNone(client, result)
+        self.agent = RemoteAgent(client, self.sink_queue, self.io_engine)
+        self.agent.start()
+
+    def tearDown(self):
+        self.agent.get_recv_queue().put({'msg_code': REMOVE_AGENT_CODE, 'payload': {}})
+        self.agent.join(5)
+        self.io_engine.stop()
+        self.server.stop()
+
+    def wait_for_text(self, session_id: str, text: str, timeout: float = 10) -> str:
+        received = ''
+        deadline = time.monotonic() + timeout
+        while text not in received:
+            msg = self.sink_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            if msg.get('msg_code') != SESSION_STRING_CODE:
+                continue
+            for session_msg in msg.get('payload'):
+                if session_msg.get('session_id') != session_id:
+                    continue
+                for inner_msg in session_msg.get('inner_msgs'):
+                    if inner_msg.get('inner_msg_code') == InnerMsgCode.INSERT_PLAIN_STRING_CODE:
+                        received += inner_msg.get('inner_payload')
+        return received
+
+    def login(self, session_ids: list):
+        for session_id in session_ids:
+            self.agent.get_recv_queue().put(
+                {'msg_code': LOGIN_CODE, 'payload': {'session_id': session_id, 'content': {'page_line_count': 24}}}
+            )
+        login_results = {}
+        while len(login_results) < len(session_ids):
+            msg = self.sink_queue.get(timeout=10)
+            if msg.get('msg_code') == LOGIN_RSP_CODE:
+                login_results[msg['payload']['session_id']] = msg['payload']['content']['result']
+        self.assertEqual(set(login_results.values()), {RESPONSE_LOGIN_SUCCESS})
+
+    def collect_msg_codes(self, secs: float) -> list:
+        msg_codes = []
+        deadline = time.monotonic() + secs
+        while (remaining_secs := deadline - time.monotonic()) > 0:
+            try:
+                msg_codes.append(self.sink_queue.get(timeout=remaining_secs).get('msg_code'))
+            except queue.Empty:
+                break
+        return msg_codes
+
+    def test_sessions_play_output_profiles(self):
+        self.login(['s0', 's1'])
+
+        self.agent.get_recv_queue().put(
+            {'msg_code': USER_COMMAND_CODE, 'payload': {'session_id': 's0', 'content': {'command': 'profile steady 0.2\r'}}}
+        )
+        received = self.wait_for_text('s0', PROFILE_DONE)
+        self.assertIn('ts=', received)
+        self.assertIn('INFO', received)
+
+    def test_exit_does_not_reconnect(self):
+        self.login(['s0'])
+        self.agent.get_recv_queue().put(
+            {'msg_code': USER_COMMAND_CODE, 'payload': {'session_id': 's0', 'content': {'command': 'exit\r'}}}
+        )
+        msg_codes = self.collect_msg_codes(RemoteAgent.TRANSPORT_CHECK_DELAY_SECS + 1)
+        self.assertIn(SESSION_INACTIVE_CODE, msg_codes)
+        self.assertNotIn(RECONNECT_STATUS_CODE, msg_codes)
+        self.assertFalse(self.agent.is_active())
+
+    def test_lost_connection_reconnects(self):
+        self.login(['s0'])
+        self.server.stop()
+        msg_codes = self.collect_msg_codes(RemoteAgent.TRANSPORT_CHECK_DELAY_SECS + 1)
+        self.assertIn(SESSION_INACTIVE_CODE, msg_codes)
+        self.assertIn(RECONNECT_STATUS_CODE, msg_codes)
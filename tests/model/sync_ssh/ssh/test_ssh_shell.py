@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+from src.model.sync_ssh.ssh.ssh_shell import XShell
+
+
+class FakeChannel:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.closed = False
+
+    def recv_ready(self) -> bool:
+        return bool(self.data)
+
+    def recv(self, nbytes: int) -> bytes:
+        out, self.data = self.data[:nbytes], self.data[nbytes:]
+        return out
+
+
+class TestXShell(TestCase):
+    def test_drain_with_budget(self):
+        channel = FakeChannel(b'a' * 20000)
+        shell = XShell(channel, 40)
+
+        inner_msgs = shell.drain_and_parser_bytes(byte_budget=16384)
+        self.assertEqual(sum(len(msg['inner_payload']) for msg in inner_msgs), 16384)
+        self.assertEqual(len(channel.data), 20000 - 16384)
+
+        stats = shell.read_stats()
+        self.assertEqual(stats['wakeup_count'], 1)
+        self.assertEqual(stats['recv_call_count'], 4)
+        # 一次唤醒需要多次recv，下次请求放大
+        self.assertEqual(stats['request_size'], XShell.MIN_REQUEST_SIZE * 2)
+
+        shell.drain_and_parser_bytes(byte_budget=16384)
+        self.assertEqual(channel.data, b'')
+        self.assertEqual(shell.read_stats()['recv_bytes'], 20000)
+
+        channel.data = b'ls'
+        shell.drain_and_parser_bytes(byte_budget=16384)
+        self.assertEqual(shell.read_stats()['request_size'], XShell.MIN_REQUEST_SIZE)
+
+
+class FakeSendChannel(FakeChannel):
+    def __init__(self, window: int):
+        super().__init__(b'')
+        self.window = window
+        self.sent = b''
+
+    def send_ready(self) -> bool:
+        return self.window > 0
+
+    def send(self, data: bytes) -> int:
+        count = min(len(data), self.window)
+        self.window -= count
+        self.sent += data[:count]
+        return count
+
+
+class TestXShellSend(TestCase):
+    def test_paste_is_sent_within_window(self):
+        channel = FakeSendChannel(window=50000)
+        shell = XShell(channel, 40)
+
+        self.assertTrue(shell.send('a' * 100000, is_paste=True))
+        self.assertEqual(len(channel.sent), 50000)
+        self.assertEqual(shell.pending_send_bytes, 50000)
+
+        # 粘贴未发完时的按键排在粘贴内容之后
+        shell.send('\r')
+        channel.window = 1000000
+        self.assertFalse(shell.pump_send())
+        self.assertEqual(channel.sent, b'a' * 100000 + b'\r')
+        self.assertEqual(shell.pending_send_bytes, 0)
+
+    def test_bracketed_paste_and_ctrl_c(self):
+        channel = FakeSendChannel(window=10)
+        shell = XShell(channel, 40)
+        channel.data = b'\x1b[?2004h$ '
+        shell.drain_and_parser_bytes()
+        self.assertTrue(shell.bracketed_paste_on)
+
+        shell.send('b' * 100 + '\x1b[201~rm -rf /', is_paste=True)
+        self.assertEqual(channel.sent, b'\x1b[200~bbbb')
+
+        # Ctrl-C丢弃未发送的粘贴内容，并补上结束标记
+        shell.send('\x03')
+        channel.window = 1000
+        shell.pump_send()
+        self.assertEqual(channel.sent, b'\x1b[200~bbbb\x1b[201~\x03')
+
+        channel.data = b'\x1b[?2004l'
+        shell.drain_and_parser_bytes()
+        self.assertFalse(shell.bracketed_paste_on)
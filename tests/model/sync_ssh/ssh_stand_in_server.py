@@ -0,0 +1,271 @@
+# Copyright 2025 Xu Yan (EulbThgink), https://github.com/EulbThgink/Icenberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Local ssh server for tests and benchmarks. Accepts any password and opens a toy shell:
+#   - typed characters are echoed back
+#   - 'flood <n>' prints n lines of 100 characters followed by 'flood-done'
+#   - 'profile <steady|bursty|redraw> <secs>' plays a scripted output profile for secs seconds,
+#     then prints 'profile-done <bytes sent>'. Output carries 'ts=<time.time()>' stamps so the
+#     receiver can measure end-to-end latency.
+#   - 'exit' closes the channel
+#   - any other line is answered with a new prompt
+# Exec requests run one toy command and report its exit status:
+#   - 'echo <text>' prints text, 'sleep <secs>' waits, 'flood <n>' prints n lines
+#   - 'fail <code> <text>' prints text to stderr and exits with code
+#   - anything else exits with 127
+
+import multiprocessing
+import socket
+import threading
+import time
+
+import paramiko
+
+PROMPT = b'$ '
+FLOOD_DONE = 'flood-done'
+FLOOD_LINE = b'\x1b[01;34m' + b'x' * 90 + b'\x1b[0m' + b'.' * 10 + b'\r\n'
+
+PROFILE_DONE = 'profile-done'
+PROFILES = ('steady', 'bursty', 'redraw')
+STEADY_LINES_PER_SEC = 200
+BURST_LINES = 2000
+BURST_IDLE_SECS = 0.5
+REDRAW_FPS = 30
+REDRAW_ROWS = 24
+EXEC_START_DELAY_SECS = 0.01
+
+
+def time_stamp() -> bytes:
+    return b'ts=%.6f' % time.time()
+
+
+def play_steady(channel: paramiko.Channel, end_time: float) -> int:
+    # 日志流：固定速率逐行输出
+    sent = 0
+    seq = 0
+    next_time = time.monotonic()
+    while time.monotonic() < end_time:
+        line = b'2025-10-19 12:00:00,%03d INFO  [worker-%d] GET /api/v1/items/%d 200 ' % (seq % 1000, seq % 8, seq) + \
+            time_stamp() + b'\r\n'
+        channel.sendall(line)
+        sent += len(line)
+        seq += 1
+        next_time += 1 / STEADY_LINES_PER_SEC
+        time.sleep(max(0.0, next_time - time.monotonic()))
+    return sent
+
+
+def play_bursty(channel: paramiko.Channel, end_time: float) -> int:
+    # 编译输出：短时间内大量输出，然后空闲
+    sent = 0
+    while time.monotonic() < end_time:
+        burst = b''.join(
+            b'[%3d%%] \x1b[32mBuilding CXX object src/module_%d/CMakeFiles/file_%d.cpp.o\x1b[0m\r\n' %
+            (i * 100 // BURST_LINES, i % 50, i) for i in range(BURST_LINES)
+        ) + time_stamp() + b'\r\n'
+        channel.sendall(burst)
+        sent += len(burst)
+        time.sleep(BURST_IDLE_SECS)
+    return sent
+
+
+def play_redraw(channel: paramiko.Channel, end_time: float) -> int:
+    # top一类的全屏刷新：备用屏幕上按固定帧率重绘每一行
+    sent = 0
+    channel.sendall(b'\x1b[?1049h\x1b[H\x1b[2J')
+    frame_idx = 0
+    while time.monotonic() < end_time:
+        rows = [b'\x1b[1;1H\x1b[7m top - frame %d \x1b[0m ' % frame_idx + time_stamp() + b'\x1b[K']
+        for row in range(2, REDRAW_ROWS + 1):
+            rows.append(
+                b'\x1b[%d;1H%6d user  20   0  %5.1f  %4.1f \x1b[01;34mprocess_%d\x1b[0m\x1b[K' %
+                (row, 1000 + row, (frame_idx * row) % 100 / 1.0, row / 10, row)
+            )
+        frame = b''.join(rows)
+        channel.sendall(frame)
+        sent += len(frame)
+        frame_idx += 1
+        time.sleep(1 / REDRAW_FPS)
+    channel.sendall(b'\x1b[?1049l')
+    return sent
+
+
+PROFILE_PLAYERS = {'steady': play_steady, 'bursty': play_bursty, 'redraw': play_redraw}
+
+
+class StandInServerInterface(paramiko.ServerInterface):
+    def __init__(self, server: 'StandInServer'):
+        self.__server = server
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        # 通道打开时还不知道是shell还是exec，收到请求后再启动对应的处理线程
+        threading.Thread(target=self.__server.serve_shell, args=(channel,), daemon=True).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=serve_exec, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+def serve_exec(channel: paramiko.Channel, command: str):
+    name, _, arg = command.partition(' ')
+    exit_code = 0
+    # paramiko在check回调返回后才回复exec请求，命令结束得太快时客户端会先看到通道关闭
+    time.sleep(EXEC_START_DELAY_SECS)
+    try:
+        if name == 'echo':
+            channel.sendall(arg.encode() + b'\n')
+        elif name == 'sleep':
+            time.sleep(float(arg))
+        elif name == 'flood':
+            channel.sendall(FLOOD_LINE * int(arg))
+        elif name == 'fail':
+            code, _, text = arg.partition(' ')
+            channel.sendall_stderr(text.encode() + b'\n')
+            exit_code = int(code)
+        else:
+            channel.sendall_stderr(b'%s: command not found\n' % name.encode())
+            exit_code = 127
+        channel.send_exit_status(exit_code)
+        channel.shutdown_write()
+    except (OSError, EOFError):
+        pass
+    finally:
+        channel.close()
+
+
+class StandInServer(threading.Thread):
+    # ECDSA 生成比 RSA 快得多，适合每次启动时临时生成
+    HOST_KEY = None
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__(daemon=True)
+        if StandInServer.HOST_KEY is None:
+            StandInServer.HOST_KEY = paramiko.ECDSAKey.generate()
+
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__sock.bind((host, port))
+        self.__sock.listen(128)
+        self.host, self.port = self.__sock.getsockname()
+        self.__transports = []
+
+    @property
+    def connect_params(self) -> dict:
+        return {'hostname': self.host, 'port': self.port, 'username': 'bench', 'password': 'bench'}
+
+    def run(self):
+        while True:
+            try:
+                client_sock, _ = self.__sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve_transport, args=(client_sock,), daemon=True).start()
+
+    def stop(self):
+        self.__sock.close()
+        for transport in self.__transports:
+            transport.close()
+
+    def serve_transport(self, client_sock: socket.socket):
+        transport = paramiko.Transport(client_sock)
+        transport.add_server_key(StandInServer.HOST_KEY)
+        self.__transports.append(transport)
+        try:
+            transport.start_server(server=StandInServerInterface(self))
+        except (paramiko.SSHException, EOFError):
+            return
+
+        # 通道由shell/exec请求的回调处理；transport只持有通道的弱引用，这里保留已接受的通道
+        channels = []
+        while transport.is_active():
+            if channel := transport.accept(timeout=1):
+                channels = [x for x in channels if not x.closed] + [channel]
+
+    def serve_shell(self, channel: paramiko.Channel):
+        self.handle_line(channel, '')
+        line = ''
+        try:
+            while data := channel.recv(4096):
+                text = data.decode('utf-8', errors='replace')
+                channel.sendall(data.replace(b'\r', b'\r\n'))
+                for ch in text:
+                    if ch == '\r':
+                        self.handle_line(channel, line.strip())
+                        line = ''
+                    elif ch == '\x03':
+                        line = ''
+                    else:
+                        line += ch
+        except (OSError, EOFError):
+            pass
+        finally:
+            try:
+                channel.close()
+            except (OSError, EOFError):
+                pass
+
+    def handle_line(self, channel: paramiko.Channel, line: str):
+        if line == 'exit':
+            channel.close()
+            return
+        if line.startswith('flood '):
+            count = int(line.split()[1])
+            chunk = FLOOD_LINE * 100
+            for _ in range(count // 100):
+                channel.sendall(chunk)
+            channel.sendall(FLOOD_LINE * (count % 100))
+            channel.sendall(FLOOD_DONE.encode() + b'\r\n')
+        elif line.startswith('profile '):
+            _, name, duration_secs = line.split()
+            sent = PROFILE_PLAYERS[name](channel, time.monotonic() + float(duration_secs))
+            channel.sendall(b'%s %d\r\n' % (PROFILE_DONE.encode(), sent))
+        channel.sendall(PROMPT)
+
+
+def serve_in_process(conn, port: int):
+    server = StandInServer(port=port)
+    server.start()
+    conn.send(server.connect_params)
+    server.join()
+
+
+def start_server_process(port: int = 0) -> tuple:
+    """Run the server in a child process so its threads and CPU time do not count against the benchmark."""
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve_in_process, args=(child_conn, port), daemon=True)
+    process.start()
+    return process, parent_conn.recv()
+
+
+if __name__ == '__main__':
+    server = StandInServer(port=2222)
+    server.start()
+    print(f'stand-in ssh server listening on {server.host}:{server.port}, any username/password')
+    server.join()
@@ -0,0 +1,88 @@
+import time
+from multiprocessing import Pipe
+from unittest import TestCase
+
+from src.common.msg_code import USER_COMMAND_CODE, SCROLL_WINDOW_CODE, REMOVE_SESSION_CODE
+from src.common.msg_codec import recv_msg
+from src.view.backend_sender import BackendSender
+
+
+def command_msg(session_id: str, command: str) -> dict:
+    return {'msg_code': USER_COMMAND_CODE, 'payload': {'session_id': session_id, 'content': {'command': command}}}
+
+
+def scroll_msg(session_id: str) -> dict:
+    return {'msg_code': SCROLL_WINDOW_CODE, 'payload': {'session_id': session_id, 'content': {'move': 1}}}
+
+
+def remove_msg(session_id: str) -> dict:
+    return {'msg_code': REMOVE_SESSION_CODE, 'payload': {'session_id': session_id}}
+
+
+class TestBackendSender(TestCase):
+    def test_coalesce_and_send(self):
+        fr_side, bk_side = Pipe()
+        sender = BackendSender(fr_side, max_pending_count=3)
+
+        # 线程启动前消息只在队列中累积
+        for msg in [command_msg('s1', 'l'), command_msg('s1', 's'), command_msg('s2', 'p'), command_msg('s2', 'w'),
+                    scroll_msg('s1')]:
+            self.assertTrue(sender.put(msg))
+        stats = sender.stats()
+        self.assertEqual(stats['pending_count'], 3)
+        self.assertEqual(stats['coalesced_count'], 2)
+
+        sender.start()
+        self.assertEqual(
+            [recv_msg(bk_side) for _ in range(3)],
+            [command_msg('s1', 'ls'), command_msg('s2', 'pw'), scroll_msg('s1')]
+        )
+        sender.stop()
+        self.assertEqual(sender.stats()['sent_count'], 3)
+
+        fr_side.close()
+        bk_side.close()
+
+    def test_full_queue_rejects_only_high_volume_msgs(self):
+        fr_side, bk_side = Pipe()
+        sender = BackendSender(fr_side, max_pending_count=2)
+        self.assertTrue(sender.put(command_msg('s2', 'p')))
+        self.assertTrue(sender.put(scroll_msg('s1')))
+
+        # 队列已满时put不等待：s2的按键不能合并到较早的消息中越过scroll，被拒绝；关闭等控制消息仍然入队
+        self.assertFalse(sender.put(command_msg('s2', 'w')))
+        self.assertFalse(sender.put(scroll_msg('s2')))
+        self.assertTrue(sender.put(remove_msg('s1')))
+        self.assertFalse(sender.put(command_msg('s1', 'x')))
+        stats = sender.stats()
+        self.assertEqual(stats['rejected_count'], 3)
+        self.assertEqual(stats['pending_count'], 3)
+
+        sender.start()
+        self.assertEqual(
+            [recv_msg(bk_side) for _ in range(3)],
+            [command_msg('s2', 'p'), scroll_msg('s1'), remove_msg('s1')]
+        )
+        sender.stop()
+
+        fr_side.close()
+        bk_side.close()
+
+    def test_dead_pipe_stops_sender(self):
+        fr_side, bk_side = Pipe()
+        bk_side.close()
+        sender = BackendSender(fr_side, max_pending_count=4)
+        sender.start()
+
+        # 控制器退出后管道断开，发送线程结束，之后的put立即返回False而不是等待
+        sender.put(remove_msg('s1'))
+        sender.join(5)
+        self.assertFalse(sender.is_alive())
+        begin = time.monotonic()
+        for idx in range(10):
+            self.assertFalse(sender.put(remove_msg(f's{idx}')))
+        self.assertLess(time.monotonic() - begin, 1.0)
+        self.assertEqual(sender.stats()['pending_count'], 0)
+        sender.stop()
+
+        fr_side.close()
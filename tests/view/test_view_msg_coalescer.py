@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from src.common.msg_code import SESSION_VIEW_CONTENT_CODE, LLM_ANSWER_CODE
+from src.view.view_msg_coalescer import ViewMsgCoalescer
+
+
+def view_msg(*frames: tuple) -> dict:
+    return {
+        'msg_code': SESSION_VIEW_CONTENT_CODE,
+        'payload': [{'session_id': session_id, 'seq': seq} for session_id, seq in frames]
+    }
+
+
+class TestViewMsgCoalescer(TestCase):
+    def test_latest_frame_wins(self):
+        coalescer = ViewMsgCoalescer()
+        llm_msg = {'msg_code': LLM_ANSWER_CODE, 'payload': {'content': 'a'}}
+
+        self.assertTrue(coalescer.put(view_msg(('s1', 1), ('s2', 1))))
+        self.assertFalse(coalescer.put(llm_msg))
+        self.assertFalse(coalescer.put(view_msg(('s1', 2))))
+        self.assertFalse(coalescer.put(view_msg(('s3', 1), ('s1', 3))))
+
+        self.assertEqual(
+            coalescer.take_all(),
+            [view_msg(('s1', 3), ('s2', 1)), llm_msg, view_msg(('s3', 1))]
+        )
+        self.assertEqual(coalescer.dropped_frame_count, 2)
+
+        self.assertEqual(coalescer.take_all(), [])
+        self.assertTrue(coalescer.put(view_msg(('s1', 4))))